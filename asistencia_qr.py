@@ -0,0 +1,351 @@
+import datetime
+import os
+
+from sqlalchemy import text
+
+import buffer_asistencias
+import referencias
+import resumen_alumno
+import tokens_firmados
+from cache import CacheTTL
+
+# =========================
+# CHECK-IN POR TOKEN QR
+# =========================
+# Resultados posibles de registrar_asistencia_qr()
+REGISTRADA = "registrada"
+DUPLICADA = "duplicada"
+INVALIDO = "invalido"      # no existe, inactivo o single-use ya consumido
+EXPIRADO = "expirado"
+VALIDO = "valido"          # solo consultar_token()
+NO_INSCRITO = "no_inscrito"
+
+# Solo alumnos inscritos (clase_alumnos) pueden registrarse por QR. Si la
+# materia ya se conoce (token en caché o firmado) basta la lista en memoria
+# (referencias.inscritos); si no, o si el alumno no aparece (pudo inscribirse
+# desde otro proceso), la inscripción se comprueba dentro de la misma sentencia
+# del check-in: rechazar no cuesta una ida extra a la base.
+SOLO_INSCRITOS = os.environ.get("CHECKIN_SOLO_INSCRITOS", "1").lower() in ("1", "true", "si", "sí")
+
+# Un escaneo sobre un registro "Ausente" (p. ej. el pase de lista guardado
+# antes de que el alumno llegara) lo cambia a Presente; Presente/Retardo ya
+# registrados dan DUPLICADA.
+_CONFLICTO = """ON CONFLICT (matricula, materiaid, fecha) DO UPDATE
+        SET estado = EXCLUDED.estado WHERE asistencias.estado = 'Ausente'"""
+
+# Caché de tokens activos: token -> materiaid, maestroid, expiracion, single_use.
+# Se llena al generar el QR (o en el primer escaneo) y se invalida al
+# desactivar; el TTL acota lo que puede tardar en verse una desactivación
+# hecha desde otro proceso.
+_tokens = CacheTTL("tokens_qr",
+                   max_items=int(os.environ.get("TOKENS_CACHE_MAX", "2000")),
+                   ttl=int(os.environ.get("TOKENS_CACHE_TTL", "60")))
+
+# :si = comprobar la inscripción; con FALSE la condición no cuesta nada
+def _inscrito_sql(materiaid):
+    return f"(NOT :si OR EXISTS (SELECT 1 FROM clase_alumnos ca WHERE ca.materiaid = {materiaid} AND ca.matricula = :mat))"
+
+
+# Postgres: validar token e inscripción, consumir single-use / desactivar
+# expirado e insertar la asistencia en una sola sentencia. El UPDATE toma el
+# lock de la fila del token, así que dos escaneos de un single-use no pueden
+# registrar ambos; un no inscrito no lo consume. El índice único (matricula,
+# materiaid, fecha) evita duplicados.
+_CHECKIN_PG = text(f"""
+    WITH tok AS (
+        SELECT materiaid, maestroid, single_use, expiracion,
+               (expiracion IS NOT NULL AND expiracion <= :ahora) AS expirado,
+               {_inscrito_sql("qr_tokens.materiaid")} AS inscrito
+        FROM qr_tokens
+        WHERE token = :t AND activo = TRUE
+    ),
+    consumido AS (
+        UPDATE qr_tokens SET activo = FALSE
+        WHERE token = :t AND activo = TRUE
+          AND ((single_use AND {_inscrito_sql("qr_tokens.materiaid")})
+               OR (expiracion IS NOT NULL AND expiracion <= :ahora))
+        RETURNING materiaid, maestroid,
+                  (expiracion IS NOT NULL AND expiracion <= :ahora) AS expirado
+    ),
+    valido AS (
+        SELECT materiaid, maestroid FROM tok WHERE NOT expirado AND NOT single_use AND inscrito
+        UNION ALL
+        SELECT materiaid, maestroid FROM consumido WHERE NOT expirado
+    ),
+    ins AS (
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        SELECT :mat, maestroid, materiaid, :f, 'Presente' FROM valido
+        {_CONFLICTO}
+        RETURNING asistenciaid
+    )
+    SELECT (SELECT materiaid FROM tok) AS materiaid,
+           (SELECT maestroid FROM tok) AS maestroid,
+           (SELECT expiracion FROM tok) AS expiracion,
+           (SELECT single_use FROM tok) AS single_use,
+           (SELECT bool_or(expirado) FROM tok) AS expirado,
+           (SELECT bool_or(NOT inscrito) FROM tok) AS no_inscrito,
+           (SELECT COUNT(*) FROM valido) AS valido,
+           (SELECT COUNT(*) FROM ins) AS insertado
+""")
+
+
+def _resultado(estado, materiaid=None, maestroid=None, single_use=False):
+    return {"estado": estado, "materiaid": materiaid, "maestroid": maestroid, "single_use": bool(single_use)}
+
+
+def _expirado(expiracion, ahora):
+    if isinstance(expiracion, str):
+        expiracion = datetime.datetime.fromisoformat(expiracion)
+    return expiracion is not None and expiracion <= ahora
+
+
+def cachear_token(token, materiaid, maestroid, expiracion, single_use=False):
+    info = {"materiaid": int(materiaid), "maestroid": int(maestroid),
+            "expiracion": expiracion, "single_use": bool(single_use)}
+    _tokens.set(token, info)
+    return info
+
+
+def invalidar_token(token):
+    _tokens.pop(token)
+
+
+def invalidar_tokens(materiaid=None, maestroid=None, solo_expirados=False):
+    ahora = datetime.datetime.utcnow()
+
+    def coincide(_, info):
+        if materiaid is not None and info["materiaid"] != int(materiaid):
+            return False
+        if maestroid is not None and info["maestroid"] != int(maestroid):
+            return False
+        return not solo_expirados or _expirado(info["expiracion"], ahora)
+    return _tokens.invalidar_si(coincide)
+
+
+def _en_lista(conn, materiaid, matricula):
+    # solo la lista en memoria; un "no" lo confirma la sentencia del check-in
+    return not SOLO_INSCRITOS or int(matricula) in referencias.inscritos(conn, materiaid)
+
+
+# materia ya conocida (token en caché o firmado): INSERT, con la inscripción
+# comprobada en la misma sentencia cuando la lista en memoria no alcanza
+_INSERTAR_INSCRITO_PG = text(f"""
+    WITH inscrito AS (SELECT {_inscrito_sql(":mid")} AS ok),
+    ins AS (
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        SELECT :mat, :ma, :mid, :f, 'Presente' FROM inscrito WHERE ok
+        {_CONFLICTO}
+        RETURNING asistenciaid
+    )
+    SELECT (SELECT ok FROM inscrito) AS inscrito, (SELECT COUNT(*) FROM ins) AS insertado
+""")
+
+
+def _insertar_asistencia(conn, matricula, info, fecha):
+    params = {"mat": matricula, "ma": info["maestroid"], "mid": info["materiaid"], "f": fecha,
+              "si": not _en_lista(conn, info["materiaid"], matricula)}
+    if conn.dialect.name == "postgresql":
+        fila = conn.execute(_INSERTAR_INSCRITO_PG, params).mappings().fetchone()
+        inscrito, insertado = fila["inscrito"], fila["insertado"]
+    else:
+        inscrito = not params["si"] or conn.execute(text(f"SELECT {_inscrito_sql(':mid')}"), params).scalar()
+        insertado = inscrito and conn.execute(text(f"""
+            INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+            VALUES (:mat, :ma, :mid, :f, 'Presente')
+            {_CONFLICTO}
+        """), params).rowcount
+    conn.commit()
+    if not inscrito:
+        return _resultado(NO_INSCRITO, info["materiaid"], info["maestroid"])
+    return _resultado(REGISTRADA if insertado else DUPLICADA, info["materiaid"], info["maestroid"])
+
+
+# token firmado single-use: marcarlo como consumido e insertar en una sentencia;
+# la PK de qr_revocados hace que solo un escaneo gane y un no inscrito no lo gasta
+_CHECKIN_FIRMADO_PG = text(f"""
+    WITH inscrito AS (SELECT {_inscrito_sql(":mid")} AS ok),
+    usado AS (
+        INSERT INTO qr_revocados (huella, materiaid, expira)
+        SELECT :h, :mid, :exp FROM inscrito WHERE ok
+        ON CONFLICT (huella) DO NOTHING
+        RETURNING huella
+    ),
+    ins AS (
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        SELECT :mat, :ma, :mid, :f, 'Presente' FROM usado
+        {_CONFLICTO}
+        RETURNING asistenciaid
+    )
+    SELECT (SELECT ok FROM inscrito) AS inscrito, (SELECT COUNT(*) FROM usado) AS usado,
+           (SELECT COUNT(*) FROM ins) AS insertado
+""")
+
+
+def _checkin_firmado(conn, datos, matricula, fecha):
+    if not datos["single_use"]:
+        return _insertar_asistencia(conn, matricula, datos, fecha)
+    params = {"h": datos["huella"], "mid": datos["materiaid"], "ma": datos["maestroid"], "mat": matricula, "f": fecha,
+              "exp": datetime.datetime.utcfromtimestamp(datos["expira"]),
+              "si": not _en_lista(conn, datos["materiaid"], matricula)}
+    if conn.dialect.name == "postgresql":
+        fila = conn.execute(_CHECKIN_FIRMADO_PG, params).mappings().fetchone()
+        inscrito, usado, insertado = fila["inscrito"], fila["usado"], fila["insertado"]
+    else:
+        inscrito = not params["si"] or conn.execute(text(f"SELECT {_inscrito_sql(':mid')}"), params).scalar()
+        usado = inscrito and conn.execute(text("INSERT INTO qr_revocados (huella, materiaid, expira) VALUES (:h, :mid, :exp) ON CONFLICT (huella) DO NOTHING"),
+                             params).rowcount
+        insertado = 0
+        if usado:
+            insertado = conn.execute(text(f"""
+                INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+                VALUES (:mat, :ma, :mid, :f, 'Presente')
+                {_CONFLICTO}
+            """), params).rowcount
+    conn.commit()
+    if not inscrito:
+        return _resultado(NO_INSCRITO, datos["materiaid"], datos["maestroid"])
+    if not usado:
+        return _resultado(INVALIDO)
+    return _resultado(REGISTRADA if insertado else DUPLICADA, datos["materiaid"], datos["maestroid"])
+
+
+def _consultar_firmado(token):
+    datos = tokens_firmados.verificar(token)
+    if datos is None or tokens_firmados.sesion_revocada(datos["sesion"]):
+        return None, _resultado(INVALIDO)
+    if datos["expirado"]:
+        return None, _resultado(EXPIRADO, datos["materiaid"], datos["maestroid"])
+    return datos, _resultado(VALIDO, datos["materiaid"], datos["maestroid"], datos["single_use"])
+
+
+def _checkin_transaccion(conn, token, matricula, fecha, ahora):
+    # otras bases (SQLite local): mismo flujo dentro de una transacción
+    qr = conn.execute(text(f"""
+        SELECT materiaid, maestroid, expiracion, single_use, {_inscrito_sql("qr_tokens.materiaid")} AS inscrito
+        FROM qr_tokens WHERE token = :t AND activo = TRUE
+    """), {"t": token, "mat": matricula, "si": SOLO_INSCRITOS}).mappings().fetchone()
+    if not qr:
+        return _resultado(INVALIDO)
+    materiaid, maestroid = qr["materiaid"], qr["maestroid"]
+    if _expirado(qr["expiracion"], ahora):
+        conn.execute(text("UPDATE qr_tokens SET activo = FALSE WHERE token = :t"), {"t": token})
+        return _resultado(EXPIRADO, materiaid, maestroid)
+    if not qr["single_use"]:
+        cachear_token(token, materiaid, maestroid, qr["expiracion"])
+    if not qr["inscrito"]:
+        # antes de consumir un single-use: un no inscrito no lo gasta
+        return _resultado(NO_INSCRITO, materiaid, maestroid)
+    if qr["single_use"]:
+        usado = conn.execute(text("UPDATE qr_tokens SET activo = FALSE WHERE token = :t AND activo = TRUE"), {"t": token})
+        if usado.rowcount == 0:
+            return _resultado(INVALIDO)
+    ins = conn.execute(text(f"""
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        VALUES (:mat, :ma, :mid, :f, 'Presente')
+        {_CONFLICTO}
+    """), {"mat": matricula, "ma": maestroid, "mid": materiaid, "f": fecha})
+    return _resultado(REGISTRADA if ins.rowcount else DUPLICADA, materiaid, maestroid)
+
+
+def _checkin_diferido(conn, token, matricula, fecha):
+    # write-behind: validar y encolar sin ir a la base; None = usar el camino
+    # síncrono (primer escaneo del token en el proceso, single-use, expirado o
+    # alumno fuera de la lista en memoria)
+    if tokens_firmados.es_firmado(token):
+        info, _ = _consultar_firmado(token)
+    else:
+        info = _tokens.get(token)
+        if info and _expirado(info["expiracion"], datetime.datetime.utcnow()):
+            info = None
+    if info is None or info["single_use"] or not _en_lista(conn, info["materiaid"], matricula):
+        return None
+    try:
+        nuevo = buffer_asistencias.get_buffer().encolar(matricula, info["maestroid"], info["materiaid"], fecha)
+    except OverflowError:
+        return None
+    return _resultado(REGISTRADA if nuevo else DUPLICADA, info["materiaid"], info["maestroid"])
+
+
+def registrar_asistencia_qr(conn, token, matricula, fecha=None):
+    fecha = fecha or datetime.date.today()
+    res = _registrar(conn, token, int(matricula), fecha)
+    if buffer_asistencias.ACTIVO and res["estado"] in (REGISTRADA, DUPLICADA):
+        # también lo escrito por el camino síncrono: el siguiente escaneo
+        # diferido lo da por duplicado sin leer la base
+        buffer_asistencias.get_buffer().marcar_visto(matricula, res["materiaid"], fecha)
+    if res["estado"] == REGISTRADA:
+        resumen_alumno.invalidar([matricula], res["materiaid"], fecha)
+    return res
+
+
+def _registrar(conn, token, matricula, fecha):
+    ahora = datetime.datetime.utcnow()
+    if buffer_asistencias.ACTIVO:
+        res = _checkin_diferido(conn, token, matricula, fecha)
+        if res is not None:
+            return res
+    if tokens_firmados.es_firmado(token):
+        datos, res = _consultar_firmado(token)
+        if datos is None:
+            return res
+        try:
+            return _checkin_firmado(conn, datos, matricula, fecha)
+        except Exception:
+            conn.rollback()
+            raise
+    try:
+        info = _tokens.get(token)
+        if info and not info["single_use"] and not _expirado(info["expiracion"], ahora):
+            return _insertar_asistencia(conn, matricula, info, fecha)
+        # primer escaneo del token en el proceso (o single-use / expirado): una
+        # sola sentencia valida token e inscripción y registra
+        if conn.dialect.name != "postgresql":
+            res = _checkin_transaccion(conn, token, matricula, fecha, ahora)
+            conn.commit()
+        else:
+            fila = conn.execute(_CHECKIN_PG, {"t": token, "mat": matricula, "f": fecha, "ahora": ahora,
+                                              "si": SOLO_INSCRITOS}).mappings().fetchone()
+            conn.commit()
+            if fila["materiaid"] is None:
+                res = _resultado(INVALIDO)
+            elif fila["expirado"]:
+                res = _resultado(EXPIRADO, fila["materiaid"], fila["maestroid"])
+            else:
+                if not fila["single_use"]:
+                    cachear_token(token, fila["materiaid"], fila["maestroid"], fila["expiracion"])
+                if fila["no_inscrito"]:
+                    res = _resultado(NO_INSCRITO, fila["materiaid"], fila["maestroid"])
+                elif not fila["valido"]:
+                    # single-use consumido por otro escaneo concurrente
+                    res = _resultado(INVALIDO)
+                else:
+                    res = _resultado(REGISTRADA if fila["insertado"] else DUPLICADA, fila["materiaid"], fila["maestroid"])
+    except Exception:
+        conn.rollback()
+        raise
+    # lo que quedó en caché, no lo leído al entrar: consultar_token() pudo
+    # cachear aquí mismo un single-use que ya se consumió
+    cacheado = _tokens.get(token)
+    if res["estado"] in (INVALIDO, EXPIRADO) or (cacheado and cacheado["single_use"]):
+        invalidar_token(token)
+    return res
+
+
+def consultar_token(conn, token):
+    # validación de solo lectura (p. ej. antes de pedir login); no registra nada
+    if tokens_firmados.es_firmado(token):
+        return _consultar_firmado(token)[1]
+    ahora = datetime.datetime.utcnow()
+    info = _tokens.get(token)
+    if info is None:
+        qr = conn.execute(text("SELECT materiaid, maestroid, expiracion, single_use FROM qr_tokens WHERE token = :t AND activo = TRUE"),
+                          {"t": token}).mappings().fetchone()
+        if not qr:
+            return _resultado(INVALIDO)
+        if _expirado(qr["expiracion"], ahora):
+            return _resultado(EXPIRADO, qr["materiaid"], qr["maestroid"])
+        info = cachear_token(token, qr["materiaid"], qr["maestroid"], qr["expiracion"], qr["single_use"])
+    if _expirado(info["expiracion"], ahora):
+        invalidar_token(token)
+        return _resultado(EXPIRADO, info["materiaid"], info["maestroid"])
+    return _resultado(VALIDO, info["materiaid"], info["maestroid"], info["single_use"])
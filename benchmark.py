@@ -0,0 +1,379 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+# =========================
+# BENCHMARK DE RUTAS CRÍTICAS
+# =========================
+# Siembra una escuela sintética en una base LOCAL (la de DATABASE_URL, que debe
+# estar definida explícitamente) y mide, con hilos concurrentes, las rutas de
+# las 8am: check-in QR, login, dashboard admin y la grilla de asistencias.
+# Cada corrida agrega una línea JSON a bench_resultados.jsonl con p50/p95/p99
+# por ruta, para comparar entre versiones:
+#   DATABASE_URL=sqlite:///bench.db python benchmark.py --sembrar
+#   DATABASE_URL=... python benchmark.py --comparar
+if "DATABASE_URL" not in os.environ:
+    sys.exit("Define DATABASE_URL apuntando a una base local de pruebas (el benchmark escribe datos).")
+
+import asistencia_qr
+import consultas
+import cuentas
+import importar
+import migraciones
+import referencias
+import rollups
+import seguridad
+from db_conexion import get_connection, get_engine
+
+RUTAS = ["checkin_qr", "login", "dashboard", "asistencias"]
+PASSWORD_BENCH = "bench-1234"
+_DIAS_SEMANA = 5
+
+
+# ---------- siembra ----------
+
+def _csv(encabezado, filas):
+    buf = io.StringIO()
+    buf.write(",".join(encabezado) + "\n")
+    for f in filas:
+        buf.write(",".join(str(v) for v in f) + "\n")
+    buf.seek(0)
+    return buf
+
+
+def sembrar(alumnos=3000, maestros=60, materias=300, inscritos=30, dias=60, cuentas_alumnos=500, semilla=1):
+    # ids a partir de BASE para no chocar con datos existentes de la base local
+    rnd = random.Random(semilla)
+    migraciones.aplicar_migraciones()
+    with get_connection() as conn:
+        base = int(conn.execute(text("SELECT COALESCE(MAX(matricula), 0) FROM alumnos")).scalar()) + 1
+        base_ma = int(conn.execute(text("SELECT COALESCE(MAX(maestroid), 0) FROM maestros")).scalar()) + 1
+        base_mat = int(conn.execute(text("SELECT COALESCE(MAX(materiaid), 0) FROM materias")).scalar()) + 1
+    nombres = ["Ana", "Luis", "María", "José", "Sofía", "Diego", "Lucía", "Carlos", "Valeria", "Jorge", "Camila", "Miguel"]
+    apellidos = ["García", "Hernández", "López", "Martínez", "González", "Pérez", "Rodríguez", "Sánchez", "Ramírez", "Flores"]
+    horarios = referencias.HORARIOS
+    # cada maestro da a lo más len(horarios) clases, sin choques de horario
+    materias = min(materias, maestros * len(horarios))
+    filas_mat = []
+    for i in range(materias):
+        ma = base_ma + i % maestros
+        filas_mat.append((base_mat + i, f"Materia {i}", ma, horarios[(i // maestros) % len(horarios)]))
+    filas_ins = set()
+    for mid, _, _, _ in filas_mat:
+        for m in rnd.sample(range(base, base + alumnos), min(inscritos, alumnos)):
+            filas_ins.add((mid, m))
+    inicio = time.perf_counter()
+    res = importar.importar({
+        "maestros": _csv(["maestroid", "nombre", "apellido"],
+                         [(base_ma + i, rnd.choice(nombres), rnd.choice(apellidos)) for i in range(maestros)]),
+        "alumnos": _csv(["matricula", "nombre", "apellido"],
+                        [(base + i, rnd.choice(nombres), rnd.choice(apellidos)) for i in range(alumnos)]),
+        "materias": _csv(["materiaid", "nombre", "maestroid", "horario"], filas_mat),
+        "inscripciones": _csv(["materiaid", "matricula"], sorted(filas_ins)),
+    }, horarios=horarios)
+    t_import = time.perf_counter() - inicio
+
+    # un semestre de asistencias (días hábiles hacia atrás desde ayer)
+    hoy = datetime.date.today()
+    fechas = []
+    d = hoy - datetime.timedelta(days=1)
+    while len(fechas) < dias:
+        if d.weekday() < _DIAS_SEMANA:
+            fechas.append(d)
+        d -= datetime.timedelta(days=1)
+    maestro_de = {mid: ma for mid, _, ma, _ in filas_mat}
+    inicio = time.perf_counter()
+    total = 0
+    lote = []
+    with get_engine().begin() as conn:
+        for f in fechas:
+            for mid, m in filas_ins:
+                lote.append({"mat": m, "ma": maestro_de[mid], "mid": mid, "f": f,
+                             "e": rnd.choices(["Presente", "Ausente", "Retardo"], [85, 10, 5])[0]})
+                if len(lote) >= 5000:
+                    total += _insertar_asistencias(conn, lote)
+                    lote = []
+        if lote:
+            total += _insertar_asistencias(conn, lote)
+    t_asist = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    ids = list(range(base, base + min(cuentas_alumnos, alumnos)))
+    dadas = _credenciales(ids)
+    hoja, _ = cuentas.provisionar("alumno", credenciales=dadas, ids=ids)
+    t_cuentas = time.perf_counter() - inicio
+    referencias.invalidar("alumnos", "maestros", "materias", "clase_alumnos")
+    return {
+        "cargadas": {n: r["cargadas"] for n, r in res.items()},
+        "asistencias": total,
+        "cuentas": int(hoja["creada"].sum()) if not hoja.empty else 0,
+        "seg_importar": round(t_import, 2),
+        "seg_asistencias": round(t_asist, 2),
+        "seg_cuentas": round(t_cuentas, 2),
+    }
+
+
+def _credenciales(ids):
+    # usuario bench<matricula> con una contraseña conocida para la ruta de login
+    return pd.DataFrame({"id": [str(i) for i in ids], "usuario": [f"bench{i}" for i in ids],
+                         "contrasena": PASSWORD_BENCH})
+
+
+def _insertar_asistencias(conn, filas):
+    valores = []
+    params = {}
+    for i, f in enumerate(filas):
+        valores.append(f"(:mat{i}, :ma{i}, :mid{i}, :f{i}, :e{i})")
+        params.update({f"{k}{i}": v for k, v in f.items()})
+    return conn.execute(text(f"""
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        VALUES {", ".join(valores)}
+        ON CONFLICT (matricula, materiaid, fecha) DO NOTHING
+    """), params).rowcount
+
+
+# ---------- carga ----------
+
+class Escenario:
+    # datos que usan los trabajadores: inscripciones, tokens, cuentas, maestros
+    def __init__(self):
+        with get_connection() as conn:
+            self.inscripciones = [tuple(f) for f in conn.execute(text("SELECT materiaid, matricula FROM clase_alumnos")).fetchall()]
+            self.maestros = [f[0] for f in conn.execute(text("SELECT maestroid FROM maestros")).fetchall()]
+            self.cuentas = [f[0] for f in conn.execute(
+                text("SELECT nombreusuario FROM usuarios WHERE nombreusuario LIKE 'bench%'")).fetchall()]
+            expira = datetime.datetime.utcnow() + datetime.timedelta(hours=2)
+            materias = sorted({mid for mid, _ in self.inscripciones})
+            self.tokens = {}
+            for mid in materias:
+                token = f"bench-{mid}-{random.getrandbits(40):x}"
+                conn.execute(text("""
+                    INSERT INTO qr_tokens (token, materiaid, maestroid, expiracion, activo, single_use)
+                    SELECT :t, materiaid, maestroid, :e, TRUE, FALSE FROM materias WHERE materiaid = :mid
+                """), {"t": token, "mid": mid, "e": expira})
+                self.tokens[mid] = token
+            conn.commit()
+        if not self.inscripciones:
+            sys.exit("La base no tiene inscripciones: corre primero con --sembrar.")
+        self._dia = 0
+        self._lock = threading.Lock()
+
+    def fecha_checkin(self):
+        # días futuros distintos para que cada escaneo sea una inserción real,
+        # no un duplicado del mismo día
+        with self._lock:
+            self._dia += 1
+            return datetime.date.today() + datetime.timedelta(days=1 + self._dia // max(1, len(self.inscripciones)))
+
+    def limpiar(self):
+        # los tokens de la corrida no deben quedar activos, ni sus check-ins en
+        # días futuros contar para la siguiente corrida (ni para los reportes)
+        if asistencia_qr.buffer_asistencias.ACTIVO:
+            asistencia_qr.buffer_asistencias.get_buffer().vaciar()
+        hoy = datetime.date.today()
+        with get_connection() as conn:
+            conn.execute(text("UPDATE qr_tokens SET activo = FALSE WHERE token LIKE 'bench-%'"))
+            conn.execute(text("""
+                DELETE FROM asistencias
+                WHERE fecha > :hoy AND fecha <= :hasta
+                  AND materiaid IN (SELECT materiaid FROM qr_tokens WHERE token LIKE 'bench-%')
+            """), {"hoy": hoy, "hasta": self.fecha_checkin()})
+            conn.commit()
+
+
+def op_checkin_qr(esc, conn, rnd):
+    mid, matricula = rnd.choice(esc.inscripciones)
+    res = asistencia_qr.registrar_asistencia_qr(conn, esc.tokens[mid], matricula, fecha=esc.fecha_checkin())
+    if res["estado"] not in (asistencia_qr.REGISTRADA, asistencia_qr.DUPLICADA):
+        raise RuntimeError(res["estado"])
+
+
+def op_login(esc, conn, rnd):
+    if not esc.cuentas:
+        raise RuntimeError("sin cuentas bench*")
+    estado, _, _ = seguridad.autenticar(conn, rnd.choice(esc.cuentas), PASSWORD_BENCH, f"10.0.{rnd.randrange(256)}.{rnd.randrange(256)}")
+    if estado != seguridad.OK:
+        raise RuntimeError(estado)
+
+
+def op_dashboard(esc, conn, rnd):
+    hasta = datetime.date.today()
+    desde = hasta - datetime.timedelta(days=30)
+    rollups.metricas_dashboard(conn)
+    rollups.asistencias_por_estado(conn, desde, hasta)
+    rollups.tendencia_diaria(conn, desde, hasta)
+    conn.rollback()
+
+
+def op_asistencias(esc, conn, rnd):
+    # primera página + dos siguientes, filtrada por un maestro (como la vista del maestro)
+    filtros = {"desde": datetime.date.today() - datetime.timedelta(days=90), "maestroid": rnd.choice(esc.maestros)}
+    cursor = None
+    for _ in range(3):
+        _, cursor = consultas.pagina_asistencias(conn, filtros, cursor, 50)
+        if cursor is None:
+            break
+    conn.rollback()
+
+
+OPERACIONES = {"checkin_qr": op_checkin_qr, "login": op_login, "dashboard": op_dashboard, "asistencias": op_asistencias}
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    k = (len(valores) - 1) * p / 100
+    i = int(k)
+    j = min(i + 1, len(valores) - 1)
+    return valores[i] + (valores[j] - valores[i]) * (k - i)
+
+
+def correr(ruta, esc, hilos, duracion, semilla=1):
+    latencias = [[] for _ in range(hilos)]
+    errores = [0] * hilos
+    ultimo_error = [None]
+    fin = time.perf_counter() + duracion
+    op = OPERACIONES[ruta]
+
+    def trabajador(k):
+        rnd = random.Random(semilla * 1000 + k)
+        with get_connection() as conn:
+            while time.perf_counter() < fin:
+                t = time.perf_counter()
+                try:
+                    op(esc, conn, rnd)
+                    latencias[k].append((time.perf_counter() - t) * 1000)
+                except Exception as e:
+                    conn.rollback()
+                    errores[k] += 1
+                    ultimo_error[0] = str(e)[:200]
+
+    inicio = time.perf_counter()
+    ts = [threading.Thread(target=trabajador, args=(k,), daemon=True) for k in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    transcurrido = time.perf_counter() - inicio
+    todas = sorted(x for l in latencias for x in l)
+    redondo = lambda v: None if v is None else round(v, 2)
+    return {
+        "ops": len(todas),
+        "errores": sum(errores),
+        "ultimo_error": ultimo_error[0],
+        "ops_seg": round(len(todas) / transcurrido, 1) if transcurrido else None,
+        "p50_ms": redondo(percentil(todas, 50)),
+        "p95_ms": redondo(percentil(todas, 95)),
+        "p99_ms": redondo(percentil(todas, 99)),
+        "max_ms": redondo(todas[-1] if todas else None),
+    }
+
+
+# ---------- resultados ----------
+
+def _commit_git():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _tamano(conn):
+    return {t: conn.execute(text(f"SELECT COUNT(*) FROM {t}")).scalar()
+            for t in ("alumnos", "materias", "clase_alumnos", "asistencias", "usuarios")}
+
+
+def comparar(actual, anterior):
+    print(f"\nComparado con {anterior.get('commit')} ({anterior.get('fecha')}):")
+    for ruta, r in actual["rutas"].items():
+        a = anterior.get("rutas", {}).get(ruta)
+        if not a:
+            continue
+        partes = []
+        for clave in ("ops_seg", "p95_ms", "p99_ms"):
+            if r.get(clave) and a.get(clave):
+                cambio = 100 * (r[clave] - a[clave]) / a[clave]
+                partes.append(f"{clave} {a[clave]} -> {r[clave]} ({cambio:+.0f}%)")
+        print(f"  {ruta:12s} " + " | ".join(partes))
+
+
+def medir(args, esc, resultado):
+    for ruta in [r.strip() for r in args.rutas.split(",") if r.strip()]:
+        if ruta not in OPERACIONES:
+            sys.exit(f"Ruta desconocida: {ruta} (opciones: {', '.join(RUTAS)})")
+        r = correr(ruta, esc, args.hilos, args.duracion)
+        resultado["rutas"][ruta] = r
+        print(f"{ruta:12s} {r['ops']:7d} ops  {r['ops_seg']:8.1f}/s  p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  "
+              f"p99 {r['p99_ms']} ms  errores {r['errores']}")
+    anterior = None
+    if args.comparar and os.path.exists(args.salida):
+        with open(args.salida, encoding="utf-8") as f:
+            lineas = [l for l in f if l.strip()]
+        # la última corrida comparable: mismo dialecto, hilos y duración
+        for linea in reversed(lineas):
+            previa = json.loads(linea)
+            if (previa.get("dialecto"), previa.get("hilos"), previa.get("duracion_seg")) == \
+                    (resultado["dialecto"], resultado["hilos"], resultado["duracion_seg"]):
+                anterior = previa
+                break
+    with open(args.salida, "a", encoding="utf-8") as f:
+        f.write(json.dumps(resultado, ensure_ascii=False, default=str) + "\n")
+    if anterior:
+        comparar(resultado, anterior)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de check-in, login, dashboard y grilla de asistencias.")
+    parser.add_argument("--sembrar", action="store_true", help="siembra la escuela sintética antes de medir")
+    parser.add_argument("--alumnos", type=int, default=3000)
+    parser.add_argument("--maestros", type=int, default=60)
+    parser.add_argument("--materias", type=int, default=300)
+    parser.add_argument("--inscritos", type=int, default=30, help="alumnos por materia")
+    parser.add_argument("--dias", type=int, default=60, help="días hábiles de asistencias")
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--duracion", type=float, default=10, help="segundos por ruta")
+    parser.add_argument("--rutas", default=",".join(RUTAS))
+    parser.add_argument("--salida", default="bench_resultados.jsonl")
+    parser.add_argument("--comparar", action="store_true", help="compara con la última corrida comparable del archivo")
+    args = parser.parse_args()
+
+    print(f"Base: {get_engine().url.render_as_string(hide_password=True)}")
+    siembra = None
+    if args.sembrar:
+        siembra = sembrar(args.alumnos, args.maestros, args.materias, args.inscritos, args.dias)
+        print(f"Siembra: {siembra}")
+    esc = Escenario()
+    resultado = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_git(),
+        "dialecto": get_engine().dialect.name,
+        "python": platform.python_version(),
+        "hilos": args.hilos,
+        "duracion_seg": args.duracion,
+        "bcrypt_costo": seguridad.BCRYPT_COSTO,
+        "write_behind": asistencia_qr.buffer_asistencias.ACTIVO,
+        "siembra": siembra,
+        "rutas": {},
+    }
+    with get_connection() as conn:
+        resultado["tamano"] = _tamano(conn)
+    try:
+        medir(args, esc, resultado)
+    finally:
+        esc.limpiar()
+
+
+if __name__ == "__main__":
+    main()
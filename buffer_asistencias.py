@@ -0,0 +1,297 @@
+import atexit
+import collections
+import datetime
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import text
+
+import resumen_alumno
+from db_conexion import get_engine
+
+# =========================
+# WRITE-BEHIND DE CHECK-INS QR
+# =========================
+# Opcional (CHECKIN_WRITE_BEHIND=1). Los check-ins de todas las sesiones se
+# juntan en una cola acotada y se escriben en lotes con un solo
+# INSERT ... VALUES (...), (...) ON CONFLICT que, como el check-in directo,
+# solo reemplaza un "Ausente". Cada check-in se anota (con fsync) en un
+# journal local antes de confirmar al alumno; si un flush falla el lote
+# vuelve a la cola.
+# Cada proceso (app, workers de checkin_api) escribe su propio journal
+# checkins_pendientes.<pid>.jsonl. Al crear el buffer se adoptan los journals
+# de procesos que ya no existen (caída) y se re-encola lo que quedó pendiente.
+# Los duplicados se detectan en memoria: lo pendiente más lo ya visto en este
+# proceso por (materia, fecha). Lo que escape (p. ej. registrado desde otro
+# proceso) lo resuelve el ON CONFLICT del lote.
+ACTIVO = os.environ.get("CHECKIN_WRITE_BEHIND", "0").lower() in ("1", "true", "si", "sí")
+TAMANO_LOTE = int(os.environ.get("CHECKIN_LOTE", "50"))
+INTERVALO_FLUSH = float(os.environ.get("CHECKIN_FLUSH_SEG", "1.0"))
+MAX_PENDIENTES = int(os.environ.get("CHECKIN_MAX_PENDIENTES", "5000"))
+JOURNAL = os.environ.get("CHECKIN_JOURNAL", "checkins_pendientes.jsonl")
+
+
+def _journal_de(base, pid, sufijo=""):
+    # checkins_pendientes.jsonl -> checkins_pendientes.<pid>[-sufijo].jsonl
+    raiz, ext = os.path.splitext(base)
+    return f"{raiz}.{pid}{sufijo}{ext}"
+
+
+def _pid_de(base, ruta):
+    # pid dueño de un journal; None para el journal viejo sin pid
+    raiz, ext = os.path.splitext(base)
+    m = re.fullmatch(re.escape(raiz) + r"\.(\d+)(?:-\d+)?" + re.escape(ext), ruta)
+    return int(m.group(1)) if m else None
+
+
+def _vivo(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escribir_fsync(f, texto):
+    f.write(texto)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class BufferAsistencias:
+    def __init__(self, engine=None, tamano_lote=TAMANO_LOTE, intervalo=INTERVALO_FLUSH,
+                 max_pendientes=MAX_PENDIENTES, journal=JOURNAL):
+        self.engine = engine
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.max_pendientes = max_pendientes
+        self.journal = _journal_de(journal, os.getpid()) if journal else None
+        self._base_journal = journal
+        self._pendientes = collections.OrderedDict()   # (matricula, materiaid, fecha) -> fila
+        self._vistos = {}                               # (materiaid, fecha) -> {matricula}
+        self._cond = threading.Condition()
+        self._hilo = None
+        self._inicio = time.time()
+        self.metricas = {
+            "encolados": 0,
+            "escritos": 0,
+            "lotes": 0,
+            "fallos": 0,
+            "rechazados_cola_llena": 0,
+            "flush_total_ms": 0.0,
+            "flush_max_ms": 0.0,
+            "ultimo_error": None,
+        }
+        self._recuperar_journal()
+
+    # ---------- journal ----------
+    def _recuperar_journal(self):
+        # adopta los journals huérfanos: el propio (pid reciclado) y los de
+        # procesos muertos. El rename los reclama de forma atómica, así que dos
+        # procesos que arrancan a la vez no recuperan el mismo archivo
+        if not self.journal:
+            return
+        raiz, ext = os.path.splitext(self._base_journal)
+        reclamados = []
+        for ruta in sorted(glob.glob(glob.escape(raiz) + "*" + ext)):
+            if ruta not in (self.journal, self._base_journal):
+                pid = _pid_de(self._base_journal, ruta)
+                if pid is None or _vivo(pid):
+                    continue
+            propio = _journal_de(self._base_journal, os.getpid(), f"-{len(reclamados)}")
+            try:
+                os.rename(ruta, propio)
+            except OSError:
+                continue
+            reclamados.append(propio)
+            with open(propio, encoding="utf-8") as f:
+                for linea in f:
+                    if linea.strip():
+                        try:
+                            fila = json.loads(linea)
+                        except ValueError:
+                            # última línea a medias de una caída durante la escritura
+                            continue
+                        fila["fecha"] = datetime.date.fromisoformat(fila["fecha"])
+                        self._pendientes[(fila["matricula"], fila["materiaid"], fila["fecha"])] = fila
+                        self._recordar(fila["matricula"], fila["materiaid"], fila["fecha"])
+        if reclamados:
+            # todo lo recuperado pasa al journal propio antes de borrar los reclamados
+            with self._cond:
+                self._reescribir_journal()
+            for ruta in reclamados:
+                os.remove(ruta)
+        if self._pendientes:
+            self._arrancar()
+
+    def _anotar(self, fila):
+        if self.journal:
+            with open(self.journal, "a", encoding="utf-8") as f:
+                _escribir_fsync(f, json.dumps(dict(fila, fecha=fila["fecha"].isoformat())) + "\n")
+
+    def _reescribir_journal(self):
+        # se llama con self._cond tomado
+        if not self.journal:
+            return
+        if not self._pendientes:
+            if os.path.exists(self.journal):
+                os.remove(self.journal)
+            return
+        tmp = self.journal + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            _escribir_fsync(f, "".join(json.dumps(dict(fila, fecha=fila["fecha"].isoformat())) + "\n"
+                                       for fila in self._pendientes.values()))
+        os.replace(tmp, self.journal)
+
+    # ---------- vistos ----------
+    def _recordar(self, matricula, materiaid, fecha):
+        # se llama con self._cond tomado (o antes de arrancar el hilo)
+        clave = (materiaid, fecha)
+        if clave not in self._vistos:
+            # solo hoy y ayer: los escaneos son del día
+            limite = datetime.date.today() - datetime.timedelta(days=1)
+            for vieja in [c for c in self._vistos if c[1] < limite]:
+                del self._vistos[vieja]
+            self._vistos[clave] = set()
+        self._vistos[clave].add(matricula)
+
+    def visto(self, matricula, materiaid, fecha):
+        with self._cond:
+            return int(matricula) in self._vistos.get((int(materiaid), fecha), ())
+
+    def marcar_visto(self, matricula, materiaid, fecha):
+        # registros escritos por el camino síncrono de este proceso
+        with self._cond:
+            self._recordar(int(matricula), int(materiaid), fecha)
+
+    # ---------- API ----------
+    def encolar(self, matricula, maestroid, materiaid, fecha, estado="Presente"):
+        # True si quedó encolado, False si ya estaba pendiente o ya se vio en
+        # este proceso. OverflowError si la cola está llena: el llamador escribe directo.
+        clave = (int(matricula), int(materiaid), fecha)
+        fila = {"matricula": clave[0], "maestroid": int(maestroid), "materiaid": clave[1],
+                "fecha": fecha, "estado": estado}
+        with self._cond:
+            if clave in self._pendientes or clave[0] in self._vistos.get((clave[1], fecha), ()):
+                return False
+            if len(self._pendientes) >= self.max_pendientes:
+                self.metricas["rechazados_cola_llena"] += 1
+                raise OverflowError("cola de asistencias llena")
+            self._anotar(fila)
+            self._pendientes[clave] = fila
+            self._recordar(clave[0], clave[1], fecha)
+            self.metricas["encolados"] += 1
+            if len(self._pendientes) >= self.tamano_lote:
+                self._cond.notify()
+        self._arrancar()
+        return True
+
+    def flush(self):
+        with self._cond:
+            lote = list(self._pendientes.items())[:self.tamano_lote]
+        if not lote:
+            return 0
+        inicio = time.perf_counter()
+        try:
+            escribir_lote(self.engine or get_engine(), [fila for _, fila in lote])
+        except Exception as e:
+            with self._cond:
+                self.metricas["fallos"] += 1
+                self.metricas["ultimo_error"] = str(e)
+            raise
+        ms = (time.perf_counter() - inicio) * 1000
+        with self._cond:
+            for clave, _ in lote:
+                self._pendientes.pop(clave, None)
+            self._reescribir_journal()
+            self.metricas["lotes"] += 1
+            self.metricas["escritos"] += len(lote)
+            self.metricas["flush_total_ms"] += ms
+            self.metricas["flush_max_ms"] = max(self.metricas["flush_max_ms"], ms)
+        return len(lote)
+
+    def vaciar(self):
+        while self.flush():
+            pass
+
+    def estadisticas(self):
+        with self._cond:
+            datos = dict(self.metricas)
+            datos["pendientes"] = len(self._pendientes)
+        transcurrido = max(time.time() - self._inicio, 1e-6)
+        datos["escritos_por_seg"] = round(datos["escritos"] / transcurrido, 2)
+        if datos["lotes"]:
+            datos["flush_prom_ms"] = round(datos["flush_total_ms"] / datos["lotes"], 2)
+        return datos
+
+    # ---------- hilo de fondo ----------
+    def _arrancar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            with self._cond:
+                if self._hilo is None or not self._hilo.is_alive():
+                    self._hilo = threading.Thread(target=self._ciclo, name="buffer-asistencias", daemon=True)
+                    self._hilo.start()
+
+    def _ciclo(self):
+        espera = self.intervalo
+        while True:
+            with self._cond:
+                if len(self._pendientes) < self.tamano_lote:
+                    self._cond.wait(timeout=espera)
+            try:
+                while self.flush() == self.tamano_lote:
+                    pass
+                espera = self.intervalo
+            except Exception:
+                # el lote sigue en la cola; reintentar con backoff
+                espera = min(espera * 2, 30)
+
+
+def escribir_lote(engine, filas):
+    valores = []
+    params = {}
+    for i, fila in enumerate(filas):
+        valores.append(f"(:mat{i}, :ma{i}, :mid{i}, :f{i}, :e{i})")
+        params.update({f"mat{i}": fila["matricula"], f"ma{i}": fila["maestroid"], f"mid{i}": fila["materiaid"],
+                       f"f{i}": fila["fecha"], f"e{i}": fila["estado"]})
+    sql = f"""
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        VALUES {", ".join(valores)}
+        ON CONFLICT (matricula, materiaid, fecha) DO UPDATE
+        SET estado = EXCLUDED.estado WHERE asistencias.estado = 'Ausente'
+    """
+    with engine.begin() as conn:
+        conn.execute(text(sql), params)
+    # el check-in ya invalidó el resumen al encolarse; pudo recalcularse antes
+    # de que la fila existiera
+    for fila in filas:
+        resumen_alumno.invalidar([fila["matricula"]], fila["materiaid"], fila["fecha"])
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = BufferAsistencias()
+                atexit.register(_vaciar_al_salir)
+    return _buffer
+
+
+def _vaciar_al_salir():
+    try:
+        _buffer.vaciar()
+    except Exception:
+        pass   # queda en el journal para el próximo arranque
@@ -0,0 +1,83 @@
+import collections
+import threading
+import time
+
+# =========================
+# CACHÉ EN MEMORIA (por proceso)
+# =========================
+# LRU con TTL y contadores de aciertos/fallos. Cada caché se registra por
+# nombre para que el panel de diagnóstico pueda mostrar todas.
+_registro = {}
+
+
+class CacheTTL:
+    def __init__(self, nombre, max_items=1024, ttl=60):
+        self.nombre = nombre
+        self.max_items = max_items
+        self.ttl = ttl
+        self._datos = collections.OrderedDict()   # clave -> (vence, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsados = 0
+        _registro[nombre] = self
+
+    def get(self, clave, default=None):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                self.fallos += 1
+                return default
+            vence, valor = item
+            if vence is not None and vence <= time.monotonic():
+                del self._datos[clave]
+                self.fallos += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def set(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        vence = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._datos[clave] = (vence, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_items:
+                self._datos.popitem(last=False)
+                self.expulsados += 1
+
+    def pop(self, clave):
+        with self._lock:
+            item = self._datos.pop(clave, None)
+        return item[1] if item else None
+
+    def invalidar_si(self, predicado):
+        # borra las entradas donde predicado(clave, valor) es verdadero
+        with self._lock:
+            claves = [c for c, (_, v) in self._datos.items() if predicado(c, v)]
+            for c in claves:
+                del self._datos[c]
+        return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "cache": self.nombre,
+                "entradas": len(self._datos),
+                "max": self.max_items,
+                "ttl_seg": self.ttl,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsados": self.expulsados,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else None,
+            }
+
+
+def estadisticas_caches():
+    return [c.estadisticas() for c in _registro.values()]
@@ -0,0 +1,207 @@
+import asyncio
+import html
+import http.cookies
+import logging
+import os
+import sys
+import urllib.parse
+
+import asistencia_qr
+import migraciones
+import seguridad
+from db_conexion import get_connection
+
+# =========================
+# ENDPOINT LIGERO DE CHECK-IN (ASGI)
+# =========================
+# Atiende /checkin?qr_token=... sin pasar por Streamlit: valida el token,
+# autentica (cookie firmada o usuario/contraseña contra usuarios) y registra la
+# asistencia con el mismo asistencia_qr que usa la app. Responde HTML mínimo.
+# Es una app ASGI sin framework; para servirla hace falta un servidor ASGI:
+#   pip install uvicorn && uvicorn checkin_api:app --workers 2
+# Si CHECKIN_URL está definida, la app genera los QR apuntando aquí.
+COOKIE = "asistencia_sesion"
+COOKIE_SEGURA = os.environ.get("CHECKIN_COOKIE_SEGURA", "1").lower() in ("1", "true", "si", "sí")
+MAX_CUERPO = 8 * 1024
+log = logging.getLogger("checkin_api")
+
+_MENSAJES = {
+    asistencia_qr.REGISTRADA: ("✅", "Asistencia registrada correctamente."),
+    asistencia_qr.DUPLICADA: ("ℹ️", "Tu asistencia para esta materia ya está registrada hoy."),
+    asistencia_qr.EXPIRADO: ("⛔", "QR expirado."),
+    asistencia_qr.NO_INSCRITO: ("⛔", "No estás inscrito en esta materia."),
+    asistencia_qr.INVALIDO: ("⛔", "QR inválido o ya utilizado / inactivo."),
+}
+
+_PAGINA = """<!doctype html>
+<html lang="es"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Asistencia</title>
+<style>body{{font-family:system-ui,sans-serif;max-width:26rem;margin:2rem auto;padding:0 1rem}}
+input,button{{width:100%;padding:.6rem;margin:.3rem 0;font-size:1rem;box-sizing:border-box}}
+.error{{color:#b00020}}</style></head>
+<body>{cuerpo}</body></html>"""
+
+_FORMULARIO = """<h2>Registrar asistencia</h2>
+{error}
+<form method="post" action="/checkin">
+<input type="hidden" name="qr_token" value="{token}">
+<input name="usuario" placeholder="Usuario" autocomplete="username" required>
+<input name="contrasena" type="password" placeholder="Contraseña" autocomplete="current-password" required>
+<button type="submit">Ingresar y registrar asistencia</button>
+</form>"""
+
+
+def _html(cuerpo):
+    return _PAGINA.format(cuerpo=cuerpo)
+
+
+def _resultado_html(res):
+    icono, texto = _MENSAJES.get(res["estado"], _MENSAJES[asistencia_qr.INVALIDO])
+    return _html(f"<h2>{icono} {html.escape(texto)}</h2>")
+
+
+def _formulario_html(token, error=None):
+    aviso = f'<p class="error">{html.escape(error)}</p>' if error else ""
+    return _html(_FORMULARIO.format(token=html.escape(token, quote=True), error=aviso))
+
+
+def _cookie_sesion(valor):
+    galleta = http.cookies.SimpleCookie()
+    galleta[COOKIE] = valor
+    galleta[COOKIE]["path"] = "/checkin"
+    galleta[COOKIE]["httponly"] = True
+    galleta[COOKIE]["samesite"] = "Lax"
+    galleta[COOKIE]["max-age"] = seguridad.SESION_DIAS * 86400
+    if COOKIE_SEGURA:
+        galleta[COOKIE]["secure"] = True
+    return galleta[COOKIE].OutputString()
+
+
+def _leer_cookie(encabezados):
+    galleta = http.cookies.SimpleCookie()
+    try:
+        galleta.load(encabezados.get("cookie", ""))
+    except http.cookies.CookieError:
+        return None
+    return galleta[COOKIE].value if COOKIE in galleta else None
+
+
+# --- lógica síncrona (corre en el pool de hilos del loop) ---
+
+def checkin_get(token, cookie):
+    # devuelve (status, html, set-cookie o None)
+    with get_connection() as conn:
+        sesion = seguridad.verificar_sesion(conn, cookie) if cookie else None
+        if sesion and sesion["rol"] == "alumno" and sesion["matricula"]:
+            return 200, _resultado_html(asistencia_qr.registrar_asistencia_qr(conn, token, sesion["matricula"])), None
+        qr = asistencia_qr.consultar_token(conn, token)
+    if qr["estado"] != asistencia_qr.VALIDO:
+        return 200, _resultado_html(qr), None
+    return 200, _formulario_html(token), None
+
+
+def checkin_post(token, usuario, contrasena, ip):
+    with get_connection() as conn:
+        estado, user, espera = seguridad.autenticar(conn, usuario, contrasena, ip)
+        if estado == seguridad.BLOQUEADO:
+            return 429, _formulario_html(token, f"Demasiados intentos. Espera {espera} s."), None
+        if estado == seguridad.OCUPADO:
+            return 503, _formulario_html(token, "Servidor ocupado, intenta de nuevo en unos segundos."), None
+        if estado != seguridad.OK:
+            return 200, _formulario_html(token, "Usuario o contraseña incorrectos."), None
+        if user["rol"] != "alumno" or not user["matricula"]:
+            return 200, _html("<h2>⛔ Tu cuenta no es de tipo alumno o no está vinculada a una matrícula.</h2>"), None
+        res = asistencia_qr.registrar_asistencia_qr(conn, token, user["matricula"])
+    return 200, _resultado_html(res), _cookie_sesion(seguridad.firmar_sesion(user["usuarioid"], user["contrasena"]))
+
+
+# --- ASGI ---
+
+async def _responder(send, status, cuerpo, cookie=None, tipo="text/html; charset=utf-8"):
+    datos = cuerpo.encode("utf-8")
+    encabezados = [(b"content-type", tipo.encode()), (b"content-length", str(len(datos)).encode()),
+                   (b"cache-control", b"no-store")]
+    if cookie:
+        encabezados.append((b"set-cookie", cookie.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": encabezados})
+    await send({"type": "http.response.body", "body": datos})
+
+
+async def _leer_cuerpo(receive):
+    partes = []
+    total = 0
+    while True:
+        mensaje = await receive()
+        partes.append(mensaje.get("body", b""))
+        total += len(partes[-1])
+        if total > MAX_CUERPO:
+            return None
+        if not mensaje.get("more_body"):
+            return b"".join(partes)
+
+
+def _ip(scope, encabezados):
+    directa = scope["client"][0] if scope.get("client") else None
+    return seguridad.ip_de_solicitud(directa, encabezados.get("x-forwarded-for"))
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, migraciones.asegurar_esquema)
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    ruta, metodo = scope["path"], scope["method"]
+    if ruta == "/salud":
+        return await _responder(send, 200, "ok", tipo="text/plain")
+    if ruta != "/checkin":
+        return await _responder(send, 404, _html("<h2>No encontrado</h2>"))
+    encabezados = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    loop = asyncio.get_running_loop()
+    try:
+        if metodo == "GET":
+            consulta = urllib.parse.parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            token = (consulta.get("qr_token") or [""])[0]
+            if not token:
+                return await _responder(send, 400, _resultado_html({"estado": asistencia_qr.INVALIDO}))
+            status, cuerpo, cookie = await loop.run_in_executor(None, checkin_get, token, _leer_cookie(encabezados))
+        elif metodo == "POST":
+            crudo = await _leer_cuerpo(receive)
+            if crudo is None:
+                return await _responder(send, 413, _html("<h2>Solicitud demasiado grande</h2>"))
+            form = urllib.parse.parse_qs(crudo.decode("utf-8", "replace"))
+            campo = lambda n: (form.get(n) or [""])[0]
+            if not campo("qr_token"):
+                return await _responder(send, 400, _resultado_html({"estado": asistencia_qr.INVALIDO}))
+            status, cuerpo, cookie = await loop.run_in_executor(
+                None, checkin_post, campo("qr_token"), campo("usuario"), campo("contrasena"), _ip(scope, encabezados))
+        else:
+            return await _responder(send, 405, _html("<h2>Método no permitido</h2>"))
+    except Exception:
+        log.exception("error en %s %s", metodo, ruta)
+        return await _responder(send, 500, _html("<h2>Error al registrar asistencia. Intenta de nuevo.</h2>"))
+    await _responder(send, status, cuerpo, cookie)
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        print("Para servir el endpoint instala un servidor ASGI: pip install uvicorn")
+        sys.exit(1)
+    uvicorn.run(app, host=os.environ.get("CHECKIN_HOST", "0.0.0.0"), port=int(os.environ.get("CHECKIN_PORT", "8001")))
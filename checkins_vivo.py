@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from db_conexion import get_engine
+
+# =========================
+# CHECK-INS EN VIVO
+# =========================
+# Panel junto al QR: quién ya registró asistencia en una clase (materia, fecha).
+# En lugar de que cada pantalla relea sus asistencias, el proceso lleva una
+# marca de agua (el mayor asistenciaid visto) y cada INTERVALO segundos hace UNA
+# consulta por lo nuevo (asistenciaid > marca, por llave primaria) que reparte
+# entre todas las clases vigiladas. 30 proyectores abiertos = 1 consulta
+# pequeña por intervalo.
+# El refresco solo ve altas. Un cambio sobre una fila existente (el QR que
+# convierte un "Ausente" del pase de lista en Presente conserva su
+# asistenciaid) o un borrado se recogen al volver a tomar la foto de la clase,
+# cada FOTO_SEG segundos mientras alguien la mire.
+INTERVALO = float(os.environ.get("CHECKIN_VIVO_SEG", "3"))
+FOTO_SEG = float(os.environ.get("CHECKIN_VIVO_FOTO_SEG", "30"))
+# una clase que nadie mira en este tiempo deja de seguirse
+OLVIDAR_SEG = 600
+MAX_FILAS = 5000
+# en Postgres un id bajo puede confirmarse después de uno alto (transacciones
+# concurrentes): se relee este margen por debajo de la marca; reaplicar es inocuo
+SOLAPE = 200
+
+_lock = threading.Lock()
+_marca = None          # mayor asistenciaid procesado
+_ultimo = 0.0          # monotonic del último refresco
+_clases = {}           # (materiaid, fecha) -> {matricula: estado}
+_fotos = {}            # (materiaid, fecha) -> monotonic de la última foto
+_vistas = {}           # (materiaid, fecha) -> monotonic de la última consulta
+_metricas = {"refrescos": 0, "filas": 0, "fotos": 0}
+
+
+def _clave(materiaid, fecha):
+    # SQLite devuelve las fechas como texto: la clave usa siempre 'AAAA-MM-DD'
+    return int(materiaid), str(fecha)[:10]
+
+
+def _foto(conn, materiaid, fecha):
+    filas = conn.execute(text("""
+        SELECT matricula, estado FROM asistencias
+        WHERE materiaid = :mid AND fecha = :f
+    """), {"mid": int(materiaid), "f": fecha}).fetchall()
+    _metricas["fotos"] += 1
+    return {int(m): e for m, e in filas if m is not None}
+
+
+def _refrescar(conn):
+    global _marca, _ultimo
+    filas = conn.execute(text("""
+        SELECT asistenciaid, materiaid, fecha, matricula, estado FROM asistencias
+        WHERE asistenciaid > :desde
+        ORDER BY asistenciaid
+        LIMIT :n
+    """), {"desde": max(0, _marca - SOLAPE), "n": MAX_FILAS}).fetchall()
+    for aid, mid, fecha, matricula, estado in filas:
+        clase = _clases.get(_clave(mid, fecha)) if mid is not None else None
+        if clase is not None and matricula is not None:
+            clase[int(matricula)] = estado
+        _marca = max(_marca, aid)
+    _ultimo = time.monotonic()
+    _metricas["refrescos"] += 1
+    _metricas["filas"] += len(filas)
+    # si hubo más de MAX_FILAS nuevas, el resto entra en el siguiente intervalo
+    ahora = time.monotonic()
+    for clave in [c for c, t in _vistas.items() if ahora - t > OLVIDAR_SEG]:
+        _vistas.pop(clave, None)
+        _clases.pop(clave, None)
+        _fotos.pop(clave, None)
+
+
+def registrados(materiaid, fecha, engine=None):
+    # {matricula: estado} de la clase; a lo más una consulta por INTERVALO para
+    # todo el proceso, más una foto de la clase la primera vez que se pide y
+    # cada FOTO_SEG
+    global _marca
+    clave = _clave(materiaid, fecha)
+    with _lock:
+        ahora = time.monotonic()
+        _vistas[clave] = ahora
+        foto = clave not in _clases or ahora - _fotos[clave] >= FOTO_SEG
+        if foto or ahora - _ultimo >= INTERVALO:
+            with (engine or get_engine()).connect() as conn:
+                if _marca is None:
+                    _marca = conn.execute(text("SELECT COALESCE(MAX(asistenciaid), 0) FROM asistencias")).scalar()
+                if foto:
+                    # la foto se toma después de fijar la marca: lo que entre en
+                    # medio llega también por el refresco y se sobrescribe igual
+                    _clases[clave] = _foto(conn, materiaid, fecha)
+                    _fotos[clave] = ahora
+                _refrescar(conn)
+        return dict(_clases[clave])
+
+
+def estadisticas():
+    with _lock:
+        return {**_metricas, "marca": _marca, "clases_vigiladas": len(_clases), "intervalo_seg": INTERVALO}
@@ -0,0 +1,119 @@
+import pandas as pd
+from sqlalchemy import text
+
+import resumen_alumno
+
+# =========================
+# CONSULTAS PAGINADAS
+# =========================
+# Paginación por keyset sobre (fecha, asistenciaid) DESC: cada página es una
+# consulta acotada por índice, sin OFFSET y sin leer la tabla completa.
+
+_SELECT_ASISTENCIAS = """
+    SELECT a.asistenciaid, a.fecha, a.estado,
+           a.matricula, al.nombre AS alumno_nombre, al.apellido AS alumno_apellido,
+           ma.nombre AS maestro_nombre, ma.apellido AS maestro_apellido,
+           m.nombre AS materia_nombre
+    FROM asistencias a
+    LEFT JOIN alumnos al ON a.matricula = al.matricula
+    LEFT JOIN maestros ma ON a.maestroid = ma.maestroid
+    LEFT JOIN materias m ON a.materiaid = m.materiaid
+"""
+
+
+def filtros_asistencias(filtros):
+    # WHERE + params para los filtros soportados:
+    # desde, hasta, materiaid, matricula, maestroid, estado
+    where = ["a.fecha IS NOT NULL"]
+    params = {}
+    if filtros.get("desde"):
+        where.append("a.fecha >= :desde")
+        params["desde"] = filtros["desde"]
+    if filtros.get("hasta"):
+        where.append("a.fecha <= :hasta")
+        params["hasta"] = filtros["hasta"]
+    for campo in ("materiaid", "matricula", "maestroid"):
+        if filtros.get(campo) is not None:
+            where.append(f"a.{campo} = :{campo}")
+            params[campo] = int(filtros[campo])
+    if filtros.get("estado"):
+        where.append("a.estado = :estado")
+        params["estado"] = filtros["estado"]
+    return where, params
+
+
+def pagina_asistencias(conn, filtros=None, cursor=None, tamano=50):
+    # devuelve (DataFrame, cursor de la página siguiente o None)
+    where, params = filtros_asistencias(filtros or {})
+    if cursor is not None:
+        where.append("(a.fecha, a.asistenciaid) < (:cf, :cid)")
+        params["cf"], params["cid"] = cursor
+    params["lim"] = int(tamano) + 1
+    sql = f"""{_SELECT_ASISTENCIAS}
+        WHERE {" AND ".join(where)}
+        ORDER BY a.fecha DESC, a.asistenciaid DESC
+        LIMIT :lim
+    """
+    df = pd.read_sql(text(sql), conn, params=params)
+    siguiente = None
+    if len(df) > tamano:
+        df = df.iloc[:tamano]
+        ultima = df.iloc[-1]
+        siguiente = (ultima["fecha"], int(ultima["asistenciaid"]))
+    return df, siguiente
+
+
+# =========================
+# PASE DE LISTA
+# =========================
+ESTADOS = ["Presente", "Ausente", "Retardo"]
+
+
+def lista_clase(conn, materiaid, fecha, estado_default="Ausente"):
+    # alumnos inscritos en la materia con el estado ya registrado ese día
+    # (check-ins QR incluidos); los que no tienen registro llevan estado_default
+    df = pd.read_sql(text("""
+        SELECT a.matricula, a.nombre, a.apellido, s.estado AS registrado
+        FROM clase_alumnos ca
+        JOIN alumnos a ON ca.matricula = a.matricula
+        LEFT JOIN asistencias s
+               ON s.matricula = ca.matricula AND s.materiaid = ca.materiaid AND s.fecha = :f
+        WHERE ca.materiaid = :mid
+        ORDER BY a.apellido, a.nombre, a.matricula
+    """), conn, params={"mid": int(materiaid), "f": fecha})
+    df["estado"] = df["registrado"].where(df["registrado"].isin(ESTADOS), estado_default)
+    return df
+
+
+def guardar_lista(conn, materiaid, maestroid, fecha, estados, por_defecto=None):
+    # estados: {matricula: estado} que el maestro cambió en la lista; se
+    # escriben aunque ya exista registro. por_defecto: filas que no tocó (sin
+    # registro al cargar la lista); solo se insertan si siguen sin registro, así
+    # un check-in QR llegado mientras tanto no se pisa. Un solo INSERT por
+    # grupo; las filas que no cambian no se reescriben (ni disparan el rollup)
+    distinto = "IS DISTINCT FROM" if conn.dialect.name == "postgresql" else "IS NOT"
+    n = 0
+    for filas, conflicto in ((estados, f"""DO UPDATE
+        SET estado = EXCLUDED.estado, maestroid = EXCLUDED.maestroid
+        WHERE asistencias.estado {distinto} EXCLUDED.estado
+           OR asistencias.maestroid {distinto} EXCLUDED.maestroid"""),
+                             (por_defecto or {}, "DO NOTHING")):
+        if not filas:
+            continue
+        valores = []
+        params = {"ma": int(maestroid), "mid": int(materiaid), "f": fecha}
+        for i, (matricula, estado) in enumerate(filas.items()):
+            if estado not in ESTADOS:
+                raise ValueError(f"Estado inválido: {estado}")
+            valores.append(f"(:mat{i}, :ma, :mid, :f, :e{i})")
+            params[f"mat{i}"] = int(matricula)
+            params[f"e{i}"] = estado
+        n += conn.execute(text(f"""
+            INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+            VALUES {", ".join(valores)}
+            ON CONFLICT (matricula, materiaid, fecha) {conflicto}
+        """), params).rowcount
+    conn.commit()
+    if n:
+        resumen_alumno.invalidar(list(estados) + list(por_defecto or {}), materiaid, fecha)
+    return n
@@ -0,0 +1,167 @@
+import argparse
+import os
+import secrets
+import string
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from sqlalchemy import text
+
+from db_conexion import get_engine
+from seguridad import BCRYPT_COSTO, hash_password
+
+# =========================
+# ALTA MASIVA DE CUENTAS
+# =========================
+# Crea usuarios para alumnos o maestros que aún no tienen cuenta, ya
+# vinculados por matricula / maestroid. El hash bcrypt es lo caro, así que se
+# reparte en un pool de hilos (bcrypt suelta el GIL mientras calcula; un pool
+# de procesos haría fork dentro del servidor de Streamlit, que tiene hilos);
+# los INSERT van por lotes. Devuelve la hoja de
+# credenciales (la única vez que las contraseñas existen en claro) y las filas
+# del CSV de credenciales que se rechazaron.
+ROLES = {
+    # rol: (tabla, columna de id, prefijo de usuario)
+    "alumno": ("alumnos", "matricula", "a"),
+    "maestro": ("maestros", "maestroid", "m"),
+}
+HILOS = int(os.environ.get("CUENTAS_HILOS", str(os.cpu_count() or 2)))
+TAMANO_LOTE = 500
+_ALFABETO = string.ascii_letters + string.digits
+
+
+def generar_password(longitud=10):
+    return "".join(secrets.choice(_ALFABETO) for _ in range(longitud))
+
+
+def sin_cuenta(conn, rol):
+    # alumnos / maestros sin ningún usuario vinculado
+    tabla, id_col, _ = ROLES[rol]
+    return pd.read_sql(text(f"""
+        SELECT t.{id_col} AS id, t.nombre, t.apellido
+        FROM {tabla} t
+        WHERE NOT EXISTS (SELECT 1 FROM usuarios u WHERE u.{id_col} = t.{id_col})
+        ORDER BY t.{id_col}
+    """), conn)
+
+
+def _validar_credenciales(dadas, personas):
+    # filas del CSV con id no entero, repetido o sin persona pendiente de cuenta
+    # se separan con su motivo (fila = línea del archivo, con encabezado)
+    if "id" not in dadas.columns:
+        raise ValueError("Las credenciales necesitan una columna id")
+    dadas = dadas.assign(fila=range(2, len(dadas) + 2))
+    texto = dadas["id"].astype(str).str.strip()
+    valores = pd.to_numeric(texto.where(texto != ""), errors="coerce")
+    motivo = pd.Series(None, index=dadas.index, dtype=object)
+    motivo[valores.isna() | (valores % 1 != 0)] = "id no es un número"
+    motivo[motivo.isna() & valores.duplicated(keep="first")] = "id repetido en el archivo"
+    motivo[motivo.isna() & ~valores.isin(personas["id"])] = "id no existe o ya tiene cuenta"
+    rechazos = dadas.loc[motivo.notna(), ["fila", "id"]].assign(motivo=motivo[motivo.notna()])
+    buenas = dadas[motivo.isna()].assign(id=valores[motivo.isna()].astype("int64"))
+    return buenas, rechazos.reset_index(drop=True)
+
+
+def preparar_credenciales(personas, rol, credenciales=None):
+    # personas: DataFrame con id, nombre, apellido. credenciales (opcional):
+    # DataFrame con id y, si se quieren fijar, usuario y/o contrasena; lo que
+    # falte se genera (usuario = prefijo + id, contraseña aleatoria).
+    # Devuelve (credenciales listas, filas rechazadas del CSV)
+    _, _, prefijo = ROLES[rol]
+    df = personas[["id", "nombre", "apellido"]].copy()
+    df["id"] = df["id"].astype(int)
+    rechazos = pd.DataFrame(columns=["fila", "id", "motivo"])
+    if credenciales is not None:
+        dadas, rechazos = _validar_credenciales(credenciales, df)
+        df = df.merge(dadas[[c for c in ("id", "usuario", "contrasena") if c in dadas.columns]], on="id", how="inner")
+    for c in ("usuario", "contrasena"):
+        if c not in df.columns:
+            df[c] = None
+        df[c] = df[c].replace("", None)
+    df["usuario"] = df["usuario"].fillna(prefijo + df["id"].astype(str))
+    faltan = df["contrasena"].isna()
+    df.loc[faltan, "contrasena"] = [generar_password() for _ in range(int(faltan.sum()))]
+    df["rol"] = rol
+    return df.reset_index(drop=True), rechazos
+
+
+def hashear(passwords, costo=BCRYPT_COSTO, hilos=HILOS, progreso=None):
+    # progreso(hechas, total) se llama conforme salen los hashes, en orden
+    total = len(passwords)
+    hashes = []
+    if hilos <= 1 or total < 2:
+        for p in passwords:
+            hashes.append(hash_password(p, costo))
+            if progreso:
+                progreso(len(hashes), total)
+        return hashes
+    bloque = max(1, min(50, total // (hilos * 4)))
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        for h in pool.map(lambda p: hash_password(p, costo), passwords):
+            hashes.append(h)
+            if progreso and (len(hashes) % bloque == 0 or len(hashes) == total):
+                progreso(len(hashes), total)
+    return hashes
+
+
+def insertar(conn, rol, df, hashes):
+    # INSERT por lotes; un nombre de usuario ya ocupado no tumba el lote, solo
+    # esa fila queda marcada como no creada
+    _, id_col, _ = ROLES[rol]
+    creados = set()
+    filas = list(zip(df["usuario"], hashes, df["id"]))
+    for i in range(0, len(filas), TAMANO_LOTE):
+        lote = filas[i:i + TAMANO_LOTE]
+        valores = []
+        params = {"r": rol}
+        for k, (usuario, h, id_) in enumerate(lote):
+            valores.append(f"(:u{k}, :p{k}, :r, :i{k})")
+            params.update({f"u{k}": usuario, f"p{k}": h, f"i{k}": int(id_)})
+        res = conn.execute(text(f"""
+            INSERT INTO usuarios (nombreusuario, contrasena, rol, {id_col})
+            VALUES {", ".join(valores)}
+            ON CONFLICT (nombreusuario) DO NOTHING
+            RETURNING nombreusuario
+        """), params)
+        creados.update(r[0] for r in res)
+    conn.commit()
+    # un usuario repetido en la misma carga solo se crea para su primera fila
+    return df["usuario"].isin(creados) & ~df["usuario"].duplicated(keep="first")
+
+
+def provisionar(rol, credenciales=None, ids=None, costo=BCRYPT_COSTO, hilos=HILOS, progreso=None, engine=None):
+    # devuelve (hoja de credenciales con la columna `creada`, filas rechazadas)
+    if rol not in ROLES:
+        raise ValueError(f"Rol no soportado: {rol}")
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        personas = sin_cuenta(conn, rol)
+    if ids is not None:
+        personas = personas[personas["id"].isin([int(i) for i in ids])]
+    df, rechazos = preparar_credenciales(personas, rol, credenciales)
+    columnas = ["rol", "id", "nombre", "apellido", "usuario", "contrasena", "creada"]
+    if df.empty:
+        return df.assign(creada=pd.Series(dtype=bool))[columnas], rechazos
+    # el hash puede tardar minutos: sin ninguna conexión del pool tomada
+    hashes = hashear(df["contrasena"].tolist(), costo, hilos, progreso)
+    with engine.begin() as conn:
+        df["creada"] = insertar(conn, rol, df, hashes).values
+    return df[columnas], rechazos
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crea cuentas para alumnos o maestros sin usuario.")
+    parser.add_argument("rol", choices=sorted(ROLES))
+    parser.add_argument("--credenciales", help="CSV con id[,usuario][,contrasena] para fijar valores")
+    parser.add_argument("--costo", type=int, default=BCRYPT_COSTO)
+    parser.add_argument("--hilos", type=int, default=HILOS)
+    parser.add_argument("--salida", default="credenciales.csv")
+    args = parser.parse_args()
+    dadas = pd.read_csv(args.credenciales, dtype=str, keep_default_na=False) if args.credenciales else None
+    hoja, rechazos = provisionar(args.rol, dadas, costo=args.costo, hilos=args.hilos,
+                                 progreso=lambda n, t: print(f"\r{n}/{t} contraseñas", end="", flush=True))
+    print()
+    hoja.to_csv(args.salida, index=False)
+    print(f"{int(hoja['creada'].sum())} cuentas creadas, {int((~hoja['creada']).sum())} omitidas. Hoja: {args.salida}")
+    for r in rechazos.itertuples():
+        print(f"fila {r.fila} (id {r.id}): {r.motivo}")
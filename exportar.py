@@ -0,0 +1,140 @@
+import csv
+import gzip
+import io
+
+import sqlalchemy
+from sqlalchemy import text
+
+# =========================
+# EXPORTACIONES BAJO DEMANDA
+# =========================
+# Se generan solo cuando se piden y se escriben por bloques a un archivo
+# (normalmente un TemporaryFile): en Postgres el CSV sale con COPY TO STDOUT,
+# en el resto se lee con cursor del lado del servidor (stream_results).
+TABLAS = {
+    "alumnos": "SELECT * FROM alumnos ORDER BY matricula",
+    "maestros": "SELECT * FROM maestros ORDER BY maestroid",
+    "materias": "SELECT * FROM materias ORDER BY materiaid",
+    "asistencias": "SELECT * FROM asistencias {where} ORDER BY fecha, asistenciaid",
+}
+FORMATOS = {
+    # nombre: (extensión, mime)
+    "csv": ("csv", "text/csv"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+TAMANO_LOTE = 5000
+
+
+def _consulta(tabla, desde=None, hasta=None):
+    if tabla not in TABLAS:
+        raise ValueError(f"Tabla no exportable: {tabla}")
+    where = []
+    params = {}
+    if tabla == "asistencias":
+        if desde:
+            where.append("fecha >= :desde")
+            params["desde"] = desde
+        if hasta:
+            where.append("fecha <= :hasta")
+            params["hasta"] = hasta
+    sql = TABLAS[tabla].format(where=("WHERE " + " AND ".join(where)) if where else "")
+    return sql, params
+
+
+def _copy_csv(conn, sql, params, destino):
+    # COPY no acepta parámetros: se renderiza la consulta con mogrify del driver
+    dbapi_conn = conn.connection.dbapi_connection
+    with dbapi_conn.cursor() as cur:
+        sql_pg = text(sql).compile(dialect=conn.dialect)
+        consulta = cur.mogrify(str(sql_pg), sql_pg.construct_params(params)).decode("utf-8")
+        cur.copy_expert(f"COPY ({consulta}) TO STDOUT WITH CSV HEADER", destino)
+        return cur.rowcount
+
+
+def _iterar_lotes(conn, sql, params, tamano_lote):
+    # opciones solo para esta sentencia: Connection.execution_options() cambiaría
+    # la conexión del llamador y sus siguientes DML irían por cursor de servidor
+    resultado = conn.execute(text(sql), params, execution_options={"stream_results": True, "yield_per": tamano_lote})
+    columnas = list(resultado.keys())
+    for lote in resultado.partitions(tamano_lote):
+        yield columnas, lote
+
+
+def _csv_por_lotes(conn, sql, params, destino, tamano_lote):
+    texto = io.TextIOWrapper(destino, encoding="utf-8", newline="", write_through=True)
+    escritor = csv.writer(texto, lineterminator="\n")
+    filas = 0
+    encabezado = False
+    for columnas, lote in _iterar_lotes(conn, sql, params, tamano_lote):
+        if not encabezado:
+            escritor.writerow(columnas)
+            encabezado = True
+        escritor.writerows(lote)
+        filas += len(lote)
+    texto.detach()
+    return filas
+
+
+def _tipo_arrow(pa, tipo):
+    # tipo de columna de SQLAlchemy -> tipo de arrow (texto si no se reconoce)
+    if isinstance(tipo, sqlalchemy.Boolean):
+        return pa.bool_()
+    if isinstance(tipo, sqlalchemy.Integer):
+        return pa.int64()
+    if isinstance(tipo, (sqlalchemy.Float, sqlalchemy.Numeric)):
+        return pa.float64()
+    if isinstance(tipo, sqlalchemy.DateTime):
+        return pa.timestamp("us")
+    if isinstance(tipo, sqlalchemy.Date):
+        return pa.date32()
+    return pa.string()
+
+
+def _esquema_parquet(pa, conn, tabla):
+    # del catálogo, no del primer lote: una columna toda NULL en el primer
+    # lote saldría con tipo null y los lotes siguientes no cabrían. Las
+    # exportaciones son SELECT *: mismo orden de columnas que el catálogo
+    return pa.schema([(c["name"], _tipo_arrow(pa, c["type"])) for c in sqlalchemy.inspect(conn).get_columns(tabla)])
+
+
+def _columna(pa, valores, tipo):
+    try:
+        return pa.array(valores, type=tipo)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # SQLite devuelve fechas como texto ISO: arrow las convierte con cast
+        return pa.array([None if v is None else str(v) for v in valores], type=pa.string()).cast(tipo)
+
+
+def _parquet_por_lotes(conn, tabla, sql, params, destino, tamano_lote):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Para exportar a Parquet instala pyarrow (pip install pyarrow).")
+    # el escritor se crea antes de leer: sin filas el archivo sigue siendo un
+    # Parquet válido (solo el esquema)
+    filas = 0
+    with pq.ParquetWriter(destino, _esquema_parquet(pa, conn, tabla), compression="snappy") as escritor:
+        for _, lote in _iterar_lotes(conn, sql, params, tamano_lote):
+            arreglos = [_columna(pa, [f[i] for f in lote], campo.type) for i, campo in enumerate(escritor.schema)]
+            escritor.write_table(pa.Table.from_arrays(arreglos, schema=escritor.schema))
+            filas += len(lote)
+    return filas
+
+
+def exportar(conn, tabla, destino, formato="csv", desde=None, hasta=None, tamano_lote=TAMANO_LOTE):
+    # escribe la exportación en `destino` (archivo binario) y devuelve las filas
+    sql, params = _consulta(tabla, desde, hasta)
+    if formato == "parquet":
+        filas = _parquet_por_lotes(conn, tabla, sql, params, destino, tamano_lote)
+    else:
+        salida = gzip.GzipFile(fileobj=destino, mode="wb") if formato == "csv.gz" else destino
+        if conn.dialect.name == "postgresql":
+            filas = _copy_csv(conn, sql, params, salida)
+        else:
+            filas = _csv_por_lotes(conn, sql, params, salida, tamano_lote)
+        if salida is not destino:
+            salida.close()
+    conn.commit()
+    return filas
@@ -0,0 +1,51 @@
+import base64
+import os
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+
+from cache import CacheTTL
+
+# =========================
+# IMÁGENES QR
+# =========================
+# Render de QR: caché por URL (los QR rotativos y los reruns repiten la misma URL)
+QR_CORRECCION = os.environ.get("QR_CORRECCION", "M")   # L, M, Q o H
+QR_BOX = int(os.environ.get("QR_BOX", "8"))            # px por módulo (PNG)
+# png (1 bit, ~1 KB) o svg (escala sin pixelarse en el proyector, pero pesa más)
+QR_FORMATO = os.environ.get("QR_FORMATO", "png")
+_NIVELES_QR = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+_cache_qr = CacheTTL("imagenes_qr", max_items=int(os.environ.get("QR_CACHE_MAX", "256")), ttl=0)
+
+
+def _render_qr(url: str, formato: str, correccion: str, box_size: int) -> bytes:
+    qr = qrcode.QRCode(error_correction=_NIVELES_QR.get(correccion.upper(), qrcode.constants.ERROR_CORRECT_M),
+                       box_size=box_size, border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    if formato == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def qr_data_uri(url: str, formato: str = None, correccion: str = None, box_size: int = None) -> str:
+    formato = (formato or QR_FORMATO).lower()
+    correccion = correccion or QR_CORRECCION
+    box_size = box_size or QR_BOX
+    clave = (url, formato, correccion, box_size)
+    uri = _cache_qr.get(clave)
+    if uri is None:
+        mime = "image/svg+xml" if formato == "svg" else "image/png"
+        b64 = base64.b64encode(_render_qr(url, formato, correccion, box_size)).decode("utf-8")
+        uri = f"data:{mime};base64,{b64}"
+        _cache_qr.set(clave, uri)
+    return uri
@@ -0,0 +1,243 @@
+import csv
+import io
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+import referencias
+from db_conexion import get_engine
+
+# =========================
+# IMPORTACIÓN MASIVA (CSV)
+# =========================
+# Carga de inicio de semestre: alumnos, maestros, materias e inscripciones en
+# una sola transacción. La validación se hace por columnas con pandas (sin
+# consultas por fila) y las filas inválidas no se cargan: se devuelven con el
+# motivo para descargarlas como reporte de rechazos. En Postgres se carga con
+# COPY FROM STDIN; en el resto con INSERT de varias filas por lote.
+#
+# Columnas esperadas (las de id son opcionales en las tres primeras; si vienen
+# se respetan para poder referenciarlas desde los otros archivos):
+#   maestros:      [maestroid,] nombre, apellido
+#   alumnos:       [matricula,] nombre, apellido
+#   materias:      [materiaid,] nombre, [descripcion,] maestroid, horario
+#   inscripciones: materiaid, matricula
+TABLAS = {
+    # nombre: (tabla, id, columnas obligatorias, columnas opcionales)
+    "maestros": ("maestros", "maestroid", ["nombre", "apellido"], []),
+    "alumnos": ("alumnos", "matricula", ["nombre", "apellido"], []),
+    "materias": ("materias", "materiaid", ["nombre", "maestroid", "horario"], ["descripcion"]),
+    "inscripciones": ("clase_alumnos", None, ["materiaid", "matricula"], []),
+}
+# orden de carga: las referencias se resuelven contra la base y lo ya importado
+ORDEN = ["maestros", "alumnos", "materias", "inscripciones"]
+TAMANO_LOTE = 1000
+
+
+def leer_csv(archivo):
+    # todo como texto: los tipos se validan después, fila por fila no truena la lectura
+    df = pd.read_csv(archivo, dtype=str, keep_default_na=False, skipinitialspace=True)
+    df.columns = [c.strip().lower() for c in df.columns]
+    df = df.apply(lambda s: s.str.strip())
+    df.insert(0, "fila", range(2, len(df) + 2))   # número de línea en el archivo (con encabezado)
+    return df
+
+
+def _rechazar(df, mascara, motivo, rechazos):
+    # separa las filas marcadas (que aún no tenían motivo) y devuelve el resto
+    malas = df[mascara]
+    if not malas.empty:
+        rechazos.append(malas.assign(motivo=motivo))
+    return df[~mascara]
+
+
+def _enteros(df, columna, rechazos, obligatoria=True):
+    valores = pd.to_numeric(df[columna].where(df[columna] != ""), errors="coerce")
+    malos = valores.isna() if obligatoria else (df[columna] != "") & valores.isna()
+    # "1.5" sí es número, pero no cabe en un id: se rechaza la fila, no la carga
+    malos |= valores.notna() & (valores % 1 != 0)
+    df = _rechazar(df, malos, f"{columna} no es un número", rechazos)
+    return df.assign(**{columna: pd.to_numeric(df[columna].where(df[columna] != ""), errors="coerce").astype("Int64")})
+
+
+def _ids_existentes(conn, tabla, columna):
+    return set(pd.read_sql(text(f"SELECT {columna} FROM {tabla}"), conn)[columna].astype(int))
+
+
+def validar(conn, nombre, df, conocidos, horarios=None):
+    # devuelve (filas válidas, DataFrame de rechazos); `conocidos` acumula los
+    # ids válidos por tabla (base + lo importado antes en la misma carga)
+    tabla, id_col, obligatorias, opcionales = TABLAS[nombre]
+    faltan = [c for c in obligatorias if c not in df.columns]
+    if faltan:
+        raise ValueError(f"{nombre}: faltan columnas {', '.join(faltan)}")
+    rechazos = []
+    for c in opcionales + ([id_col] if id_col else []):
+        if c not in df.columns:
+            df[c] = ""
+
+    if nombre in ("maestros", "alumnos", "materias"):
+        df = _rechazar(df, df["nombre"] == "", "nombre vacío", rechazos)
+        df = _enteros(df, id_col, rechazos, obligatoria=False)
+        existentes = conocidos.setdefault(tabla, _ids_existentes(conn, tabla, id_col))
+        con_id = df[id_col].notna()
+        df = _rechazar(df, con_id & df[id_col].isin(existentes), f"{id_col} ya existe", rechazos)
+        df = _rechazar(df, df[id_col].notna() & df.duplicated(id_col, keep="first"), f"{id_col} repetido en el archivo", rechazos)
+
+    if nombre == "materias":
+        df = _enteros(df, "maestroid", rechazos)
+        maestros = conocidos.setdefault("maestros", _ids_existentes(conn, "maestros", "maestroid"))
+        df = _rechazar(df, ~df["maestroid"].isin(maestros), "maestroid no existe", rechazos)
+        if horarios:
+            df = _rechazar(df, ~df["horario"].isin(horarios), "horario no válido", rechazos)
+        # un maestro no puede tener dos clases en el mismo horario: ni contra la base ni dentro del archivo
+        ocupados = pd.read_sql(text("SELECT maestroid, horario FROM materias WHERE maestroid IS NOT NULL"), conn)
+        ocupados = set(zip(ocupados["maestroid"].astype(int), ocupados["horario"]))
+        par = pd.MultiIndex.from_arrays([df["maestroid"].astype(int), df["horario"]])
+        df = _rechazar(df, par.isin(list(ocupados)), "el maestro ya tiene clase en ese horario", rechazos)
+        df = _rechazar(df, df.duplicated(["maestroid", "horario"], keep="first"), "horario repetido para el maestro en el archivo", rechazos)
+
+    if nombre == "inscripciones":
+        df = _enteros(df, "materiaid", rechazos)
+        df = _enteros(df, "matricula", rechazos)
+        materias = conocidos.setdefault("materias", _ids_existentes(conn, "materias", "materiaid"))
+        alumnos = conocidos.setdefault("alumnos", _ids_existentes(conn, "alumnos", "matricula"))
+        df = _rechazar(df, ~df["materiaid"].isin(materias), "materiaid no existe", rechazos)
+        df = _rechazar(df, ~df["matricula"].isin(alumnos), "matricula no existe", rechazos)
+        actuales = pd.read_sql(text("SELECT materiaid, matricula FROM clase_alumnos"), conn)
+        actuales = set(zip(actuales["materiaid"].astype(int), actuales["matricula"].astype(int)))
+        par = pd.MultiIndex.from_arrays([df["materiaid"].astype(int), df["matricula"].astype(int)])
+        df = _rechazar(df, par.isin(list(actuales)), "ya estaba inscrito", rechazos)
+        df = _rechazar(df, df.duplicated(["materiaid", "matricula"], keep="first"), "inscripción repetida en el archivo", rechazos)
+
+    rechazados = pd.concat(rechazos, ignore_index=True) if rechazos else pd.DataFrame(columns=["fila", "motivo"])
+    return df, rechazados
+
+
+def _columnas(nombre, df):
+    tabla, id_col, obligatorias, opcionales = TABLAS[nombre]
+    columnas = obligatorias + opcionales
+    # si unas filas traen id y otras no, se cargan en dos grupos
+    if id_col:
+        return [(df[df[id_col].notna()], [id_col] + columnas), (df[df[id_col].isna()], columnas)]
+    return [(df, columnas)]
+
+
+def _copy(conn, tabla, columnas, df):
+    buf = io.StringIO()
+    df[columnas].to_csv(buf, index=False, header=False, na_rep="")
+    buf.seek(0)
+    with conn.connection.dbapi_connection.cursor() as cur:
+        cur.copy_expert(f"COPY {tabla} ({', '.join(columnas)}) FROM STDIN WITH CSV", buf)
+
+
+def _insert_lotes(conn, tabla, columnas, df):
+    datos = df[columnas].astype(object)
+    filas = datos.where(datos.notna() & (datos != ""), None).to_dict("records")
+    for i in range(0, len(filas), TAMANO_LOTE):
+        lote = filas[i:i + TAMANO_LOTE]
+        valores = []
+        params = {}
+        for k, fila in enumerate(lote):
+            valores.append("(" + ", ".join(f":{c}{k}" for c in columnas) + ")")
+            params.update({f"{c}{k}": v for c, v in fila.items()})
+        conn.execute(text(f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES {', '.join(valores)}"), params)
+
+
+def _cargar(conn, nombre, df):
+    tabla, id_col, _, _ = TABLAS[nombre]
+    es_pg = conn.dialect.name == "postgresql"
+    total = 0
+    for parte, columnas in _columnas(nombre, df):
+        if parte.empty:
+            continue
+        if es_pg:
+            _copy(conn, tabla, columnas, parte)
+        else:
+            _insert_lotes(conn, tabla, columnas, parte)
+        total += len(parte)
+        if es_pg and id_col in columnas:
+            # los ids explícitos no avanzan la secuencia del SERIAL
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{tabla}', '{id_col}'), (SELECT MAX({id_col}) FROM {tabla}))"))
+    return total
+
+
+def _ids_nuevos(conn, tabla, id_col, validas, existentes):
+    # ids que la carga real daría a las filas sin id: se insertan después de
+    # las que traen id (ver _columnas y el setval de _cargar). Solo se leen las
+    # secuencias, sin avanzarlas
+    n = int(validas[id_col].isna().sum())
+    if not n:
+        return set()
+    maximo = max(existentes | set(validas[id_col].dropna().astype(int)), default=0)
+    if conn.dialect.name == "postgresql":
+        if validas[id_col].notna().any():
+            inicio = maximo + 1
+        else:
+            secuencia = conn.execute(text(f"SELECT pg_get_serial_sequence('{tabla}', '{id_col}')")).scalar()
+            ultimo, usado = conn.execute(text(f"SELECT last_value, is_called FROM {secuencia}")).fetchone()
+            inicio = ultimo + 1 if usado else ultimo
+    else:
+        # AUTOINCREMENT de SQLite: el mayor entre lo ya asignado y el máximo de la tabla
+        seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :t"), {"t": tabla}).scalar()
+        inicio = max(seq or 0, maximo) + 1
+    return set(range(inicio, inicio + n))
+
+
+def importar(archivos, horarios=None, engine=None, simular=False):
+    # archivos: {nombre: archivo o ruta CSV}. Todo o nada: si algo falla en la
+    # carga no queda nada a medias. Devuelve {nombre: {"cargadas", "rechazos"}}.
+    desconocidos = set(archivos) - set(TABLAS)
+    if desconocidos:
+        raise ValueError(f"Archivos no reconocidos: {', '.join(sorted(desconocidos))}")
+    engine = engine or get_engine()
+    resultado = {}
+    with engine.begin() as conn:
+        conocidos = {}
+        for nombre in ORDEN:
+            if nombre not in archivos:
+                continue
+            validas, rechazos = validar(conn, nombre, leer_csv(archivos[nombre]), conocidos, horarios)
+            cargadas = 0 if simular else _cargar(conn, nombre, validas)
+            # los ids recién cargados quedan disponibles para los archivos siguientes
+            tabla, id_col, _, _ = TABLAS[nombre]
+            if id_col:
+                if simular:
+                    # las filas sin id también se pueden referenciar: con el id
+                    # que les tocaría al cargarse
+                    conocidos[tabla] |= (set(validas[id_col].dropna().astype(int))
+                                         | _ids_nuevos(conn, tabla, id_col, validas, conocidos[tabla]))
+                else:
+                    conocidos[tabla] = _ids_existentes(conn, tabla, id_col)
+            resultado[nombre] = {"cargadas": cargadas, "validas": len(validas), "rechazos": rechazos}
+        if simular:
+            conn.rollback()
+    return resultado
+
+
+def reporte_rechazos(resultado):
+    # todos los rechazos en un solo CSV: archivo, fila, motivo y columnas originales
+    partes = [r["rechazos"].sort_values("fila").assign(archivo=nombre)
+              for nombre, r in resultado.items() if not r["rechazos"].empty]
+    if not partes:
+        return None
+    df = pd.concat(partes, ignore_index=True)
+    primeras = ["archivo", "fila", "motivo"]
+    return df[primeras + [c for c in df.columns if c not in primeras]]
+
+
+if __name__ == "__main__":
+    # python importar.py maestros=maestros.csv alumnos=alumnos.csv ...
+    archivos = dict(arg.split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+    if not archivos:
+        print("Uso: python importar.py [--simular] maestros=archivo.csv alumnos=... materias=... inscripciones=...")
+        sys.exit(1)
+    # mismas reglas que la app: solo horarios del catálogo
+    res = importar(archivos, horarios=referencias.HORARIOS, simular="--simular" in sys.argv)
+    for nombre, r in res.items():
+        print(f"{nombre}: {r['cargadas']} cargadas, {len(r['rechazos'])} rechazadas")
+    rep = reporte_rechazos(res)
+    if rep is not None:
+        rep.to_csv("rechazos_importacion.csv", index=False, quoting=csv.QUOTE_MINIMAL)
+        print("Detalle en rechazos_importacion.csv")
@@ -0,0 +1,144 @@
+import datetime
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+import asistencia_qr
+from db_conexion import get_engine
+
+# =========================
+# BARRIDO DE TOKENS QR
+# =========================
+# Desactiva tokens expirados por lotes, archiva (o borra) los inactivos más
+# viejos que la retención y purga la denylist de tokens firmados. Corre en un
+# hilo de fondo de la app o por cron: python limpieza_tokens.py
+INTERVALO = int(os.environ.get("QR_BARRIDO_SEG", "300"))
+LOTE = int(os.environ.get("QR_BARRIDO_LOTE", "500"))
+RETENCION_DIAS = int(os.environ.get("QR_RETENCION_DIAS", "30"))
+ARCHIVAR = os.environ.get("QR_ARCHIVAR", "1").lower() in ("1", "true", "si", "sí")
+
+# id arbitrario para pg_try_advisory_xact_lock: un solo barrido a la vez entre
+# procesos. Se toma por lote (transacción) y se suelta con su commit/rollback:
+# un lock de sesión sostenido entre commits no sirve detrás de PgBouncer en
+# modo transacción (el unlock puede caer en otra conexión del servidor)
+_LOCK_BARRIDO = 724002
+
+_COLUMNAS = "id, token, materiaid, maestroid, fecha_creacion, expiracion, activo, single_use"
+
+ultimo_barrido = {}
+
+
+def _turno(conn):
+    # False si otro proceso tiene el lote en curso; la transacción queda abierta
+    # hasta el commit del lote
+    if conn.dialect.name != "postgresql":
+        return True
+    if conn.execute(text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _LOCK_BARRIDO}).scalar():
+        return True
+    conn.rollback()
+    return False
+
+
+def desactivar_expirados(conn, lote=LOTE, ahora=None, maestroid=None):
+    # devuelve cuántos se desactivaron, o None si otro proceso está barriendo
+    # y no se pudo correr ni un lote. Las expiraciones se guardan en UTC: se
+    # compara contra utcnow(), no NOW()
+    ahora = ahora or datetime.datetime.utcnow()
+    filtro = "" if maestroid is None else "AND maestroid = :ma"
+    total = 0
+    if not _turno(conn):
+        return None
+    while True:
+        n = conn.execute(text(f"""
+            UPDATE qr_tokens SET activo = FALSE
+            WHERE id IN (
+                SELECT id FROM qr_tokens
+                WHERE activo = TRUE AND expiracion <= :ahora {filtro}
+                LIMIT :n
+            )
+        """), {"ahora": ahora, "n": lote, "ma": maestroid}).rowcount
+        conn.commit()
+        total += n
+        if n < lote or not _turno(conn):
+            break
+    if total:
+        asistencia_qr.invalidar_tokens(maestroid=maestroid, solo_expirados=True)
+    return total
+
+
+def purgar_antiguos(conn, dias=RETENCION_DIAS, archivar=ARCHIVAR, lote=LOTE):
+    limite = datetime.datetime.utcnow() - datetime.timedelta(days=dias)
+    total = 0
+    while _turno(conn):
+        ids = [f[0] for f in conn.execute(text("""
+            SELECT id FROM qr_tokens
+            WHERE activo = FALSE AND fecha_creacion < :lim
+            LIMIT :n
+        """), {"lim": limite, "n": lote}).fetchall()]
+        if not ids:
+            conn.rollback()
+            break
+        params = {f"i{k}": v for k, v in enumerate(ids)}
+        en_ids = ", ".join(f":{k}" for k in params)
+        if archivar:
+            conn.execute(text(f"""
+                INSERT INTO qr_tokens_archivo ({_COLUMNAS})
+                SELECT {_COLUMNAS} FROM qr_tokens WHERE id IN ({en_ids})
+                ON CONFLICT (id) DO NOTHING
+            """), params)
+        conn.execute(text(f"DELETE FROM qr_tokens WHERE id IN ({en_ids})"), params)
+        conn.commit()
+        total += len(ids)
+        if len(ids) < lote:
+            break
+    return total
+
+
+def purgar_revocados(conn):
+    if not _turno(conn):
+        return 0
+    n = conn.execute(text("DELETE FROM qr_revocados WHERE expira < :ahora"),
+                     {"ahora": datetime.datetime.utcnow()}).rowcount
+    conn.commit()
+    return n
+
+
+def barrer(engine=None):
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        if not _turno(conn):
+            return None   # otro proceso está barriendo
+        conn.rollback()
+        # cada lote vuelve a tomar el lock; si falla, su rollback lo suelta
+        inicio = time.perf_counter()
+        resultado = {
+            "desactivados": desactivar_expirados(conn),
+            "archivados" if ARCHIVAR else "borrados": purgar_antiguos(conn),
+            "revocados_purgados": purgar_revocados(conn),
+        }
+        resultado["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        resultado["fecha"] = datetime.datetime.utcnow().isoformat(timespec="seconds")
+    ultimo_barrido.clear()
+    ultimo_barrido.update(resultado)
+    return resultado
+
+
+def _ciclo(intervalo):
+    while True:
+        try:
+            barrer()
+        except Exception as e:
+            ultimo_barrido["error"] = str(e)
+        time.sleep(intervalo)
+
+
+def iniciar_barrido(intervalo=INTERVALO):
+    hilo = threading.Thread(target=_ciclo, args=(intervalo,), name="barrido-tokens-qr", daemon=True)
+    hilo.start()
+    return hilo
+
+
+if __name__ == "__main__":
+    print(barrer())
@@ -0,0 +1,237 @@
+import collections
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+# =========================
+# MÉTRICAS DE CONSULTAS SQL
+# =========================
+# Eventos de SQLAlchemy alrededor de cada cursor.execute: latencia, filas y
+# sitio de llamada (archivo:línea fuera de sqlalchemy/pandas) por sentencia.
+# Las sentencias se agrupan por su texto normalizado (los VALUES de los INSERT
+# por lotes cuentan como uno). Lo que supere SQL_LENTA_MS va al log
+# "sql_lento" (y a SQL_LENTA_LOG si está definida).
+# El costo por consulta es un par de perf_counter y un diccionario: pensado
+# para dejarse encendido. SQL_METRICAS=0 lo apaga.
+ACTIVO = os.environ.get("SQL_METRICAS", "1").lower() in ("1", "true", "si", "sí")
+LENTA_MS = float(os.environ.get("SQL_LENTA_MS", "500"))
+MAX_SENTENCIAS = 500
+MUESTRAS = 256          # latencias recientes por sentencia para los percentiles
+MAX_SITIOS = 5
+MAX_LENTAS = 200
+
+log_lentas = logging.getLogger("sql_lento")
+if os.environ.get("SQL_LENTA_LOG"):
+    _manejador = logging.FileHandler(os.environ["SQL_LENTA_LOG"], encoding="utf-8")
+    _manejador.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    log_lentas.addHandler(_manejador)
+    log_lentas.setLevel(logging.WARNING)
+
+_lock = threading.Lock()
+_sentencias = {}        # texto normalizado -> estadísticas
+_lentas = collections.deque(maxlen=MAX_LENTAS)
+_paginas = {}           # nombre de página -> estadísticas de render
+_normalizadas = {}      # texto crudo -> normalizado (acotado)
+_hilo = threading.local()
+
+_PARAM_NUMERADO = re.compile(r"(%\(|:)([A-Za-z_]+?)\d+\b")
+_GRUPO_REPETIDO = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+_ESPACIOS = re.compile(r"\s+")
+_ES_SELECT = re.compile(r"\(?\s*(SELECT|WITH)\b", re.IGNORECASE)
+# un WITH puede llevar INSERT/UPDATE/DELETE (el check-in de Postgres) y un
+# SELECT puede tener efectos (setval, advisory locks): esas no se guardan
+_ESCRITURA = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|CREATE|DROP|ALTER|INTO|COPY|CALL)\b"
+                        r"|\b(nextval|setval|pg_\w*advisory\w*)\s*\(", re.IGNORECASE)
+# marcos que no cuentan como "sitio de llamada"
+_AJENOS = (os.sep + "sqlalchemy" + os.sep, os.sep + "pandas" + os.sep, os.sep + "streamlit" + os.sep,
+           "site-packages", "<frozen", os.path.abspath(__file__), os.sep + "db_conexion.py")
+
+
+def normalizar(sentencia):
+    cached = _normalizadas.get(sentencia)
+    if cached is not None:
+        return cached
+    texto = _ESPACIOS.sub(" ", sentencia).strip()
+    # (:u0, :p0), (:u1, :p1) ... -> (:u, :p), ...
+    texto = _GRUPO_REPETIDO.sub(r"\1, ...", _PARAM_NUMERADO.sub(r"\1\2", texto))
+    if len(_normalizadas) < 4 * MAX_SENTENCIAS and len(sentencia) < 4000:
+        _normalizadas[sentencia] = texto
+    return texto
+
+
+_ajeno = {}             # archivo -> bool
+
+
+def _sitio():
+    marco = sys._getframe(1)
+    while marco is not None:
+        archivo = marco.f_code.co_filename
+        ajeno = _ajeno.get(archivo)
+        if ajeno is None:
+            ajeno = _ajeno[archivo] = any(a in archivo for a in _AJENOS)
+        if not ajeno:
+            return f"{os.path.basename(archivo)}:{marco.f_lineno} {marco.f_code.co_name}"
+        marco = marco.f_back
+    return "?"
+
+
+def _solo_lectura(sentencia):
+    return _ES_SELECT.match(sentencia) is not None and _ESCRITURA.search(sentencia) is None
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metricas_inicio = time.perf_counter()
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_metricas_inicio", None)
+    if inicio is None:
+        return
+    ms = (time.perf_counter() - inicio) * 1000
+    filas = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+    clave = normalizar(statement)
+    sitio = _sitio()
+    es_select = _solo_lectura(clave)
+    with _lock:
+        s = _sentencias.get(clave)
+        if s is None:
+            if len(_sentencias) >= MAX_SENTENCIAS:
+                clave = "(otras sentencias)"
+                s = _sentencias.get(clave)
+            if s is None:
+                s = _sentencias[clave] = {"llamadas": 0, "total_ms": 0.0, "max_ms": 0.0, "filas": 0,
+                                          "muestras": collections.deque(maxlen=MUESTRAS),
+                                          "sitios": collections.Counter(), "ejemplo": None}
+        s["llamadas"] += 1
+        s["total_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+        s["filas"] += filas or 0
+        s["muestras"].append(ms)
+        if sitio in s["sitios"] or len(s["sitios"]) < MAX_SITIOS:
+            s["sitios"][sitio] += 1
+        # solo de consultas de lectura se guarda un ejemplo con parámetros (para
+        # el EXPLAIN); así no quedan en memoria hashes ni datos de escrituras
+        if es_select and not executemany and len(statement) < 20000:
+            s["ejemplo"] = (statement, parameters)
+    pagina = getattr(_hilo, "pagina", None)
+    if pagina is not None:
+        pagina["consultas"] += 1
+        pagina["sql_ms"] += ms
+    if ms >= LENTA_MS:
+        _lentas.append({"cuando": time.strftime("%Y-%m-%d %H:%M:%S"), "ms": round(ms, 1), "filas": filas,
+                        "sitio": sitio, "sentencia": clave[:500]})
+        log_lentas.warning("%.0f ms filas=%s %s | %s", ms, filas, sitio, clave[:500])
+
+
+def instrumentar(engine):
+    if not ACTIVO:
+        return engine
+    event.listen(engine, "before_cursor_execute", _antes)
+    event.listen(engine, "after_cursor_execute", _despues)
+    return engine
+
+
+# --- tiempo de render por página (opción del menú) ---
+
+def iniciar_pagina(nombre):
+    # las consultas de este hilo se suman a la página hasta terminar_pagina()
+    _hilo.pagina = {"nombre": nombre, "inicio": time.perf_counter(), "consultas": 0, "sql_ms": 0.0}
+
+
+def terminar_pagina():
+    pagina = getattr(_hilo, "pagina", None)
+    _hilo.pagina = None
+    if pagina is None:
+        return
+    ms = (time.perf_counter() - pagina["inicio"]) * 1000
+    with _lock:
+        p = _paginas.setdefault(pagina["nombre"], {"renders": 0, "total_ms": 0.0, "sql_ms": 0.0, "consultas": 0,
+                                                   "muestras": collections.deque(maxlen=MUESTRAS)})
+        p["renders"] += 1
+        p["total_ms"] += ms
+        p["sql_ms"] += pagina["sql_ms"]
+        p["consultas"] += pagina["consultas"]
+        p["muestras"].append(ms)
+
+
+# --- lectura ---
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, int(round((len(orden) - 1) * p / 100)))]
+
+
+def sentencias():
+    # una fila por sentencia normalizada
+    with _lock:
+        copia = [(k, dict(v, muestras=list(v["muestras"]), sitios=v["sitios"].most_common()))
+                 for k, v in _sentencias.items()]
+    filas = []
+    for clave, s in copia:
+        filas.append({
+            "sentencia": clave,
+            "llamadas": s["llamadas"],
+            "total_ms": round(s["total_ms"], 1),
+            "prom_ms": round(s["total_ms"] / s["llamadas"], 2),
+            "p95_ms": round(_percentil(s["muestras"], 95), 2),
+            "max_ms": round(s["max_ms"], 1),
+            "filas": s["filas"],
+            "sitios": ", ".join(f"{sitio} ({n})" for sitio, n in s["sitios"]),
+            "explicable": s["ejemplo"] is not None,
+        })
+    return filas
+
+
+def paginas():
+    with _lock:
+        copia = [(k, dict(v, muestras=list(v["muestras"]))) for k, v in _paginas.items()]
+    return [{
+        "pagina": nombre,
+        "renders": p["renders"],
+        "prom_ms": round(p["total_ms"] / p["renders"], 1),
+        "p95_ms": round(_percentil(p["muestras"], 95), 1),
+        "sql_prom_ms": round(p["sql_ms"] / p["renders"], 1),
+        "consultas_prom": round(p["consultas"] / p["renders"], 1),
+    } for nombre, p in copia]
+
+
+def lentas():
+    return list(reversed(_lentas))
+
+
+def reiniciar():
+    with _lock:
+        _sentencias.clear()
+        _paginas.clear()
+        _lentas.clear()
+
+
+def explicar(conn, clave, analizar=False):
+    # plan de la última ejecución registrada de la sentencia (solo lectura).
+    # ANALYZE la vuelve a ejecutar: se hace dentro de una transacción que se
+    # revierte, y nunca sobre algo que escriba
+    with _lock:
+        s = _sentencias.get(clave)
+        ejemplo = s and s["ejemplo"]
+    if not ejemplo or not _solo_lectura(normalizar(ejemplo[0])):
+        return None
+    statement, parameters = ejemplo
+    if conn.dialect.name == "postgresql":
+        prefijo = "EXPLAIN (ANALYZE, BUFFERS) " if analizar else "EXPLAIN "
+    else:
+        prefijo = "EXPLAIN QUERY PLAN "
+    try:
+        filas = conn.exec_driver_sql(prefijo + statement, parameters).fetchall()
+    finally:
+        conn.rollback()
+    if conn.dialect.name == "postgresql":
+        return "\n".join(f[0] for f in filas)
+    return "\n".join(str(f[-1]) for f in filas)
@@ -0,0 +1,351 @@
+import logging
+import sys
+
+import sqlalchemy
+from sqlalchemy import text
+
+from db_conexion import get_engine
+
+# =========================
+# MIGRACIONES VERSIONADAS
+# =========================
+# Cada migración se aplica una sola vez y queda registrada en schema_migraciones.
+# Se ejecutan en el deploy (python migraciones.py); la app solo revisa la versión
+# al arrancar el proceso. Nunca edites una migración ya publicada: agrega otra.
+#
+# Una sentencia puede ser un str (todas las bases) o un dict por dialecto
+# ({"postgresql": "..."}) cuando solo aplica a uno.
+
+MIGRACIONES = [
+    (1, "esquema base", [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios (
+            usuarioid SERIAL PRIMARY KEY,
+            nombreusuario VARCHAR(80) UNIQUE NOT NULL,
+            contrasena TEXT NOT NULL,
+            rol VARCHAR(20),
+            maestroid INT,
+            matricula INT
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS alumnos (
+            matricula SERIAL PRIMARY KEY,
+            nombre VARCHAR(80),
+            apellido VARCHAR(80)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS maestros (
+            maestroid SERIAL PRIMARY KEY,
+            nombre VARCHAR(80),
+            apellido VARCHAR(80)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS materias (
+            materiaid SERIAL PRIMARY KEY,
+            nombre VARCHAR(120),
+            descripcion TEXT,
+            maestroid INT,
+            horario VARCHAR(50)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS clase_alumnos (
+            id SERIAL PRIMARY KEY,
+            materiaid INT NOT NULL,
+            matricula INT NOT NULL,
+            UNIQUE (materiaid, matricula)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS asistencias (
+            asistenciaid SERIAL PRIMARY KEY,
+            matricula INT,
+            maestroid INT,
+            materiaid INT,
+            fecha DATE,
+            estado VARCHAR(20)
+        )""",
+        """
+        CREATE TABLE IF NOT EXISTS qr_tokens (
+            id SERIAL PRIMARY KEY,
+            token VARCHAR(80) UNIQUE NOT NULL,
+            materiaid INT,
+            maestroid INT,
+            fecha_creacion TIMESTAMP DEFAULT NOW(),
+            expiracion TIMESTAMP,
+            activo BOOLEAN DEFAULT TRUE,
+            single_use BOOLEAN DEFAULT FALSE
+        )""",
+        # columnas agregadas a bases creadas con versiones viejas del script
+        {"postgresql": "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS maestroid INT"},
+        {"postgresql": "ALTER TABLE usuarios ADD COLUMN IF NOT EXISTS matricula INT"},
+        {"postgresql": "ALTER TABLE materias ADD COLUMN IF NOT EXISTS maestroid INT"},
+        {"postgresql": "ALTER TABLE materias ADD COLUMN IF NOT EXISTS horario VARCHAR(50)"},
+        {"postgresql": "ALTER TABLE asistencias ADD COLUMN IF NOT EXISTS maestroid INT"},
+        {"postgresql": "ALTER TABLE asistencias ADD COLUMN IF NOT EXISTS materiaid INT"},
+        {"postgresql": "ALTER TABLE qr_tokens ADD COLUMN IF NOT EXISTS single_use BOOLEAN DEFAULT FALSE"},
+    ]),
+    (2, "índices y unicidad de asistencias", [
+        # duplicados previos del mismo (alumno, materia, día): se conserva el
+        # estado más informativo (Presente > Retardo > Ausente > otro; a
+        # igualdad, el primero) y los demás se mueven a asistencias_descartadas
+        # con el id del que se quedó, para poder revisarlos
+        """
+        CREATE TABLE IF NOT EXISTS asistencias_descartadas (
+            asistenciaid INT PRIMARY KEY,
+            matricula INT,
+            maestroid INT,
+            materiaid INT,
+            fecha DATE,
+            estado VARCHAR(20),
+            conservada INT,
+            descartada TIMESTAMP DEFAULT NOW()
+        )""",
+        """
+        INSERT INTO asistencias_descartadas (asistenciaid, matricula, maestroid, materiaid, fecha, estado, conservada)
+        SELECT asistenciaid, matricula, maestroid, materiaid, fecha, estado, conservada
+        FROM (
+            SELECT a.*,
+                   ROW_NUMBER() OVER w AS orden,
+                   FIRST_VALUE(asistenciaid) OVER w AS conservada
+            FROM asistencias a
+            WHERE matricula IS NOT NULL AND materiaid IS NOT NULL AND fecha IS NOT NULL
+            WINDOW w AS (
+                PARTITION BY matricula, materiaid, fecha
+                ORDER BY CASE estado WHEN 'Presente' THEN 0 WHEN 'Retardo' THEN 1 WHEN 'Ausente' THEN 2 ELSE 3 END,
+                         asistenciaid
+            )
+        ) d
+        WHERE orden > 1""",
+        "DELETE FROM asistencias WHERE asistenciaid IN (SELECT asistenciaid FROM asistencias_descartadas)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_asistencias_alumno_materia_fecha ON asistencias (matricula, materiaid, fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_asistencias_maestro_fecha ON asistencias (maestroid, fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_asistencias_materia_fecha ON asistencias (materiaid, fecha)",
+        "CREATE INDEX IF NOT EXISTS ix_materias_maestro_horario ON materias (maestroid, horario)",
+        "CREATE INDEX IF NOT EXISTS ix_qr_tokens_maestro_creacion ON qr_tokens (maestroid, fecha_creacion)",
+        "CREATE INDEX IF NOT EXISTS ix_clase_alumnos_matricula ON clase_alumnos (matricula)",
+        "CREATE INDEX IF NOT EXISTS ix_usuarios_matricula ON usuarios (matricula)",
+        "CREATE INDEX IF NOT EXISTS ix_usuarios_maestroid ON usuarios (maestroid)",
+    ]),
+    (3, "denylist de tokens QR firmados", [
+        # huella = MAC del token (single-use consumido) o 's:' + sesión revocada
+        """
+        CREATE TABLE IF NOT EXISTS qr_revocados (
+            huella VARCHAR(64) PRIMARY KEY,
+            materiaid INT,
+            expira TIMESTAMP NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_qr_revocados_expira ON qr_revocados (expira)",
+    ]),
+    (4, "archivo de tokens QR e índices parciales de activos", [
+        """
+        CREATE TABLE IF NOT EXISTS qr_tokens_archivo (
+            id INT PRIMARY KEY,
+            token VARCHAR(80),
+            materiaid INT,
+            maestroid INT,
+            fecha_creacion TIMESTAMP,
+            expiracion TIMESTAMP,
+            activo BOOLEAN,
+            single_use BOOLEAN
+        )""",
+        # el escaneo y el barrido solo tocan el conjunto (pequeño) de tokens activos
+        "CREATE INDEX IF NOT EXISTS ix_qr_tokens_activos ON qr_tokens (token) WHERE activo = TRUE",
+        "CREATE INDEX IF NOT EXISTS ix_qr_tokens_activos_expiracion ON qr_tokens (expiracion) WHERE activo = TRUE",
+        "CREATE INDEX IF NOT EXISTS ix_qr_tokens_creacion ON qr_tokens (fecha_creacion)",
+    ]),
+    (5, "índices para paginar asistencias por (fecha, asistenciaid)", [
+        "CREATE INDEX IF NOT EXISTS ix_asistencias_fecha_id ON asistencias (fecha, asistenciaid)",
+        "CREATE INDEX IF NOT EXISTS ix_asistencias_maestro_fecha_id ON asistencias (maestroid, fecha, asistenciaid)",
+        "DROP INDEX IF EXISTS ix_asistencias_maestro_fecha",
+    ]),
+    (6, "rollup diario de asistencias mantenido por triggers", [
+        # materiaid/maestroid NULL se guardan como 0 y estado NULL como ''.
+        # Las filas que bajan a cnt = 0 se quedan (no estorban en los SUM);
+        # python rollups.py --reconstruir las limpia.
+        """
+        CREATE TABLE IF NOT EXISTS asistencias_diarias (
+            fecha DATE NOT NULL,
+            materiaid INT NOT NULL,
+            maestroid INT NOT NULL,
+            estado VARCHAR(20) NOT NULL,
+            cnt INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, materiaid, maestroid, estado)
+        )""",
+        # Postgres: triggers por sentencia con tablas de transición, así un
+        # INSERT de muchas filas (lotes, pase de lista) hace un solo upsert agrupado
+        {"postgresql": """
+        CREATE OR REPLACE FUNCTION rollup_asistencias() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE asistencias_diarias d SET cnt = d.cnt - v.cnt
+                FROM (
+                    SELECT fecha, COALESCE(materiaid, 0) AS materiaid, COALESCE(maestroid, 0) AS maestroid,
+                           COALESCE(estado, '') AS estado, COUNT(*) AS cnt
+                    FROM viejas WHERE fecha IS NOT NULL
+                    GROUP BY 1, 2, 3, 4
+                ) v
+                WHERE d.fecha = v.fecha AND d.materiaid = v.materiaid
+                  AND d.maestroid = v.maestroid AND d.estado = v.estado;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO asistencias_diarias (fecha, materiaid, maestroid, estado, cnt)
+                SELECT fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, ''), COUNT(*)
+                FROM nuevas WHERE fecha IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (fecha, materiaid, maestroid, estado)
+                DO UPDATE SET cnt = asistencias_diarias.cnt + EXCLUDED.cnt;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql"""},
+        {"postgresql": """
+        CREATE TRIGGER tr_rollup_asistencias_ins AFTER INSERT ON asistencias
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_asistencias()"""},
+        {"postgresql": """
+        CREATE TRIGGER tr_rollup_asistencias_del AFTER DELETE ON asistencias
+        REFERENCING OLD TABLE AS viejas
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_asistencias()"""},
+        {"postgresql": """
+        CREATE TRIGGER tr_rollup_asistencias_upd AFTER UPDATE ON asistencias
+        REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION rollup_asistencias()"""},
+        # SQLite (pruebas locales): triggers por fila
+        {"sqlite": """
+        CREATE TRIGGER IF NOT EXISTS tr_rollup_asistencias_ins AFTER INSERT ON asistencias
+        WHEN NEW.fecha IS NOT NULL
+        BEGIN
+            INSERT INTO asistencias_diarias (fecha, materiaid, maestroid, estado, cnt)
+            VALUES (NEW.fecha, COALESCE(NEW.materiaid, 0), COALESCE(NEW.maestroid, 0), COALESCE(NEW.estado, ''), 1)
+            ON CONFLICT (fecha, materiaid, maestroid, estado) DO UPDATE SET cnt = cnt + 1;
+        END"""},
+        {"sqlite": """
+        CREATE TRIGGER IF NOT EXISTS tr_rollup_asistencias_del AFTER DELETE ON asistencias
+        WHEN OLD.fecha IS NOT NULL
+        BEGIN
+            UPDATE asistencias_diarias SET cnt = cnt - 1
+            WHERE fecha = OLD.fecha AND materiaid = COALESCE(OLD.materiaid, 0)
+              AND maestroid = COALESCE(OLD.maestroid, 0) AND estado = COALESCE(OLD.estado, '');
+        END"""},
+        {"sqlite": """
+        CREATE TRIGGER IF NOT EXISTS tr_rollup_asistencias_upd AFTER UPDATE ON asistencias
+        BEGIN
+            UPDATE asistencias_diarias SET cnt = cnt - 1
+            WHERE OLD.fecha IS NOT NULL AND fecha = OLD.fecha AND materiaid = COALESCE(OLD.materiaid, 0)
+              AND maestroid = COALESCE(OLD.maestroid, 0) AND estado = COALESCE(OLD.estado, '');
+            INSERT INTO asistencias_diarias (fecha, materiaid, maestroid, estado, cnt)
+            SELECT NEW.fecha, COALESCE(NEW.materiaid, 0), COALESCE(NEW.maestroid, 0), COALESCE(NEW.estado, ''), 1
+            WHERE NEW.fecha IS NOT NULL
+            ON CONFLICT (fecha, materiaid, maestroid, estado) DO UPDATE SET cnt = cnt + 1;
+        END"""},
+        # backfill inicial
+        "DELETE FROM asistencias_diarias",
+        """
+        INSERT INTO asistencias_diarias (fecha, materiaid, maestroid, estado, cnt)
+        SELECT fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, ''), COUNT(*)
+        FROM asistencias WHERE fecha IS NOT NULL
+        GROUP BY fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, '')""",
+    ]),
+    (7, "índices de prefijo para buscar alumnos y maestros por nombre", [
+        # Postgres: LIKE 'abc%' sobre lower(col) usa text_pattern_ops con cualquier collation;
+        # SQLite: la optimización de LIKE necesita índice COLLATE NOCASE
+        {"postgresql": "CREATE INDEX IF NOT EXISTS ix_alumnos_nombre_prefijo ON alumnos (lower(nombre) text_pattern_ops)",
+         "sqlite": "CREATE INDEX IF NOT EXISTS ix_alumnos_nombre_prefijo ON alumnos (nombre COLLATE NOCASE)"},
+        {"postgresql": "CREATE INDEX IF NOT EXISTS ix_alumnos_apellido_prefijo ON alumnos (lower(apellido) text_pattern_ops)",
+         "sqlite": "CREATE INDEX IF NOT EXISTS ix_alumnos_apellido_prefijo ON alumnos (apellido COLLATE NOCASE)"},
+        {"postgresql": "CREATE INDEX IF NOT EXISTS ix_maestros_nombre_prefijo ON maestros (lower(nombre) text_pattern_ops)",
+         "sqlite": "CREATE INDEX IF NOT EXISTS ix_maestros_nombre_prefijo ON maestros (nombre COLLATE NOCASE)"},
+        {"postgresql": "CREATE INDEX IF NOT EXISTS ix_maestros_apellido_prefijo ON maestros (lower(apellido) text_pattern_ops)",
+         "sqlite": "CREATE INDEX IF NOT EXISTS ix_maestros_apellido_prefijo ON maestros (apellido COLLATE NOCASE)"},
+    ]),
+    (8, "sesiones por materia desde el rollup (resumen por alumno)", [
+        "CREATE INDEX IF NOT EXISTS ix_asistencias_diarias_materia_fecha ON asistencias_diarias (materiaid, fecha)",
+    ]),
+    (9, "quitar el índice parcial por token de qr_tokens (duplicaba el UNIQUE)", [
+        # la búsqueda por token ya usa el índice UNIQUE; este solo encarecía las escrituras
+        "DROP INDEX IF EXISTS ix_qr_tokens_activos",
+    ]),
+]
+
+VERSION_ESPERADA = MIGRACIONES[-1][0]
+
+# id arbitrario para pg_advisory_xact_lock: evita que dos procesos migren a la vez
+_LOCK_MIGRACIONES = 724001
+log = logging.getLogger("migraciones")
+
+
+def _adaptar(sql, dialecto):
+    if isinstance(sql, dict):
+        sql = sql.get(dialecto)
+        if sql is None:
+            return None
+    if dialecto == "sqlite":
+        sql = sql.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+        sql = sql.replace("DEFAULT NOW()", "DEFAULT CURRENT_TIMESTAMP")
+    return sql
+
+
+def version_actual(conn):
+    if not sqlalchemy.inspect(conn).has_table("schema_migraciones"):
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migraciones")).scalar() or 0
+
+
+def aplicar_migraciones(engine=None):
+    engine = engine or get_engine()
+    dialecto = engine.dialect.name
+    aplicadas = []
+    with engine.begin() as conn:
+        if dialecto == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_MIGRACIONES})
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migraciones (
+                version INT PRIMARY KEY,
+                descripcion TEXT,
+                aplicada TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )"""))
+        actual = version_actual(conn)
+        for version, descripcion, sentencias in MIGRACIONES:
+            if version <= actual:
+                continue
+            for sql in sentencias:
+                sql = _adaptar(sql, dialecto)
+                if sql:
+                    conn.execute(text(sql))
+            conn.execute(text("INSERT INTO schema_migraciones (version, descripcion) VALUES (:v, :d)"),
+                         {"v": version, "d": descripcion})
+            aplicadas.append(version)
+            if version == 2:
+                _avisar_descartadas(conn)
+    return aplicadas
+
+
+def _avisar_descartadas(conn):
+    n = conn.execute(text("SELECT COUNT(*) FROM asistencias_descartadas")).scalar()
+    if n:
+        log.warning("Migración 2: %s asistencias duplicadas movidas a asistencias_descartadas "
+                    "(columna conservada = registro que se quedó).", n)
+
+
+def asegurar_esquema(engine=None):
+    # chequeo barato al arrancar (app, checkin_api): solo lee la versión. Migrar
+    # reescribe y reindexa tablas vivas, así que se hace en el deploy
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        actual = version_actual(conn)
+    if actual < VERSION_ESPERADA:
+        raise RuntimeError(f"El esquema está en la versión {actual} y se espera la {VERSION_ESPERADA}: "
+                           "corre `python migraciones.py` antes de arrancar.")
+    return actual
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if "--estado" in sys.argv:
+        with get_engine().connect() as conn:
+            print(f"Versión actual: {version_actual(conn)} / esperada: {VERSION_ESPERADA}")
+    else:
+        nuevas = aplicar_migraciones()
+        if nuevas:
+            print(f"Migraciones aplicadas: {nuevas}")
+        else:
+            print(f"Esquema al día (versión {VERSION_ESPERADA}).")
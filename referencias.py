@@ -0,0 +1,232 @@
+import os
+import re
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from cache import CacheTTL
+from db_conexion import get_connection
+
+# Horarios permitidos
+HORARIOS = [
+    "07:00 - 07:50",
+    "07:50 - 08:40",
+    "09:20 - 10:10",
+    "10:10 - 11:00",
+    "11:00 - 11:50",
+    "11:50 - 12:40",
+    "12:40 - 13:30",
+    "13:30 - 14:20",
+    "14:20 - 15:10"
+]
+
+# =========================
+# CACHÉ DE DATOS DE REFERENCIA
+# =========================
+# alumnos, maestros y materias se leen en casi todas las páginas. Se guardan
+# por (tabla, versión); cada alta/edición/baja llama invalidar(), que sube la
+# versión y deja las entradas viejas fuera de uso. El TTL acota cuánto tarda
+# en verse un cambio hecho desde otro proceso.
+# Los DataFrames devueltos se comparten entre sesiones: no modificarlos.
+_CONSULTAS = {
+    "alumnos": "SELECT matricula, nombre, apellido FROM alumnos ORDER BY nombre, apellido, matricula",
+    "maestros": "SELECT maestroid, nombre, apellido FROM maestros ORDER BY nombre, apellido, maestroid",
+    "materias": "SELECT materiaid, nombre, descripcion, maestroid, horario FROM materias ORDER BY nombre, materiaid",
+}
+
+_cache = CacheTTL("referencias", max_items=256, ttl=int(os.environ.get("REFERENCIAS_TTL", "300")))
+# clase_alumnos no se cachea como tabla completa, pero lleva versión para las listas
+_versiones = {tabla: 0 for tabla in (*_CONSULTAS, "clase_alumnos")}
+_lock = threading.Lock()
+
+
+def version(tabla):
+    return _versiones[tabla]
+
+
+def invalidar(*tablas):
+    with _lock:
+        for tabla in tablas:
+            _versiones[tabla] += 1
+
+
+def _leer(conn, tabla):
+    # conn es opcional: sin ella solo se pide una conexión al pool si hay fallo de caché
+    clave = (tabla, _versiones[tabla])
+    df = _cache.get(clave)
+    if df is None:
+        if conn is None:
+            with get_connection() as c:
+                df = pd.read_sql(text(_CONSULTAS[tabla]), c)
+        else:
+            df = pd.read_sql(text(_CONSULTAS[tabla]), conn)
+        _cache.set(clave, df)
+    return df
+
+
+def alumnos(conn=None):
+    return _leer(conn, "alumnos")
+
+
+def maestros(conn=None):
+    return _leer(conn, "maestros")
+
+
+def materias(conn=None, maestroid=None):
+    df = _leer(conn, "materias")
+    if maestroid is not None:
+        df = df[df["maestroid"] == int(maestroid)]
+    return df
+
+
+# índices id -> etiqueta para los selectores: se construyen una vez por versión
+# y la selección viaja por llave primaria (dos alumnos con el mismo nombre ya no
+# se confunden)
+_ID = {"alumnos": "matricula", "maestros": "maestroid", "materias": "materiaid"}
+
+
+def _etiquetas(tabla, df):
+    if df.empty:
+        # sin filas las columnas salen como object y no se concatenan con str
+        return []
+    if tabla == "materias":
+        return df["nombre"].fillna("") + " (" + df["horario"].fillna("sin horario") + ")"
+    return df["nombre"].fillna("") + " " + df["apellido"].fillna("") + " · #" + df[_ID[tabla]].astype(str)
+
+
+def indice(conn, tabla, maestroid=None):
+    # (ids en orden de despliegue, {id: etiqueta})
+    clave = ("indice", tabla, _versiones[tabla], maestroid)
+    idx = _cache.get(clave)
+    if idx is None:
+        df = materias(conn, maestroid) if tabla == "materias" else _leer(conn, tabla)
+        ids = [int(i) for i in df[_ID[tabla]]]
+        idx = (ids, dict(zip(ids, _etiquetas(tabla, df))))
+        _cache.set(clave, idx)
+    return idx
+
+
+def por_id(conn, tabla):
+    # la tabla indexada por su llave primaria, para buscar una fila por id
+    clave = ("por_id", tabla, _versiones[tabla])
+    df = _cache.get(clave)
+    if df is None:
+        df = _leer(conn, tabla).set_index(_ID[tabla], drop=False)
+        _cache.set(clave, df)
+    return df
+
+
+def etiqueta(conn, tabla, id_):
+    return indice(conn, tabla)[1].get(int(id_), f"#{id_}")
+
+
+# búsqueda del lado del servidor para tablas grandes (alumnos, maestros): en vez
+# de mandar la lista completa al navegador se piden los primeros N que empiecen
+# por lo escrito. Cada término debe ser prefijo de nombre o apellido (o el id
+# exacto si es numérico); los índices de prefijo son de la migración 7.
+BUSQUEDA_LIMITE = int(os.environ.get("BUSQUEDA_LIMITE", "20"))
+_busquedas = CacheTTL("busquedas", max_items=1024, ttl=int(os.environ.get("REFERENCIAS_TTL", "300")))
+
+
+def _terminos(texto):
+    return (texto or "").lower().split()[:4]
+
+
+def _patron(termino):
+    # % y _ escritos por el usuario se buscan literales, no como comodines
+    return re.sub(r"([%_\\])", r"\\\1", termino) + "%"
+
+
+def buscar(conn, tabla, texto, limite=BUSQUEDA_LIMITE):
+    # (ids, {id: etiqueta}) con el mismo formato que indice()
+    if tabla not in ("alumnos", "maestros"):
+        raise ValueError(f"Tabla sin búsqueda: {tabla}")
+    terminos = _terminos(texto)
+    if not terminos:
+        return [], {}
+    clave = (tabla, _versiones[tabla], tuple(terminos), limite)
+    idx = _busquedas.get(clave)
+    if idx is not None:
+        return idx
+    if conn is None:
+        with get_connection() as c:
+            df = _consultar_busqueda(c, tabla, terminos, limite)
+    else:
+        df = _consultar_busqueda(conn, tabla, terminos, limite)
+    ids = [int(i) for i in df[_ID[tabla]]]
+    idx = (ids, dict(zip(ids, _etiquetas(tabla, df))))
+    _busquedas.set(clave, idx)
+    return idx
+
+
+def _consultar_busqueda(conn, tabla, terminos, limite):
+    id_col = _ID[tabla]
+    if conn.dialect.name == "postgresql":
+        col = lambda c: f"lower({c})"
+    else:
+        col = lambda c: c   # LIKE de SQLite ya ignora mayúsculas (ASCII)
+    where = []
+    params = {"lim": int(limite)}
+    for i, t in enumerate(terminos):
+        params[f"t{i}"] = _patron(t)
+        # sin ESCAPE si no hace falta: con él SQLite ya no usa el índice de prefijo
+        escape = " ESCAPE '\\'" if params[f"t{i}"] != t + "%" else ""
+        cond = f"{col('nombre')} LIKE :t{i}{escape} OR {col('apellido')} LIKE :t{i}{escape}"
+        if t.isdigit():
+            cond += f" OR {id_col} = :n{i}"
+            params[f"n{i}"] = int(t)
+        where.append(f"({cond})")
+    sql = f"""
+        SELECT {id_col}, nombre, apellido FROM {tabla}
+        WHERE {" AND ".join(where)}
+        ORDER BY nombre, apellido, {id_col}
+        LIMIT :lim
+    """
+    return pd.read_sql(text(sql), conn, params=params)
+
+
+# listas de alumnos inscritos de todas las materias de un maestro en una sola
+# consulta; se cachean por maestro y versión de las tablas que intervienen
+def listas_maestro(conn, maestroid):
+    clave = ("listas", int(maestroid), _versiones["clase_alumnos"], _versiones["alumnos"], _versiones["materias"])
+    df = _cache.get(clave)
+    if df is None:
+        consulta = text("""
+            SELECT ca.materiaid, a.matricula, a.nombre, a.apellido
+            FROM clase_alumnos ca
+            JOIN materias m ON ca.materiaid = m.materiaid
+            JOIN alumnos a ON ca.matricula = a.matricula
+            WHERE m.maestroid = :m
+            ORDER BY ca.materiaid, a.nombre, a.apellido
+        """)
+        if conn is None:
+            with get_connection() as c:
+                df = pd.read_sql(consulta, c, params={"m": int(maestroid)})
+        else:
+            df = pd.read_sql(consulta, conn, params={"m": int(maestroid)})
+        _cache.set(clave, df)
+    return df
+
+
+def inscritos(conn, materiaid):
+    # frozenset de matrículas inscritas en la materia; se carga la primera vez
+    # que se pide y vive hasta que cambie la versión de clase_alumnos
+    clave = ("inscritos", int(materiaid), _versiones["clase_alumnos"])
+    matriculas = _cache.get(clave)
+    if matriculas is None:
+        consulta = text("SELECT matricula FROM clase_alumnos WHERE materiaid = :mid")
+        if conn is None:
+            with get_connection() as c:
+                filas = c.execute(consulta, {"mid": int(materiaid)}).fetchall()
+        else:
+            filas = conn.execute(consulta, {"mid": int(materiaid)}).fetchall()
+        matriculas = frozenset(int(f[0]) for f in filas)
+        _cache.set(clave, matriculas)
+    return matriculas
+
+
+def estadisticas():
+    datos = _cache.estadisticas()
+    datos["versiones"] = dict(_versiones)
+    return datos
@@ -0,0 +1,122 @@
+import os
+import threading
+
+import pandas as pd
+from sqlalchemy import text
+
+from cache import CacheTTL
+
+# =========================
+# RESUMEN DE ASISTENCIA POR ALUMNO
+# =========================
+# Por materia: Presente / Retardo / Ausente del alumno, sesiones impartidas
+# (días con algún registro en la materia, del rollup asistencias_diarias) y
+# porcentaje de asistencia = (Presente + Retardo) / sesiones. Las sesiones sin
+# registro del alumno cuentan como faltas. Una sola consulta agregada.
+# Se cachea por matrícula; cada escritura llama invalidar(). Un día nuevo en
+# una materia cambia las sesiones de todos sus alumnos, así que ese caso
+# invalida los resúmenes de la materia completa. El TTL acota lo que tarda en
+# verse un check-in hecho desde otro proceso (checkin_api).
+# Los DataFrames devueltos se comparten entre sesiones: no modificarlos.
+_cache = CacheTTL("resumen_alumno", max_items=4096, ttl=int(os.environ.get("RESUMEN_TTL", "300")))
+# (materiaid, fecha) ya vistos en este proceso: el primer registro de un día
+# es el que agrega una sesión
+_sesiones = set()
+_sesiones_lock = threading.Lock()
+_MAX_SESIONES = 20000
+
+_RESUMEN = text("""
+    WITH propias AS (
+        SELECT materiaid,
+               SUM(CASE WHEN estado = 'Presente' THEN 1 ELSE 0 END) AS presente,
+               SUM(CASE WHEN estado = 'Retardo' THEN 1 ELSE 0 END) AS retardo,
+               SUM(CASE WHEN estado = 'Ausente' THEN 1 ELSE 0 END) AS ausente,
+               COUNT(*) AS registros
+        FROM asistencias
+        WHERE matricula = :mat AND materiaid IS NOT NULL
+        GROUP BY materiaid
+    ),
+    mias AS (
+        SELECT materiaid FROM clase_alumnos WHERE matricula = :mat
+        UNION
+        SELECT materiaid FROM propias
+    ),
+    sesiones AS (
+        SELECT materiaid, COUNT(DISTINCT fecha) AS sesiones
+        FROM asistencias_diarias
+        WHERE materiaid IN (SELECT materiaid FROM mias) AND cnt > 0
+        GROUP BY materiaid
+    )
+    SELECT mi.materiaid, m.nombre AS materia, m.horario,
+           COALESCE(p.presente, 0) AS presente,
+           COALESCE(p.retardo, 0) AS retardo,
+           COALESCE(p.ausente, 0) AS ausente,
+           COALESCE(p.registros, 0) AS registros,
+           COALESCE(s.sesiones, 0) AS sesiones
+    FROM mias mi
+    LEFT JOIN materias m ON m.materiaid = mi.materiaid
+    LEFT JOIN propias p ON p.materiaid = mi.materiaid
+    LEFT JOIN sesiones s ON s.materiaid = mi.materiaid
+    ORDER BY m.horario, m.nombre
+""")
+
+
+def _calcular(conn, matricula):
+    df = pd.read_sql(_RESUMEN, conn, params={"mat": int(matricula)})
+    for c in ("presente", "retardo", "ausente", "registros", "sesiones"):
+        df[c] = df[c].astype(int)
+    # un registro en un día que el rollup aún no refleja no debe dar >100%
+    df["sesiones"] = df[["sesiones", "registros"]].max(axis=1)
+    df["sin_registro"] = df["sesiones"] - df["registros"]
+    asistio = df["presente"] + df["retardo"]
+    df["porcentaje"] = (100 * asistio / df["sesiones"].where(df["sesiones"] > 0)).round(1)
+    return df.drop(columns="registros")
+
+
+def resumen(conn, matricula):
+    # DataFrame por materia: materiaid, materia, horario, presente, retardo,
+    # ausente, sesiones, sin_registro, porcentaje (NaN si aún no hay sesiones)
+    matricula = int(matricula)
+    df = _cache.get(matricula)
+    if df is None:
+        df = _calcular(conn, matricula)
+        _cache.set(matricula, df)
+    return df
+
+
+def totales(df):
+    # asistencia global del alumno sobre todas sus materias
+    sesiones = int(df["sesiones"].sum())
+    asistio = int(df["presente"].sum() + df["retardo"].sum())
+    return {"sesiones": sesiones, "asistio": asistio,
+            "porcentaje": round(100 * asistio / sesiones, 1) if sesiones else None}
+
+
+def invalidar(matriculas=(), materiaid=None, fecha=None):
+    # tras escribir asistencias de `matriculas` en (materiaid, fecha)
+    for m in matriculas:
+        if m is not None:
+            _cache.pop(int(m))
+    if materiaid is None:
+        return
+    if fecha is None:
+        invalidar_materia(materiaid)
+        return
+    clave = (int(materiaid), str(fecha)[:10])
+    with _sesiones_lock:
+        nueva = clave not in _sesiones
+        if nueva:
+            if len(_sesiones) >= _MAX_SESIONES:
+                _sesiones.clear()
+            _sesiones.add(clave)
+    if nueva:
+        invalidar_materia(materiaid)
+
+
+def invalidar_materia(materiaid):
+    materiaid = int(materiaid)
+    _cache.invalidar_si(lambda _, df: materiaid in df["materiaid"].values)
+
+
+def limpiar():
+    _cache.limpiar()
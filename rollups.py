@@ -0,0 +1,105 @@
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+from db_conexion import get_engine
+
+# =========================
+# ROLLUP DIARIO DE ASISTENCIAS
+# =========================
+# asistencias_diarias (fecha, materiaid, maestroid, estado) -> cnt se mantiene
+# con triggers sobre asistencias (migración 6). El dashboard lee de aquí, así
+# que su costo depende del número de días, no del número de asistencias.
+
+
+def metricas_dashboard(conn):
+    fila = conn.execute(text("""
+        SELECT (SELECT COUNT(*) FROM alumnos) AS alumnos,
+               (SELECT COUNT(*) FROM maestros) AS maestros,
+               (SELECT COUNT(*) FROM materias) AS materias,
+               (SELECT COALESCE(SUM(cnt), 0) FROM asistencias_diarias) AS asistencias
+    """)).mappings().fetchone()
+    return dict(fila)
+
+
+def asistencias_por_estado(conn, desde=None, hasta=None, maestroid=None):
+    where, params = _filtros(desde, hasta, maestroid)
+    return pd.read_sql(text(f"""
+        SELECT estado, SUM(cnt) AS cnt
+        FROM asistencias_diarias
+        {where}
+        GROUP BY estado
+        HAVING SUM(cnt) > 0
+        ORDER BY estado
+    """), conn, params=params)
+
+
+def tendencia_diaria(conn, desde=None, hasta=None, maestroid=None):
+    where, params = _filtros(desde, hasta, maestroid)
+    return pd.read_sql(text(f"""
+        SELECT fecha, SUM(cnt) AS cnt
+        FROM asistencias_diarias
+        {where}
+        GROUP BY fecha
+        HAVING SUM(cnt) > 0
+        ORDER BY fecha
+    """), conn, params=params)
+
+
+def ultima_sesion(conn, maestroid):
+    # por materia del maestro: fecha de la última sesión con registros y cuántos
+    # asistieron (Presente o Retardo); una sola consulta sobre el rollup
+    return pd.read_sql(text("""
+        SELECT d.materiaid, d.fecha,
+               SUM(CASE WHEN d.estado IN ('Presente', 'Retardo') THEN d.cnt ELSE 0 END) AS asistieron,
+               SUM(d.cnt) AS registrados
+        FROM asistencias_diarias d
+        JOIN (
+            SELECT materiaid, MAX(fecha) AS fecha
+            FROM asistencias_diarias
+            WHERE maestroid = :m AND cnt > 0
+            GROUP BY materiaid
+        ) u ON u.materiaid = d.materiaid AND u.fecha = d.fecha
+        WHERE d.maestroid = :m
+        GROUP BY d.materiaid, d.fecha
+    """), conn, params={"m": int(maestroid)})
+
+
+def _filtros(desde, hasta, maestroid):
+    where = []
+    params = {}
+    if desde:
+        where.append("fecha >= :desde")
+        params["desde"] = desde
+    if hasta:
+        where.append("fecha <= :hasta")
+        params["hasta"] = hasta
+    if maestroid is not None:
+        where.append("maestroid = :maestroid")
+        params["maestroid"] = int(maestroid)
+    return ("WHERE " + " AND ".join(where)) if where else "", params
+
+
+def reconstruir(engine=None):
+    # backfill completo (o reparación) del rollup a partir de asistencias
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # bloquea escrituras en asistencias mientras se recalcula
+            conn.execute(text("LOCK TABLE asistencias IN SHARE MODE"))
+        conn.execute(text("DELETE FROM asistencias_diarias"))
+        conn.execute(text("""
+            INSERT INTO asistencias_diarias (fecha, materiaid, maestroid, estado, cnt)
+            SELECT fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, ''), COUNT(*)
+            FROM asistencias WHERE fecha IS NOT NULL
+            GROUP BY fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, '')
+        """))
+        return conn.execute(text("SELECT COUNT(*) FROM asistencias_diarias")).scalar()
+
+
+if __name__ == "__main__":
+    if "--reconstruir" in sys.argv:
+        print(f"Rollup reconstruido: {reconstruir()} filas.")
+    else:
+        print("Uso: python rollups.py --reconstruir")
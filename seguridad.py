@@ -0,0 +1,280 @@
+import collections
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+import bcrypt
+from sqlalchemy import text
+
+from db_conexion import get_connection
+
+# =========================
+# CONTRASEÑAS
+# =========================
+# Costo de bcrypt configurable: cada punto duplica el tiempo de hash. 12 es el
+# default de la librería; bajarlo solo tiene sentido en pruebas o en altas
+# masivas (cuentas.py). Los hashes con otro costo se rehacen al iniciar sesión.
+BCRYPT_COSTO = int(os.environ.get("BCRYPT_COSTO", "12"))
+
+
+def hash_password(plain: str, costo: int = None) -> str:
+    return bcrypt.hashpw(plain.encode("utf-8"), bcrypt.gensalt(costo or BCRYPT_COSTO)).decode("utf-8")
+
+
+def check_password(plain: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+    except Exception:
+        return False
+
+
+def costo_de(hashed: str):
+    # "$2b$12$..." -> 12
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def necesita_rehash(hashed: str, costo: int = None) -> bool:
+    return costo_de(hashed) != (costo or BCRYPT_COSTO)
+
+
+# =========================
+# LÍMITE DE INTENTOS
+# =========================
+# Ventana deslizante en memoria (por proceso) de intentos por clave. Acotada a
+# max_claves: las claves menos recientes se descartan primero.
+class LimiteIntentos:
+    def __init__(self, max_intentos, ventana, max_claves=20000):
+        self.max_intentos = max_intentos
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self._intentos = collections.OrderedDict()   # clave -> deque de instantes
+        self._lock = threading.Lock()
+
+    def _vigentes(self, clave, ahora):
+        marcas = self._intentos.get(clave)
+        if marcas is None:
+            return None
+        while marcas and marcas[0] <= ahora - self.ventana:
+            marcas.popleft()
+        return marcas
+
+    def bloqueado(self, clave):
+        # segundos que faltan para poder reintentar (0 si no está bloqueado)
+        if clave is None:
+            return 0
+        ahora = time.monotonic()
+        with self._lock:
+            marcas = self._vigentes(clave, ahora)
+            if not marcas or len(marcas) < self.max_intentos:
+                return 0
+            return int(marcas[0] + self.ventana - ahora) + 1
+
+    def registrar(self, clave):
+        if clave is None:
+            return
+        ahora = time.monotonic()
+        with self._lock:
+            marcas = self._vigentes(clave, ahora)
+            if marcas is None:
+                marcas = self._intentos[clave] = collections.deque(maxlen=self.max_intentos)
+            marcas.append(ahora)
+            self._intentos.move_to_end(clave)
+            while len(self._intentos) > self.max_claves:
+                self._intentos.popitem(last=False)
+
+    def limpiar(self, clave):
+        with self._lock:
+            self._intentos.pop(clave, None)
+
+    def claves(self):
+        with self._lock:
+            return len(self._intentos)
+
+
+# =========================
+# LOGIN
+# =========================
+# bcrypt es CPU pura: si cada sesión de Streamlit lo corre en su propio hilo,
+# una avalancha de logins (todo un grupo escaneando el QR a la vez) satura el
+# CPU y todas las páginas se congelan. Las verificaciones pasan por un pool
+# acotado; si la cola está llena se responde "ocupado" de inmediato en lugar
+# de encolar sin límite.
+# Solo los intentos fallidos cuentan: por IP (un grupo detrás del mismo NAT
+# entra sin problema) y por (usuario, IP), para que nadie pueda bloquear la
+# cuenta de otro desde su propia máquina. Un tercer límite por usuario, más
+# alto y con ventana más larga, frena a quien reparte los intentos contra una
+# misma cuenta entre muchas IPs.
+LOGIN_HILOS = int(os.environ.get("LOGIN_HILOS", str(max(1, (os.cpu_count() or 2) - 1))))
+LOGIN_COLA = int(os.environ.get("LOGIN_COLA", "32"))
+LOGIN_TIMEOUT = float(os.environ.get("LOGIN_TIMEOUT", "10"))
+fallos_usuario = LimiteIntentos(int(os.environ.get("LOGIN_FALLOS_USUARIO", "5")),
+                                int(os.environ.get("LOGIN_VENTANA_USUARIO", "300")))
+fallos_cuenta = LimiteIntentos(int(os.environ.get("LOGIN_FALLOS_CUENTA", "20")),
+                               int(os.environ.get("LOGIN_VENTANA_CUENTA", "900")))
+fallos_ip = LimiteIntentos(int(os.environ.get("LOGIN_FALLOS_IP", "30")),
+                           int(os.environ.get("LOGIN_VENTANA_IP", "60")))
+# Proxies propios delante de la app. X-Forwarded-For lo escribe el cliente,
+# salvo los valores que cada proxy agrega al final: con n proxies la IP real
+# es la n-ésima desde la derecha. Con 0 el encabezado se ignora.
+PROXIES_CONFIABLES = int(os.environ.get("PROXIES_CONFIABLES", "0"))
+
+# resultados de autenticar()
+OK = "ok"
+CREDENCIALES = "credenciales"
+BLOQUEADO = "bloqueado"
+OCUPADO = "ocupado"
+
+# bcrypt libera el GIL, así que un pool de hilos da paralelismo real
+_pool = ThreadPoolExecutor(max_workers=LOGIN_HILOS, thread_name_prefix="bcrypt")
+_cupos = threading.BoundedSemaphore(LOGIN_HILOS + LOGIN_COLA)
+_metricas = {"intentos": 0, "ok": 0, "fallidos": 0, "bloqueados": 0, "ocupado": 0,
+             "rehash": 0, "verificaciones": 0, "espera_total_ms": 0.0, "bcrypt_total_ms": 0.0, "bcrypt_max_ms": 0.0}
+_metricas_lock = threading.Lock()
+
+
+def _contar(**valores):
+    with _metricas_lock:
+        for k, v in valores.items():
+            _metricas[k] += v
+
+
+def _verificar(plain, hashed, encolado):
+    inicio = time.perf_counter()
+    ok = check_password(plain, hashed)
+    fin = time.perf_counter()
+    ms = (fin - inicio) * 1000
+    with _metricas_lock:
+        _metricas["verificaciones"] += 1
+        _metricas["espera_total_ms"] += (inicio - encolado) * 1000
+        _metricas["bcrypt_total_ms"] += ms
+        _metricas["bcrypt_max_ms"] = max(_metricas["bcrypt_max_ms"], ms)
+    return ok
+
+
+def _rehash(usuarioid, plain, anterior):
+    # con el costo actual; solo si nadie cambió la contraseña mientras tanto
+    with get_connection() as conn:
+        conn.execute(text("UPDATE usuarios SET contrasena = :nuevo WHERE usuarioid = :id AND contrasena = :anterior"),
+                     {"nuevo": hash_password(plain), "id": usuarioid, "anterior": anterior})
+        conn.commit()
+    _contar(rehash=1)
+
+
+def ip_de_solicitud(directa, reenviada=None, proxies=None):
+    # directa: IP del socket; reenviada: encabezado X-Forwarded-For
+    proxies = PROXIES_CONFIABLES if proxies is None else proxies
+    if proxies > 0 and reenviada:
+        saltos = [s.strip() for s in reenviada.split(",") if s.strip()]
+        if len(saltos) >= proxies:
+            return saltos[-proxies]
+    return directa
+
+
+def _fallo(username, ip):
+    fallos_usuario.registrar((username, ip))
+    fallos_cuenta.registrar(username)
+    fallos_ip.registrar(ip)
+    _contar(fallidos=1)
+    return CREDENCIALES, None, 0
+
+
+def autenticar(conn, username, password, ip=None):
+    # devuelve (estado, fila de usuarios o None, segundos para reintentar)
+    _contar(intentos=1)
+    espera = max(fallos_usuario.bloqueado((username, ip)), fallos_cuenta.bloqueado(username),
+                 fallos_ip.bloqueado(ip))
+    if espera:
+        _contar(bloqueados=1)
+        return BLOQUEADO, None, espera
+    user = conn.execute(text("SELECT * FROM usuarios WHERE nombreusuario = :u"), {"u": username}).mappings().fetchone()
+    if user is None:
+        return _fallo(username, ip)
+    if not _cupos.acquire(blocking=False):
+        _contar(ocupado=1)
+        return OCUPADO, None, 2
+    try:
+        futuro = _pool.submit(_verificar, password, user["contrasena"], time.perf_counter())
+    except Exception:
+        _cupos.release()
+        raise
+    # el cupo se libera cuando bcrypt termina, aunque aquí ya no se espere
+    futuro.add_done_callback(lambda _: _cupos.release())
+    try:
+        ok = futuro.result(timeout=LOGIN_TIMEOUT)
+    except FuturesTimeout:
+        _contar(ocupado=1)
+        return OCUPADO, None, 2
+    if not ok:
+        return _fallo(username, ip)
+    fallos_usuario.limpiar((username, ip))
+    fallos_cuenta.limpiar(username)
+    _contar(ok=1)
+    if necesita_rehash(user["contrasena"]):
+        # fuera de la ruta del login: el usuario no espera un segundo bcrypt
+        _pool.submit(_rehash, user["usuarioid"], password, user["contrasena"])
+    return OK, user, 0
+
+
+def estadisticas_login():
+    with _metricas_lock:
+        datos = dict(_metricas)
+    if datos["verificaciones"]:
+        datos["bcrypt_prom_ms"] = round(datos["bcrypt_total_ms"] / datos["verificaciones"], 1)
+        datos["espera_prom_ms"] = round(datos["espera_total_ms"] / datos["verificaciones"], 1)
+    datos["bcrypt_costo"] = BCRYPT_COSTO
+    datos["hilos"] = LOGIN_HILOS
+    datos["usuarios_con_fallos"] = fallos_usuario.claves()
+    datos["cuentas_con_fallos"] = fallos_cuenta.claves()
+    datos["ips_vigiladas"] = fallos_ip.claves()
+    return datos
+
+
+# =========================
+# COOKIE DE SESIÓN (endpoint de check-in)
+# =========================
+# "usuarioid.expira.mac": basta para que el mismo celular registre los
+# siguientes escaneos sin volver a escribir la contraseña. La firma cubre
+# también el hash de la contraseña guardado en usuarios, así que cambiarla (o
+# borrar la cuenta) invalida las cookies ya emitidas; un rehash por cambio de
+# BCRYPT_COSTO también, una sola vez. La clave se deriva de SESION_SECRET (o
+# QR_SECRET) con una etiqueta propia: no coincide con la de los QR firmados.
+# Sin secreto es aleatoria por proceso y las cookies dejan de valer al reiniciar.
+_SECRETO_SESION = (os.environ.get("SESION_SECRET") or os.environ.get("QR_SECRET") or "").encode("utf-8")
+SESION_CLAVE = (hmac.new(_SECRETO_SESION, b"asistencia/cookie-sesion", hashlib.sha256).digest()
+                if _SECRETO_SESION else secrets.token_bytes(32))
+SESION_DIAS = int(os.environ.get("SESION_DIAS", "120"))
+
+
+def _mac_sesion(cuerpo, contrasena):
+    return hmac.new(SESION_CLAVE, f"{cuerpo}.{contrasena}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def firmar_sesion(usuarioid, contrasena, dias=SESION_DIAS, ahora=None):
+    # contrasena: el hash actual de usuarios.contrasena
+    expira = int((ahora or time.time()) + dias * 86400)
+    cuerpo = f"{int(usuarioid)}.{expira}"
+    return f"{cuerpo}.{_mac_sesion(cuerpo, contrasena)}"
+
+
+def verificar_sesion(conn, valor, ahora=None):
+    # fila de usuarios (usuarioid, rol, matricula) o None si la cookie está
+    # alterada, vencida o la contraseña cambió desde que se emitió
+    try:
+        usuarioid, expira, mac = (valor or "").split(".")
+        if int(expira) <= (ahora or time.time()):
+            return None
+        usuarioid = int(usuarioid)
+    except ValueError:
+        return None
+    user = conn.execute(text("SELECT usuarioid, rol, matricula, contrasena FROM usuarios WHERE usuarioid = :id"),
+                        {"id": usuarioid}).mappings().fetchone()
+    if user is None or not hmac.compare_digest(mac, _mac_sesion(f"{usuarioid}.{expira}", user["contrasena"])):
+        return None
+    return user
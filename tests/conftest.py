@@ -0,0 +1,70 @@
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Las pruebas corren contra SQLite en un directorio temporal. DATABASE_URL y
+# el resto de la configuración se fijan antes de importar los módulos de la
+# app (leen el entorno al importarse).
+_DIR = tempfile.mkdtemp(prefix="asistencias_pruebas_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DIR, 'pruebas.db')}"
+os.environ["BCRYPT_COSTO"] = "4"
+os.environ["CHECKIN_WRITE_BEHIND"] = "0"
+os.environ["CHECKIN_JOURNAL"] = os.path.join(_DIR, "checkins_pendientes.jsonl")
+os.environ["SQL_METRICAS"] = "0"
+os.environ["QR_SECRET"] = "secreto-de-pruebas"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ids fijos hacia abajo: los SERIAL/AUTOINCREMENT (p. ej. importar sin id)
+# siempre asignan por encima del máximo, así que nunca chocan
+_ids = itertools.count(10 ** 8, -1)
+
+
+@pytest.fixture(scope="session")
+def esquema():
+    import migraciones
+    migraciones.aplicar_migraciones()
+
+
+@pytest.fixture
+def conn(esquema):
+    from db_conexion import get_connection
+    with get_connection() as c:
+        yield c
+
+
+@pytest.fixture
+def clase(conn):
+    # una materia nueva con su maestro y tres alumnos inscritos
+    from sqlalchemy import text
+    import referencias
+    maestroid, materiaid = next(_ids), next(_ids)
+    alumnos = [next(_ids) for _ in range(3)]
+    conn.execute(text("INSERT INTO maestros (maestroid, nombre, apellido) VALUES (:m, 'Prof', 'Prueba')"), {"m": maestroid})
+    conn.execute(text("INSERT INTO materias (materiaid, nombre, maestroid, horario) VALUES (:mid, 'Materia', :m, '07:00 - 07:50')"),
+                 {"mid": materiaid, "m": maestroid})
+    for a in alumnos:
+        conn.execute(text("INSERT INTO alumnos (matricula, nombre, apellido) VALUES (:a, 'Alumno', 'Prueba')"), {"a": a})
+        conn.execute(text("INSERT INTO clase_alumnos (materiaid, matricula) VALUES (:mid, :a)"), {"mid": materiaid, "a": a})
+    conn.commit()
+    referencias.invalidar("alumnos", "maestros", "materias", "clase_alumnos")
+    return {"maestroid": maestroid, "materiaid": materiaid, "alumnos": alumnos}
+
+
+def nuevo_id():
+    return next(_ids)
+
+
+def crear_token(conn, clase, single_use=False, minutos=30):
+    import datetime
+    from sqlalchemy import text
+    token = f"prueba-{nuevo_id()}"
+    conn.execute(text("""
+        INSERT INTO qr_tokens (token, materiaid, maestroid, expiracion, activo, single_use)
+        VALUES (:t, :mid, :ma, :exp, TRUE, :su)
+    """), {"t": token, "mid": clase["materiaid"], "ma": clase["maestroid"], "su": single_use,
+           "exp": datetime.datetime.utcnow() + datetime.timedelta(minutes=minutos)})
+    conn.commit()
+    return token
@@ -0,0 +1,248 @@
+import contextlib
+import datetime
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from sqlalchemy import event, text
+
+import asistencia_qr
+import cache
+import referencias
+import tokens_firmados
+from conftest import crear_token, nuevo_id
+from db_conexion import get_connection
+
+
+def _registros(conn, clase):
+    return conn.execute(text("SELECT COUNT(*) FROM asistencias WHERE materiaid = :mid"),
+                        {"mid": clase["materiaid"]}).scalar()
+
+
+def test_segundo_escaneo_es_duplicado(conn, clase):
+    token = crear_token(conn, clase)
+    alumno = clase["alumnos"][0]
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, alumno)["estado"] == asistencia_qr.REGISTRADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, alumno)["estado"] == asistencia_qr.DUPLICADA
+    # otro día con el mismo token sí es un registro nuevo
+    manana = datetime.date.today() + datetime.timedelta(days=1)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, alumno, fecha=manana)["estado"] == asistencia_qr.REGISTRADA
+    assert _registros(conn, clase) == 2
+
+
+def test_token_expirado_e_inexistente(conn, clase):
+    token = crear_token(conn, clase, minutos=-1)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, clase["alumnos"][0])["estado"] == asistencia_qr.EXPIRADO
+    assert asistencia_qr.registrar_asistencia_qr(conn, "no-existe", clase["alumnos"][0])["estado"] == asistencia_qr.INVALIDO
+    assert _registros(conn, clase) == 0
+
+
+def test_single_use_solo_registra_una_vez(conn, clase):
+    token = crear_token(conn, clase, single_use=True)
+    a, b = clase["alumnos"][:2]
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    # la validación previa al login ya no lo da por bueno (caché incluida)
+    assert asistencia_qr.consultar_token(conn, token)["estado"] == asistencia_qr.INVALIDO
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, b)["estado"] == asistencia_qr.INVALIDO
+    assert _registros(conn, clase) == 1
+
+
+def test_single_use_concurrente(conn, clase):
+    # varios alumnos escanean el mismo single-use a la vez: gana exactamente uno
+    token = crear_token(conn, clase, single_use=True)
+    barrera = threading.Barrier(len(clase["alumnos"]))
+    estados = []
+
+    def escanear(matricula):
+        with get_connection() as c:
+            barrera.wait()
+            estados.append(asistencia_qr.registrar_asistencia_qr(c, token, matricula)["estado"])
+
+    hilos = [threading.Thread(target=escanear, args=(m,)) for m in clase["alumnos"]]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert sorted(estados) == sorted([asistencia_qr.REGISTRADA] + [asistencia_qr.INVALIDO] * (len(hilos) - 1))
+    assert _registros(conn, clase) == 1
+
+
+def test_inscripcion_desde_otro_proceso(conn, clase):
+    token = crear_token(conn, clase)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, clase["alumnos"][0])["estado"] == asistencia_qr.REGISTRADA
+    referencias.inscritos(conn, clase["materiaid"])
+    # la lista de inscritos ya está en caché; la inscripción llega sin
+    # referencias.invalidar() (como desde importar.py u otro worker)
+    nuevo, ajeno = nuevo_id(), nuevo_id()
+    for m in (nuevo, ajeno):
+        conn.execute(text("INSERT INTO alumnos (matricula, nombre, apellido) VALUES (:m, 'Alumno', 'Nuevo')"), {"m": m})
+    conn.execute(text("INSERT INTO clase_alumnos (materiaid, matricula) VALUES (:mid, :m)"),
+                 {"mid": clase["materiaid"], "m": nuevo})
+    conn.commit()
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, nuevo)["estado"] == asistencia_qr.REGISTRADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, ajeno)["estado"] == asistencia_qr.NO_INSCRITO
+
+
+@contextlib.contextmanager
+def _sentencias(conn):
+    ejecutadas = []
+
+    def anotar(conn_, cursor, sql, *args):
+        ejecutadas.append(sql)
+    event.listen(conn.engine, "before_cursor_execute", anotar)
+    try:
+        yield ejecutadas
+    finally:
+        event.remove(conn.engine, "before_cursor_execute", anotar)
+
+
+def test_inscripcion_sin_lecturas_previas(conn, clase):
+    # la inscripción se comprueba dentro del check-in, no con consultas aparte
+    # (en Postgres cada escaneo es una sola sentencia; aquí, la transacción local)
+    a, b, c = clase["alumnos"]
+    ajeno = nuevo_id()
+    token = crear_token(conn, clase)
+    with _sentencias(conn) as ejecutadas:
+        assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    assert len(ejecutadas) == 2 and "clase_alumnos" in ejecutadas[0]    # SELECT token + inscripción, INSERT
+    referencias.inscritos(conn, clase["materiaid"])
+    with _sentencias(conn) as ejecutadas:
+        # token en caché y alumno en la lista en memoria: solo el INSERT
+        assert asistencia_qr.registrar_asistencia_qr(conn, token, b)["estado"] == asistencia_qr.REGISTRADA
+    assert len(ejecutadas) == 1
+    with _sentencias(conn) as ejecutadas:
+        # fuera de la lista: una sola comprobación en la base antes de rechazar
+        assert asistencia_qr.registrar_asistencia_qr(conn, token, ajeno)["estado"] == asistencia_qr.NO_INSCRITO
+    assert len(ejecutadas) == 1
+
+    unico = crear_token(conn, clase, single_use=True)
+    with _sentencias(conn) as ejecutadas:
+        assert asistencia_qr.registrar_asistencia_qr(conn, unico, ajeno)["estado"] == asistencia_qr.NO_INSCRITO
+    assert len(ejecutadas) == 1
+    # el no inscrito no consumió el single-use
+    with _sentencias(conn) as ejecutadas:
+        assert asistencia_qr.registrar_asistencia_qr(conn, unico, c)["estado"] == asistencia_qr.REGISTRADA
+    assert len(ejecutadas) == 3 and "clase_alumnos" in ejecutadas[0]   # SELECT token + inscripción, UPDATE, INSERT
+
+
+def test_cache_de_tokens_respeta_el_ttl(conn, clase, monkeypatch):
+    token = crear_token(conn, clase)
+    consultas = []
+
+    def contar(conn_, cursor, sql, *args):
+        if "FROM qr_tokens" in sql:
+            consultas.append(sql)
+    event.listen(conn.engine, "before_cursor_execute", contar)
+    reloj = [1000.0]
+    monkeypatch.setattr(cache, "time", type("Reloj", (), {"monotonic": staticmethod(lambda: reloj[0])}))
+    tokens = asistencia_qr._tokens
+    try:
+        aciertos, fallos = tokens.aciertos, tokens.fallos
+        assert asistencia_qr.consultar_token(conn, token)["estado"] == asistencia_qr.VALIDO
+        assert (len(consultas), tokens.fallos - fallos) == (1, 1)
+        # dentro del TTL: de la caché, sin ir a la base
+        reloj[0] += tokens.ttl - 1
+        assert asistencia_qr.consultar_token(conn, token)["estado"] == asistencia_qr.VALIDO
+        assert (len(consultas), tokens.aciertos - aciertos) == (1, 1)
+        # vencida la entrada se vuelve a leer
+        reloj[0] += 2
+        assert asistencia_qr.consultar_token(conn, token)["estado"] == asistencia_qr.VALIDO
+        assert (len(consultas), tokens.fallos - fallos) == (2, 2)
+    finally:
+        event.remove(conn.engine, "before_cursor_execute", contar)
+
+
+# --- tokens firmados (sin fila en qr_tokens) ---
+
+def _firmado(clase, vigencia=60, **kw):
+    return tokens_firmados.firmar(clase["materiaid"], clase["maestroid"], vigencia, **kw)
+
+
+def test_firmado_registra_y_duplica(conn, clase):
+    token = _firmado(clase)
+    a = clase["alumnos"][0]
+    assert asistencia_qr.consultar_token(conn, token)["estado"] == asistencia_qr.VALIDO
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.DUPLICADA
+    assert _registros(conn, clase) == 1
+
+
+def test_firmado_alterado_o_expirado(conn, clase):
+    token = _firmado(clase)
+    # un carácter distinto en la firma (no el último: lleva bits de relleno)
+    alterado = token[:-5] + ("A" if token[-5] != "A" else "B") + token[-4:]
+    assert asistencia_qr.registrar_asistencia_qr(conn, alterado, clase["alumnos"][0])["estado"] == asistencia_qr.INVALIDO
+    # otra materia con la firma del token original
+    otro = tokens_firmados.firmar(clase["materiaid"] + 1, clase["maestroid"], 60)
+    cuerpo_otro = tokens_firmados._unb64(otro[len(tokens_firmados.PREFIJO):])[:-tokens_firmados._LARGO_MAC]
+    firma = tokens_firmados._unb64(token[len(tokens_firmados.PREFIJO):])[-tokens_firmados._LARGO_MAC:]
+    falso = tokens_firmados.PREFIJO + tokens_firmados._b64(cuerpo_otro + firma)
+    assert asistencia_qr.registrar_asistencia_qr(conn, falso, clase["alumnos"][0])["estado"] == asistencia_qr.INVALIDO
+    viejo = _firmado(clase, vigencia=30, ahora=time.time() - 60)
+    assert asistencia_qr.registrar_asistencia_qr(conn, viejo, clase["alumnos"][0])["estado"] == asistencia_qr.EXPIRADO
+    assert _registros(conn, clase) == 0
+
+
+def _firmar_en_otro_proceso(clase, entorno):
+    codigo = ("import tokens_firmados; "
+              f"print(tokens_firmados.CONFIGURADO, tokens_firmados.firmar({clase['materiaid']}, {clase['maestroid']}, 60))")
+    salida = subprocess.run([sys.executable, "-c", codigo], env=entorno, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    configurado, token = salida.stdout.split()
+    return configurado == "True", token
+
+
+def test_firmado_en_otro_proceso(conn, clase):
+    # con el mismo QR_SECRET un código firmado por otro proceso (otro worker,
+    # checkin_api) vale aquí
+    configurado, token = _firmar_en_otro_proceso(clase, dict(os.environ))
+    assert configurado
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, clase["alumnos"][0])["estado"] == asistencia_qr.REGISTRADA
+    # sin QR_SECRET el proceso se declara no configurado y su firma no vale aquí
+    entorno = {k: v for k, v in os.environ.items() if k != "QR_SECRET"}
+    configurado, token = _firmar_en_otro_proceso(clase, entorno)
+    assert not configurado
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, clase["alumnos"][1])["estado"] == asistencia_qr.INVALIDO
+
+
+def test_firmado_rotacion_y_revocacion(conn, clase):
+    a, b, c = clase["alumnos"]
+    sesion = tokens_firmados.nueva_sesion()
+    # dos códigos consecutivos de la misma sesión valen mientras no expiren
+    anterior = _firmado(clase, sesion=sesion, ahora=time.time() - 30)
+    actual = _firmado(clase, sesion=sesion)
+    assert asistencia_qr.registrar_asistencia_qr(conn, anterior, a)["estado"] == asistencia_qr.REGISTRADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, actual, b)["estado"] == asistencia_qr.REGISTRADA
+    # "Detener QR": ningún código de la sesión vale, tampoco tras recargar la lista
+    fin = datetime.datetime.utcnow() + datetime.timedelta(minutes=5)
+    tokens_firmados.revocar_sesion(conn, sesion, clase["materiaid"], fin)
+    assert asistencia_qr.registrar_asistencia_qr(conn, actual, c)["estado"] == asistencia_qr.INVALIDO
+    tokens_firmados._recargar_revocadas()
+    assert tokens_firmados.sesion_revocada(sesion)
+    assert asistencia_qr.registrar_asistencia_qr(conn, _firmado(clase, sesion=sesion), c)["estado"] == asistencia_qr.INVALIDO
+    # otra sesión de la misma materia no se ve afectada
+    assert asistencia_qr.registrar_asistencia_qr(conn, _firmado(clase), c)["estado"] == asistencia_qr.REGISTRADA
+
+
+def test_firmado_single_use_concurrente(conn, clase):
+    token = _firmado(clase, single_use=True)
+    barrera = threading.Barrier(len(clase["alumnos"]))
+    estados = []
+
+    def escanear(matricula):
+        with get_connection() as c:
+            barrera.wait()
+            estados.append(asistencia_qr.registrar_asistencia_qr(c, token, matricula)["estado"])
+
+    hilos = [threading.Thread(target=escanear, args=(m,)) for m in clase["alumnos"]]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert sorted(estados) == sorted([asistencia_qr.REGISTRADA] + [asistencia_qr.INVALIDO] * (len(hilos) - 1))
+    assert _registros(conn, clase) == 1
+    # el consumo quedó anotado una vez en qr_revocados
+    assert conn.execute(text("SELECT COUNT(*) FROM qr_revocados WHERE huella = :h"),
+                        {"h": tokens_firmados.verificar(token)["huella"]}).scalar() == 1
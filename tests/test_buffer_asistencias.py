@@ -0,0 +1,97 @@
+import datetime
+import json
+import os
+
+import pytest
+from sqlalchemy import event, text
+
+import asistencia_qr
+import buffer_asistencias
+import referencias
+from conftest import crear_token
+
+
+@pytest.fixture
+def base_journal(tmp_path):
+    return str(tmp_path / "checkins_pendientes.jsonl")
+
+
+def _fila(matricula, materiaid=1, fecha="2025-03-03"):
+    return json.dumps({"matricula": matricula, "maestroid": 1, "materiaid": materiaid,
+                       "fecha": fecha, "estado": "Presente"}) + "\n"
+
+
+def test_journal_por_proceso(esquema, base_journal):
+    buf = buffer_asistencias.BufferAsistencias(journal=base_journal, intervalo=3600)
+    assert buf.journal == buffer_asistencias._journal_de(base_journal, os.getpid())
+    buf.encolar(1, 1, 1, datetime.date(2025, 3, 3))
+    with open(buf.journal, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+    assert not os.path.exists(base_journal)
+
+
+def test_recupera_solo_journals_de_procesos_muertos(esquema, base_journal, monkeypatch):
+    vivo = buffer_asistencias._journal_de(base_journal, 111)
+    muerto = buffer_asistencias._journal_de(base_journal, 222)
+    for ruta, matricula in [(vivo, 1), (muerto, 2), (base_journal, 3)]:
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(_fila(matricula))
+    with open(muerto, "a", encoding="utf-8") as f:
+        f.write('{"matricula": 9, "fech')   # línea cortada por la caída
+    monkeypatch.setattr(buffer_asistencias, "_vivo", lambda pid: pid == 111)
+    monkeypatch.setattr(buffer_asistencias.BufferAsistencias, "_arrancar", lambda self: None)
+    buf = buffer_asistencias.BufferAsistencias(journal=base_journal)
+    assert sorted(m for m, _, _ in buf._pendientes) == [2, 3]
+    # el journal del proceso vivo no se toca; lo recuperado vive ahora en el propio
+    assert os.path.exists(vivo)
+    assert not os.path.exists(muerto) and not os.path.exists(base_journal)
+    with open(buf.journal, encoding="utf-8") as f:
+        assert sorted(json.loads(l)["matricula"] for l in f) == [2, 3]
+
+
+def test_diferido_no_confirma_dos_veces_lo_ya_escrito(conn, clase, tmp_path, monkeypatch):
+    buf = buffer_asistencias.BufferAsistencias(journal=str(tmp_path / "j.jsonl"), intervalo=3600)
+    monkeypatch.setattr(buffer_asistencias, "ACTIVO", True)
+    monkeypatch.setattr(buffer_asistencias, "get_buffer", lambda: buf)
+    token = crear_token(conn, clase)
+    alumno = clase["alumnos"][0]
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, alumno)["estado"] == asistencia_qr.REGISTRADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, alumno)["estado"] == asistencia_qr.DUPLICADA
+    buf.vaciar()
+    assert conn.execute(text("SELECT COUNT(*) FROM asistencias WHERE matricula = :m"), {"m": alumno}).scalar() == 1
+    # ya en la base y fuera de la cola: sigue siendo duplicado
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, alumno)["estado"] == asistencia_qr.DUPLICADA
+    assert not os.path.exists(buf.journal)
+
+
+def test_diferido_sin_idas_a_la_base(conn, clase, tmp_path, monkeypatch):
+    buf = buffer_asistencias.BufferAsistencias(journal=str(tmp_path / "j.jsonl"), intervalo=3600)
+    monkeypatch.setattr(buffer_asistencias, "ACTIVO", True)
+    monkeypatch.setattr(buffer_asistencias, "get_buffer", lambda: buf)
+    a, b, c = clase["alumnos"]
+    token = crear_token(conn, clase)
+    # el primer escaneo del token va por el camino síncrono y lo deja en caché
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    referencias.inscritos(conn, clase["materiaid"])
+    # c ya quedó registrado por otro proceso: aquí no se sabe
+    conn.execute(text("""
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        VALUES (:m, :ma, :mid, :f, 'Presente')
+    """), {"m": c, "ma": clase["maestroid"], "mid": clase["materiaid"], "f": datetime.date.today()})
+    conn.commit()
+    sentencias = []
+
+    def anotar(conn_, cursor, sql, *args):
+        sentencias.append(sql)
+    event.listen(conn.engine, "before_cursor_execute", anotar)
+    try:
+        estados = [asistencia_qr.registrar_asistencia_qr(conn, token, m)["estado"] for m in (a, b, b, c)]
+    finally:
+        event.remove(conn.engine, "before_cursor_execute", anotar)
+    assert sentencias == []
+    assert estados == [asistencia_qr.DUPLICADA, asistencia_qr.REGISTRADA, asistencia_qr.DUPLICADA, asistencia_qr.REGISTRADA]
+    # el ON CONFLICT del lote resuelve lo que se escapó
+    buf.vaciar()
+    filas = conn.execute(text("SELECT matricula, COUNT(*) FROM asistencias WHERE materiaid = :mid GROUP BY matricula"),
+                         {"mid": clase["materiaid"]}).fetchall()
+    assert sorted(tuple(f) for f in filas) == sorted([(a, 1), (b, 1), (c, 1)])
@@ -0,0 +1,87 @@
+import asyncio
+import urllib.parse
+
+from sqlalchemy import text
+
+import asistencia_qr
+import checkin_api
+import seguridad
+from conftest import crear_token, nuevo_id
+
+
+def _pedir(metodo, token, cookie=None, form=None):
+    # una solicitud HTTP directo a la app ASGI; (status, html, set-cookie)
+    cuerpo = urllib.parse.urlencode(dict(form or {}, qr_token=token)).encode() if form is not None else b""
+    encabezados = [(b"host", b"prueba")]
+    if cookie:
+        encabezados.append((b"cookie", f"{checkin_api.COOKIE}={cookie}".encode()))
+    if form is not None:
+        encabezados.append((b"content-type", b"application/x-www-form-urlencoded"))
+    scope = {"type": "http", "method": metodo, "path": "/checkin", "headers": encabezados,
+             "query_string": b"" if form is not None else urllib.parse.urlencode({"qr_token": token}).encode(),
+             "client": ("127.0.0.1", 50000)}
+    mensajes = []
+
+    async def receive():
+        return {"type": "http.request", "body": cuerpo, "more_body": False}
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+
+    asyncio.run(checkin_api.app(scope, receive, send))
+    inicio = next(m for m in mensajes if m["type"] == "http.response.start")
+    galleta = dict(inicio["headers"]).get(b"set-cookie")
+    if galleta:
+        galleta = galleta.decode().split(";")[0].split("=", 1)[1]
+    html = b"".join(m.get("body", b"") for m in mensajes if m["type"] == "http.response.body").decode()
+    return inicio["status"], html, galleta
+
+
+def _cuenta(conn, matricula, password="secreta"):
+    nombre = f"alumno{nuevo_id()}"
+    conn.execute(text("INSERT INTO usuarios (nombreusuario, contrasena, rol, matricula) VALUES (:u, :p, 'alumno', :m)"),
+                 {"u": nombre, "p": seguridad.hash_password(password), "m": matricula})
+    conn.commit()
+    return nombre
+
+
+def _mensaje(estado):
+    return checkin_api._MENSAJES[estado][1]
+
+
+def test_login_cookie_y_duplicado(conn, clase):
+    token = crear_token(conn, clase)
+    usuario = _cuenta(conn, clase["alumnos"][0])
+    status, html, _ = _pedir("GET", token)
+    assert status == 200 and 'name="contrasena"' in html
+    status, html, cookie = _pedir("POST", token, form={"usuario": usuario, "contrasena": "secreta"})
+    assert status == 200 and _mensaje(asistencia_qr.REGISTRADA) in html
+    assert cookie
+    # el siguiente escaneo entra con la cookie
+    status, html, _ = _pedir("GET", token, cookie=cookie)
+    assert status == 200 and _mensaje(asistencia_qr.DUPLICADA) in html
+
+
+def test_no_inscrito(conn, clase):
+    token = crear_token(conn, clase)
+    ajeno = nuevo_id()
+    conn.execute(text("INSERT INTO alumnos (matricula, nombre, apellido) VALUES (:m, 'Otro', 'Grupo')"), {"m": ajeno})
+    conn.commit()
+    usuario = _cuenta(conn, ajeno)
+    status, html, _ = _pedir("POST", token, form={"usuario": usuario, "contrasena": "secreta"})
+    assert status == 200 and _mensaje(asistencia_qr.NO_INSCRITO) in html
+
+
+def test_cambiar_contrasena_revoca_la_cookie(conn, clase):
+    token = crear_token(conn, clase)
+    usuario = _cuenta(conn, clase["alumnos"][1])
+    _, _, cookie = _pedir("POST", token, form={"usuario": usuario, "contrasena": "secreta"})
+    conn.execute(text("UPDATE usuarios SET contrasena = :p WHERE nombreusuario = :u"),
+                 {"p": seguridad.hash_password("nueva"), "u": usuario})
+    conn.commit()
+    status, html, _ = _pedir("GET", token, cookie=cookie)
+    assert status == 200 and 'name="contrasena"' in html
+    # una cookie alterada tampoco entra
+    usuarioid, expira, mac = cookie.split(".")
+    _, html, _ = _pedir("GET", token, cookie=f"{int(usuarioid) + 1}.{expira}.{mac}")
+    assert 'name="contrasena"' in html
@@ -0,0 +1,32 @@
+import datetime
+import time
+
+from sqlalchemy import text
+
+import asistencia_qr
+import checkins_vivo
+import consultas
+from conftest import crear_token
+
+
+def test_qr_sobre_ausente_se_ve_en_el_panel(conn, clase, monkeypatch):
+    monkeypatch.setattr(checkins_vivo, "INTERVALO", 0)
+    monkeypatch.setattr(checkins_vivo, "FOTO_SEG", 0.2)
+    a, b, _ = clase["alumnos"]
+    mid, ma = clase["materiaid"], clase["maestroid"]
+    hoy = datetime.date.today()
+    consultas.guardar_lista(conn, mid, ma, hoy, {}, {a: "Ausente"})
+    assert checkins_vivo.registrados(mid, hoy) == {a: "Ausente"}
+    # muchas altas después: la fila de a queda lejos de la marca de agua
+    for d in range(1, checkins_vivo.SOLAPE + 100):
+        conn.execute(text("""
+            INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+            VALUES (:b, :ma, :mid, :f, 'Presente')
+        """), {"b": b, "ma": ma, "mid": mid, "f": hoy - datetime.timedelta(days=d)})
+    conn.commit()
+    assert checkins_vivo.registrados(mid, hoy) == {a: "Ausente"}
+    # el QR convierte el Ausente en Presente sin fila nueva
+    token = crear_token(conn, clase)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    time.sleep(0.25)
+    assert checkins_vivo.registrados(mid, hoy) == {a: "Presente"}
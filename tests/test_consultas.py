@@ -0,0 +1,95 @@
+import datetime
+
+from sqlalchemy import text
+
+import asistencia_qr
+import consultas
+from conftest import crear_token, nuevo_id
+
+
+def _estados(conn, clase, fecha):
+    filas = conn.execute(text("SELECT matricula, estado FROM asistencias WHERE materiaid = :mid AND fecha = :f"),
+                         {"mid": clase["materiaid"], "f": fecha}).fetchall()
+    return dict(filas)
+
+
+def test_guardar_lista_no_pisa_un_qr_posterior(conn, clase):
+    a, b, c = clase["alumnos"]
+    hoy = datetime.date.today()
+    lista = consultas.lista_clase(conn, clase["materiaid"], hoy)
+    assert set(lista["estado"]) == {"Ausente"}
+    # el alumno escanea mientras el maestro tiene la lista abierta
+    token = crear_token(conn, clase)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    # el maestro solo cambió a c; a y b quedan con el Ausente por omisión
+    consultas.guardar_lista(conn, clase["materiaid"], clase["maestroid"], hoy,
+                            {c: "Retardo"}, {a: "Ausente", b: "Ausente"})
+    assert _estados(conn, clase, hoy) == {a: "Presente", b: "Ausente", c: "Retardo"}
+
+
+def test_qr_despues_de_la_lista_reemplaza_ausente(conn, clase):
+    a, b, _ = clase["alumnos"]
+    hoy = datetime.date.today()
+    consultas.guardar_lista(conn, clase["materiaid"], clase["maestroid"], hoy, {b: "Retardo"}, {a: "Ausente"})
+    token = crear_token(conn, clase)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.DUPLICADA
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, b)["estado"] == asistencia_qr.DUPLICADA
+    assert _estados(conn, clase, hoy) == {a: "Presente", b: "Retardo"}
+
+
+def _recorrer(conn, filtros, tamano):
+    # sigue el cursor hasta el final; devuelve los ids y el tamaño de cada página
+    ids, paginas, cursor = [], [], None
+    while True:
+        df, cursor = consultas.pagina_asistencias(conn, filtros, cursor, tamano)
+        ids += [int(i) for i in df["asistenciaid"]]
+        paginas.append(len(df))
+        if cursor is None:
+            return ids, paginas
+
+
+def test_paginacion_por_keyset(conn, clase):
+    # otra materia de otro maestro con los mismos alumnos
+    otro_maestro, otra_materia = nuevo_id(), nuevo_id()
+    conn.execute(text("INSERT INTO maestros (maestroid, nombre, apellido) VALUES (:m, 'Prof', 'Otro')"), {"m": otro_maestro})
+    conn.execute(text("INSERT INTO materias (materiaid, nombre, maestroid, horario) VALUES (:mid, 'Otra', :m, '08:00 - 08:50')"),
+                 {"mid": otra_materia, "m": otro_maestro})
+    # varias filas por fecha: el desempate por asistenciaid cruza páginas
+    inicio = datetime.date(2024, 3, 1)
+    for dia in range(5):
+        for matricula in clase["alumnos"]:
+            for maestroid, materiaid in ((clase["maestroid"], clase["materiaid"]), (otro_maestro, otra_materia)):
+                conn.execute(text("""
+                    INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+                    VALUES (:m, :ma, :mid, :f, 'Presente')
+                """), {"m": matricula, "ma": maestroid, "mid": materiaid, "f": inicio + datetime.timedelta(days=dia)})
+    conn.commit()
+
+    def esperado(where, params):
+        filas = conn.execute(text(f"SELECT asistenciaid FROM asistencias WHERE {where} ORDER BY fecha DESC, asistenciaid DESC"),
+                             params).fetchall()
+        return [int(f[0]) for f in filas]
+
+    # 15 filas en páginas de 4: cada fila una sola vez y en orden
+    ids, paginas = _recorrer(conn, {"materiaid": clase["materiaid"]}, 4)
+    assert ids == esperado("materiaid = :mid", {"mid": clase["materiaid"]})
+    assert len(ids) == len(set(ids)) == 15
+    assert paginas == [4, 4, 4, 3]
+
+    # filtro por maestro: la otra materia nunca aparece
+    ids, _ = _recorrer(conn, {"maestroid": otro_maestro}, 4)
+    assert ids == esperado("maestroid = :ma", {"ma": otro_maestro})
+    assert len(ids) == 15
+
+    # rango de fechas con exactamente dos páginas: la última no deja cursor
+    filtros = {"materiaid": otra_materia, "desde": inicio + datetime.timedelta(days=1),
+               "hasta": inicio + datetime.timedelta(days=2)}
+    ids, paginas = _recorrer(conn, filtros, 3)
+    assert ids == esperado("materiaid = :mid AND fecha BETWEEN :d AND :h",
+                           {"mid": otra_materia, "d": filtros["desde"], "h": filtros["hasta"]})
+    assert paginas == [3, 3]
+
+    # sin resultados
+    df, cursor = consultas.pagina_asistencias(conn, {"materiaid": otra_materia, "desde": datetime.date(2030, 1, 1)})
+    assert df.empty and cursor is None
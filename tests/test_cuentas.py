@@ -0,0 +1,61 @@
+import bcrypt
+import pandas as pd
+from sqlalchemy import text
+
+import cuentas
+from conftest import nuevo_id
+
+
+def _personas(*ids):
+    return pd.DataFrame({"id": list(ids), "nombre": "Alumno", "apellido": "Prueba"})
+
+
+def _usuarios(conn, matriculas):
+    filas = conn.execute(text(f"SELECT nombreusuario, contrasena FROM usuarios WHERE matricula IN ({', '.join(map(str, matriculas))})"))
+    return dict(filas.fetchall())
+
+
+def test_usuarios_dados_y_generados():
+    df, rechazos = cuentas.preparar_credenciales(_personas(1, 2, 3), "alumno")
+    assert list(df["usuario"]) == ["a1", "a2", "a3"]
+    assert df["contrasena"].str.len().eq(10).all() and df["contrasena"].nunique() == 3
+    assert rechazos.empty
+
+    dadas = pd.DataFrame({"id": ["1", "2", "x", "1", "99", "2.5"],
+                          "usuario": ["ana", "", "", "", "", ""],
+                          "contrasena": ["", "fija", "", "", "", ""]})
+    df, rechazos = cuentas.preparar_credenciales(_personas(1, 2, 3), "alumno", dadas)
+    # solo las personas con fila válida en el CSV; lo que viene vacío se genera
+    assert list(df["id"]) == [1, 2]
+    assert list(df["usuario"]) == ["ana", "a2"]
+    assert df.loc[1, "contrasena"] == "fija" and len(df.loc[0, "contrasena"]) == 10
+    assert list(zip(rechazos["fila"], rechazos["motivo"])) == [
+        (4, "id no es un número"), (5, "id repetido en el archivo"),
+        (6, "id no existe o ya tiene cuenta"), (7, "id no es un número"),
+    ]
+
+
+def test_provisionar_crea_hashes_validos_y_no_repite(conn, clase):
+    conn.rollback()
+    hoja, rechazos = cuentas.provisionar("alumno", ids=clase["alumnos"], costo=4, hilos=2)
+    assert rechazos.empty
+    assert hoja["creada"].all() and sorted(hoja["id"]) == sorted(clase["alumnos"])
+    guardados = _usuarios(conn, clase["alumnos"])
+    for fila in hoja.itertuples():
+        assert bcrypt.checkpw(fila.contrasena.encode(), guardados[fila.usuario].encode())
+    # todos tienen ya cuenta: no hay nada más que crear
+    hoja, _ = cuentas.provisionar("alumno", ids=clase["alumnos"], costo=4)
+    assert hoja.empty
+
+
+def test_usuario_ocupado_no_tumba_el_lote(conn, clase):
+    a, b, c = clase["alumnos"]
+    ocupado = f"ocupado{nuevo_id()}"
+    conn.execute(text("INSERT INTO usuarios (nombreusuario, contrasena, rol) VALUES (:u, 'x', 'alumno')"), {"u": ocupado})
+    conn.commit()
+    # a choca con una cuenta existente; c pide el mismo usuario que b en la misma carga
+    df = pd.DataFrame({"id": [a, b, c], "usuario": [ocupado, f"u{b}", f"u{b}"]})
+    creada = cuentas.insertar(conn, "alumno", df, ["h1", "h2", "h3"])
+    assert list(creada) == [False, True, False]
+    filas = conn.execute(text(f"SELECT nombreusuario, matricula FROM usuarios WHERE matricula IN ({a}, {b}, {c})")).fetchall()
+    assert [tuple(f) for f in filas] == [(f"u{b}", b)]
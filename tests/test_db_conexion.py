@@ -0,0 +1,32 @@
+import sqlite3
+
+from sqlalchemy.pool import QueuePool
+
+import db_conexion
+
+
+def _pool(tamano, overflow):
+    return QueuePool(lambda: sqlite3.connect(":memory:", check_same_thread=False),
+                     pool_size=tamano, max_overflow=overflow, timeout=0.1)
+
+
+def test_pool_lleno_solo_sin_conexiones_libres(monkeypatch):
+    monkeypatch.setattr(db_conexion, "MAX_OVERFLOW", 1)
+    pool = _pool(1, 1)
+    assert not db_conexion._pool_lleno(pool)
+    a = pool.connect()
+    assert not db_conexion._pool_lleno(pool)   # queda el overflow
+    b = pool.connect()
+    assert db_conexion._pool_lleno(pool)
+    b.close()
+    assert not db_conexion._pool_lleno(pool)   # una libre para reusar
+    a.close()
+
+
+def test_overflow_sin_limite_nunca_esta_lleno(monkeypatch):
+    monkeypatch.setattr(db_conexion, "MAX_OVERFLOW", -1)
+    pool = _pool(1, -1)
+    conexiones = [pool.connect() for _ in range(5)]
+    assert not db_conexion._pool_lleno(pool)
+    for c in conexiones:
+        c.close()
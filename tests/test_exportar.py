@@ -0,0 +1,47 @@
+import io
+
+import pytest
+from sqlalchemy import text
+
+import exportar
+
+
+def test_csv_por_lotes(conn, clase):
+    destino = io.BytesIO()
+    filas = exportar.exportar(conn, "materias", destino, "csv", tamano_lote=2)
+    lineas = destino.getvalue().decode("utf-8").splitlines()
+    assert lineas[0].startswith("materiaid,")
+    assert len(lineas) == filas + 1
+
+
+def test_parquet_columna_nula_en_el_primer_lote(conn, clase):
+    pq = pytest.importorskip("pyarrow.parquet")
+    # la primera materia (por id) sin descripción ni horario; las demás con valores
+    conn.execute(text("INSERT INTO materias (materiaid, nombre) VALUES (1, 'Sin datos')"))
+    conn.execute(text("UPDATE materias SET descripcion = 'algo' WHERE materiaid = :mid"), {"mid": clase["materiaid"]})
+    conn.commit()
+    try:
+        destino = io.BytesIO()
+        filas = exportar.exportar(conn, "materias", destino, "parquet", tamano_lote=1)
+        destino.seek(0)
+        tabla = pq.read_table(destino)
+        assert tabla.num_rows == filas
+        assert str(tabla.schema.field("descripcion").type) == "string"
+        assert "algo" in tabla.column("descripcion").to_pylist()
+        # la conexión del llamador sigue sirviendo para escribir
+        conn.execute(text("UPDATE materias SET descripcion = NULL WHERE materiaid = :mid"), {"mid": clase["materiaid"]})
+        conn.commit()
+    finally:
+        conn.execute(text("DELETE FROM materias WHERE materiaid = 1"))
+        conn.commit()
+
+
+def test_parquet_sin_filas_es_valido(conn):
+    pq = pytest.importorskip("pyarrow.parquet")
+    destino = io.BytesIO()
+    filas = exportar.exportar(conn, "asistencias", destino, "parquet", desde="2999-01-01")
+    assert filas == 0
+    destino.seek(0)
+    tabla = pq.read_table(destino)
+    assert tabla.num_rows == 0
+    assert "asistenciaid" in tabla.schema.names
@@ -0,0 +1,45 @@
+import base64
+
+import pytest
+
+import imagenes_qr
+from cache import CacheTTL
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    # caché vacía propia y contador de renders reales
+    monkeypatch.setattr(imagenes_qr, "_cache_qr", CacheTTL("imagenes_qr_prueba", max_items=8, ttl=0))
+    llamadas = []
+    original = imagenes_qr._render_qr
+
+    def contar(*args):
+        llamadas.append(args)
+        return original(*args)
+    monkeypatch.setattr(imagenes_qr, "_render_qr", contar)
+    return llamadas
+
+
+def test_misma_url_no_se_vuelve_a_renderizar(renders):
+    uri = imagenes_qr.qr_data_uri("https://asistencia/checkin?t=abc", "png", "M", 4)
+    assert uri.startswith("data:image/png;base64,")
+    assert base64.b64decode(uri.split(",", 1)[1]).startswith(b"\x89PNG")
+    assert imagenes_qr.qr_data_uri("https://asistencia/checkin?t=abc", "png", "M", 4) == uri
+    assert len(renders) == 1
+    assert imagenes_qr._cache_qr.aciertos == 1
+
+    # otro token o otro tamaño: fallo de caché y render nuevo
+    assert imagenes_qr.qr_data_uri("https://asistencia/checkin?t=xyz", "png", "M", 4) != uri
+    assert imagenes_qr.qr_data_uri("https://asistencia/checkin?t=abc", "png", "M", 6) != uri
+    assert len(renders) == 3
+    assert imagenes_qr._cache_qr.fallos == 3
+
+
+def test_svg(renders):
+    uri = imagenes_qr.qr_data_uri("https://asistencia/checkin?t=abc", "SVG")
+    assert uri.startswith("data:image/svg+xml;base64,")
+    svg = base64.b64decode(uri.split(",", 1)[1])
+    assert b"<svg" in svg and b"</svg>" in svg
+    # no comparte entrada con el PNG de la misma URL
+    assert imagenes_qr.qr_data_uri("https://asistencia/checkin?t=abc", "png").startswith("data:image/png")
+    assert len(renders) == 2
@@ -0,0 +1,54 @@
+import io
+
+from sqlalchemy import text
+
+import importar
+
+
+def _siguiente(conn, tabla, id_col):
+    seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :t"), {"t": tabla}).scalar() or 0
+    return max(seq, conn.execute(text(f"SELECT COALESCE(MAX({id_col}), 0) FROM {tabla}")).scalar()) + 1
+
+
+def _archivos(conn):
+    # maestro, materias y alumnos sin id: las inscripciones los referencian
+    # con el id que les dará la carga
+    ma = _siguiente(conn, "maestros", "maestroid")
+    mid = _siguiente(conn, "materias", "materiaid")
+    mat = _siguiente(conn, "alumnos", "matricula")
+    return {
+        "maestros": "nombre,apellido\nAna,Ruiz\n",
+        "materias": f"nombre,maestroid,horario\nÁlgebra,{ma},08:00 - 08:50\nFísica,{ma},09:00 - 09:50\n",
+        "alumnos": "nombre,apellido\nLuis,Paz\nEva,Sol\n",
+        "inscripciones": (f"materiaid,matricula\n{mid},{mat}\n{mid},{mat + 1}\n{mid + 1},{mat}\n"
+                          f"{mid + 1},{mat + 1}\n{mid + 5},{mat}\n"),
+    }
+
+
+def _resumen(resultado):
+    return {nombre: (r["validas"], len(r["rechazos"])) for nombre, r in resultado.items()}
+
+
+def test_simulacion_resuelve_ids_de_la_misma_carga(conn):
+    archivos = _archivos(conn)
+    conn.rollback()
+    simulado = importar.importar({k: io.StringIO(v) for k, v in archivos.items()}, simular=True)
+    real = importar.importar({k: io.StringIO(v) for k, v in archivos.items()})
+    assert _resumen(simulado) == _resumen(real)
+    assert real["inscripciones"]["cargadas"] == 4
+    assert list(real["inscripciones"]["rechazos"]["motivo"]) == ["materiaid no existe"]
+    assert all(r["cargadas"] == 0 for r in simulado.values())
+
+
+def test_id_no_entero_se_rechaza(conn):
+    archivos = _archivos(conn)
+    conn.rollback()
+    # la matrícula decimal y la inscripción con materiaid decimal se rechazan;
+    # el resto de la carga sigue
+    archivos["alumnos"] = "matricula,nombre,apellido\n,Luis,Paz\n,Eva,Sol\n1.5,Raro,Decimal\n"
+    archivos["inscripciones"] += "2.5,1\n"
+    res = importar.importar({k: io.StringIO(v) for k, v in archivos.items()})
+    assert res["alumnos"]["cargadas"] == 2
+    assert list(res["alumnos"]["rechazos"]["motivo"]) == ["matricula no es un número"]
+    assert res["inscripciones"]["cargadas"] == 4
+    assert "materiaid no es un número" in list(res["inscripciones"]["rechazos"]["motivo"])
@@ -0,0 +1,63 @@
+import datetime
+
+from sqlalchemy import text
+
+import limpieza_tokens
+from conftest import crear_token, nuevo_id
+
+
+def _activos(conn, tokens):
+    filas = conn.execute(text(f"SELECT token, activo FROM qr_tokens WHERE token IN ({', '.join(map(repr, tokens))})"))
+    return {t: bool(a) for t, a in filas}
+
+
+def _viejo(conn, clase, dias=60):
+    # token inactivo creado hace `dias`
+    token = f"viejo-{nuevo_id()}"
+    creado = datetime.datetime.utcnow() - datetime.timedelta(days=dias)
+    conn.execute(text("""
+        INSERT INTO qr_tokens (token, materiaid, maestroid, fecha_creacion, expiracion, activo, single_use)
+        VALUES (:t, :mid, :ma, :c, :c, FALSE, FALSE)
+    """), {"t": token, "mid": clase["materiaid"], "ma": clase["maestroid"], "c": creado})
+    conn.commit()
+    return token
+
+
+def _existe(conn, tabla, token):
+    return conn.execute(text(f"SELECT COUNT(*) FROM {tabla} WHERE token = :t"), {"t": token}).scalar() == 1
+
+
+def test_desactiva_solo_expirados_por_lotes(conn, clase):
+    expirados = [crear_token(conn, clase, minutos=-1) for _ in range(5)]
+    vigente = crear_token(conn, clase)
+    assert limpieza_tokens.desactivar_expirados(conn, lote=2, maestroid=clase["maestroid"]) == 5
+    assert _activos(conn, expirados + [vigente]) == {**{t: False for t in expirados}, vigente: True}
+    assert limpieza_tokens.desactivar_expirados(conn, lote=2, maestroid=clase["maestroid"]) == 0
+
+
+def test_filtro_por_maestro(conn, clase):
+    otro = dict(clase, maestroid=nuevo_id())
+    mio, ajeno = crear_token(conn, clase, minutos=-1), crear_token(conn, otro, minutos=-1)
+    assert limpieza_tokens.desactivar_expirados(conn, maestroid=clase["maestroid"]) == 1
+    assert _activos(conn, [mio, ajeno]) == {mio: False, ajeno: True}
+
+
+def test_barrido_archiva_viejos_y_purga_revocados(conn, clase):
+    viejo, reciente = _viejo(conn, clase), _viejo(conn, clase, dias=1)
+    huella = f"s:{nuevo_id()}"
+    conn.execute(text("INSERT INTO qr_revocados (huella, materiaid, expira) VALUES (:h, :mid, :e)"),
+                 {"h": huella, "mid": clase["materiaid"], "e": datetime.datetime.utcnow() - datetime.timedelta(minutes=1)})
+    conn.commit()
+    resultado = limpieza_tokens.barrer()   # QR_ARCHIVAR por defecto: archiva
+    assert resultado["archivados"] >= 1 and resultado["revocados_purgados"] >= 1
+    assert not _existe(conn, "qr_tokens", viejo) and _existe(conn, "qr_tokens_archivo", viejo)
+    # dentro de la retención se queda donde está
+    assert _existe(conn, "qr_tokens", reciente) and not _existe(conn, "qr_tokens_archivo", reciente)
+    assert conn.execute(text("SELECT COUNT(*) FROM qr_revocados WHERE huella = :h"), {"h": huella}).scalar() == 0
+    assert limpieza_tokens.ultimo_barrido == resultado
+
+
+def test_purga_sin_archivar(conn, clase):
+    viejo = _viejo(conn, clase)
+    assert limpieza_tokens.purgar_antiguos(conn, archivar=False, lote=1) >= 1
+    assert not _existe(conn, "qr_tokens", viejo) and not _existe(conn, "qr_tokens_archivo", viejo)
@@ -0,0 +1,23 @@
+from sqlalchemy import create_engine, event, text
+
+import metricas_sql
+
+
+def test_solo_se_explican_lecturas(monkeypatch):
+    monkeypatch.setattr(metricas_sql, "_sentencias", {})
+    engine = create_engine("sqlite://")
+    event.listen(engine, "before_cursor_execute", metricas_sql._antes)
+    event.listen(engine, "after_cursor_execute", metricas_sql._despues)
+    lectura = "SELECT n FROM t WHERE n > :n"
+    escritura = "WITH x AS (SELECT :n AS n) INSERT INTO t (n) SELECT n FROM x"
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (n INT)"))
+        conn.execute(text(escritura), {"n": 1})
+        conn.execute(text(lectura), {"n": 0})
+        conn.commit()
+        explicable = {s["sentencia"]: s["explicable"] for s in metricas_sql.sentencias()}
+        assert explicable[metricas_sql.normalizar(lectura.replace(":n", "?"))]
+        assert not explicable[metricas_sql.normalizar(escritura.replace(":n", "?"))]
+        assert metricas_sql.explicar(conn, metricas_sql.normalizar(escritura.replace(":n", "?")), analizar=True) is None
+        assert metricas_sql.explicar(conn, metricas_sql.normalizar(lectura.replace(":n", "?")))
+        assert conn.execute(text("SELECT COUNT(*) FROM t")).scalar() == 1
@@ -0,0 +1,56 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import text
+
+import migraciones
+
+
+def _engine(tmp_path):
+    return sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'vacia.db'}")
+
+
+def test_migraciones_desde_base_vacia(tmp_path):
+    engine = _engine(tmp_path)
+    # al arrancar solo se revisa la versión: una base atrasada no se migra
+    with pytest.raises(RuntimeError, match="python migraciones.py"):
+        migraciones.asegurar_esquema(engine)
+    with engine.connect() as conn:
+        assert migraciones.version_actual(conn) == 0
+    aplicadas = migraciones.aplicar_migraciones(engine)
+    assert aplicadas == [v for v, _, _ in migraciones.MIGRACIONES]
+    with engine.connect() as conn:
+        assert migraciones.version_actual(conn) == migraciones.VERSION_ESPERADA
+        tablas = set(sqlalchemy.inspect(conn).get_table_names())
+        indices_tokens = {i["name"] for i in sqlalchemy.inspect(conn).get_indexes("qr_tokens")}
+    # la 4 lo crea y la 9 lo quita: duplicaba el UNIQUE de token
+    assert "ix_qr_tokens_activos" not in indices_tokens
+    assert "ix_qr_tokens_activos_expiracion" in indices_tokens
+    assert {"usuarios", "alumnos", "asistencias", "asistencias_diarias", "qr_tokens", "qr_revocados"} <= tablas
+    # una segunda corrida no hace nada
+    assert migraciones.aplicar_migraciones(engine) == []
+    assert migraciones.asegurar_esquema(engine) == migraciones.VERSION_ESPERADA
+
+
+def test_duplicados_conservan_el_estado_mas_informativo(tmp_path, monkeypatch):
+    engine = _engine(tmp_path)
+    todas = migraciones.MIGRACIONES
+    monkeypatch.setattr(migraciones, "MIGRACIONES", todas[:1])
+    migraciones.aplicar_migraciones(engine)
+    with engine.begin() as conn:
+        for aid, estado in [(1, "Ausente"), (2, "Presente"), (3, "Retardo"), (4, "Ausente")]:
+            conn.execute(text("""
+                INSERT INTO asistencias (asistenciaid, matricula, maestroid, materiaid, fecha, estado)
+                VALUES (:id, 7, 1, 1, '2025-03-03', :e)
+            """), {"id": aid, "e": estado})
+        conn.execute(text("""
+            INSERT INTO asistencias (asistenciaid, matricula, maestroid, materiaid, fecha, estado)
+            VALUES (5, 8, 1, 1, '2025-03-03', 'Ausente')
+        """))
+    monkeypatch.setattr(migraciones, "MIGRACIONES", todas)
+    migraciones.aplicar_migraciones(engine)
+    with engine.connect() as conn:
+        quedan = conn.execute(text("SELECT asistenciaid, estado FROM asistencias ORDER BY asistenciaid")).fetchall()
+        descartadas = conn.execute(text(
+            "SELECT asistenciaid, estado, conservada FROM asistencias_descartadas ORDER BY asistenciaid")).fetchall()
+    assert [tuple(f) for f in quedan] == [(2, "Presente"), (5, "Ausente")]
+    assert [tuple(f) for f in descartadas] == [(1, "Ausente", 2), (3, "Retardo", 2), (4, "Ausente", 2)]
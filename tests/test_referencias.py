@@ -0,0 +1,78 @@
+from sqlalchemy import text
+
+import referencias
+from conftest import nuevo_id
+
+
+def _materia(conn, maestroid, nombre, horario):
+    materiaid = nuevo_id()
+    conn.execute(text("INSERT INTO materias (materiaid, nombre, maestroid, horario) VALUES (:mid, :n, :m, :h)"),
+                 {"mid": materiaid, "n": nombre, "m": maestroid, "h": horario})
+    return materiaid
+
+
+def test_materias_con_el_mismo_nombre_se_distinguen_por_id(conn, clase):
+    nombre = f"Cálculo {nuevo_id()}"
+    primera = _materia(conn, clase["maestroid"], nombre, "09:20 - 10:10")
+    segunda = _materia(conn, clase["maestroid"], nombre, "10:10 - 11:00")
+    conn.commit()
+    referencias.invalidar("materias")
+    ids, etiquetas = referencias.indice(conn, "materias", maestroid=clase["maestroid"])
+    assert {primera, segunda} <= set(ids)
+    assert etiquetas[primera] == f"{nombre} (09:20 - 10:10)"
+    assert etiquetas[segunda] == f"{nombre} (10:10 - 11:00)"
+    tabla = referencias.por_id(conn, "materias")
+    assert tabla.at[primera, "horario"] == "09:20 - 10:10"
+    assert tabla.at[segunda, "horario"] == "10:10 - 11:00"
+
+
+def test_invalidar_trae_datos_nuevos(conn, clase):
+    materiaid = clase["materiaid"]
+    antes = referencias.indice(conn, "materias")[1][materiaid]
+    conn.execute(text("UPDATE materias SET nombre = 'Renombrada', horario = '11:00 - 11:50' WHERE materiaid = :mid"),
+                 {"mid": materiaid})
+    conn.commit()
+    # sin invalidar se sigue sirviendo la versión en caché
+    assert referencias.indice(conn, "materias")[1][materiaid] == antes
+    version = referencias.version("materias")
+    referencias.invalidar("materias")
+    assert referencias.version("materias") == version + 1
+    assert referencias.indice(conn, "materias")[1][materiaid] == "Renombrada (11:00 - 11:50)"
+    assert referencias.por_id(conn, "materias").at[materiaid, "horario"] == "11:00 - 11:50"
+
+
+def _alumnos(conn, *nombres):
+    ids = []
+    for nombre in nombres:
+        ids.append(nuevo_id())
+        conn.execute(text("INSERT INTO alumnos (matricula, nombre, apellido) VALUES (:m, :n, 'Buscado')"),
+                     {"m": ids[-1], "n": nombre})
+    conn.commit()
+    referencias.invalidar("alumnos")
+    return ids
+
+
+def _prefijo():
+    # letras únicas por prueba: la base es compartida
+    return "Qz" + "".join("abcdefghij"[int(d)] for d in str(nuevo_id()))
+
+
+def test_buscar_prefijo_sin_mayusculas_y_con_limite(conn):
+    p = _prefijo()
+    ana, andres, otro = _alumnos(conn, p + "ana", p + "andrés", "X" + p)
+    ids, etiquetas = referencias.buscar(conn, "alumnos", p.upper() + "AN")
+    assert sorted(ids) == sorted([ana, andres])
+    assert etiquetas[ana].startswith(p + "ana Buscado")
+    # todos los términos deben coincidir (nombre o apellido)
+    assert referencias.buscar(conn, "alumnos", f"{p}ana busc")[0] == [ana]
+    assert referencias.buscar(conn, "alumnos", p + "an", limite=1)[0] == [ana]
+    assert referencias.buscar(conn, "alumnos", "   ") == ([], {})
+
+
+def test_buscar_comodines_de_like_son_literales(conn):
+    p = _prefijo()
+    guion, letra, por_ciento = _alumnos(conn, p + "_x", p + "ax", p + "%x")
+    assert referencias.buscar(conn, "alumnos", p + "_")[0] == [guion]
+    assert referencias.buscar(conn, "alumnos", p + "%")[0] == [por_ciento]
+    assert referencias.buscar(conn, "alumnos", p + "\\")[0] == []
+    assert sorted(referencias.buscar(conn, "alumnos", p)[0]) == sorted([guion, letra, por_ciento])
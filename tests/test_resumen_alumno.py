@@ -0,0 +1,66 @@
+import datetime
+
+from sqlalchemy import text
+
+import asistencia_qr
+import consultas
+import resumen_alumno
+from conftest import crear_token
+
+
+def _fila(conn, matricula, materiaid):
+    df = resumen_alumno.resumen(conn, matricula)
+    return df[df["materiaid"] == materiaid].iloc[0]
+
+
+def test_porcentajes(conn, clase):
+    a, b, c = clase["alumnos"]
+    mid, ma = clase["materiaid"], clase["maestroid"]
+    dias = [datetime.date(2025, 2, d) for d in (3, 4, 5, 6)]
+    consultas.guardar_lista(conn, mid, ma, dias[0], {a: "Presente", b: "Ausente"})
+    consultas.guardar_lista(conn, mid, ma, dias[1], {a: "Retardo", b: "Presente"})
+    consultas.guardar_lista(conn, mid, ma, dias[2], {a: "Ausente"})
+    consultas.guardar_lista(conn, mid, ma, dias[3], {b: "Presente"})
+    # a: 2 de 4 sesiones (la del día 6 sin registro cuenta como falta)
+    fila = _fila(conn, a, mid)
+    assert (fila["presente"], fila["retardo"], fila["ausente"]) == (1, 1, 1)
+    assert (fila["sesiones"], fila["sin_registro"], fila["porcentaje"]) == (4, 1, 50.0)
+    # b: Ausente, Presente, sin registro, Presente
+    fila = _fila(conn, b, mid)
+    assert (fila["presente"], fila["ausente"], fila["sin_registro"], fila["porcentaje"]) == (2, 1, 1, 50.0)
+    # c está inscrito pero nunca tuvo registro
+    fila = _fila(conn, c, mid)
+    assert (fila["sesiones"], fila["sin_registro"], fila["porcentaje"]) == (4, 4, 0.0)
+    assert resumen_alumno.totales(resumen_alumno.resumen(conn, a))["porcentaje"] == 50.0
+
+
+def test_materia_sin_sesiones(conn, clase):
+    fila = _fila(conn, clase["alumnos"][0], clase["materiaid"])
+    assert fila["sesiones"] == 0 and fila["porcentaje"] != fila["porcentaje"]   # NaN
+    assert resumen_alumno.totales(resumen_alumno.resumen(conn, clase["alumnos"][0]))["porcentaje"] is None
+
+
+def test_invalidacion(conn, clase):
+    a, b, c = clase["alumnos"]
+    mid, ma = clase["materiaid"], clase["maestroid"]
+    hoy = datetime.date.today()
+    ayer = hoy - datetime.timedelta(days=1)
+    consultas.guardar_lista(conn, mid, ma, ayer, {a: "Presente", b: "Presente"})
+    assert _fila(conn, a, mid)["porcentaje"] == 100.0
+    assert _fila(conn, c, mid)["sesiones"] == 1
+    # check-in QR de a: su resumen se recalcula
+    token = crear_token(conn, clase)
+    assert asistencia_qr.registrar_asistencia_qr(conn, token, a)["estado"] == asistencia_qr.REGISTRADA
+    assert _fila(conn, a, mid)["presente"] == 2
+    # la sesión nueva de hoy la agregó un compañero: c también la ve
+    assert _fila(conn, c, mid)["sesiones"] == 2
+    # el pase de lista que cambia a b invalida su resumen
+    consultas.guardar_lista(conn, mid, ma, ayer, {b: "Retardo"})
+    fila = _fila(conn, b, mid)
+    assert (fila["presente"], fila["retardo"], fila["porcentaje"]) == (0, 1, 50.0)
+    # una escritura por fuera de los hooks no se ve hasta invalidar
+    conn.execute(text("DELETE FROM asistencias WHERE matricula = :b AND materiaid = :mid"), {"b": b, "mid": mid})
+    conn.commit()
+    assert _fila(conn, b, mid)["retardo"] == 1
+    resumen_alumno.invalidar([b])
+    assert _fila(conn, b, mid)["retardo"] == 0
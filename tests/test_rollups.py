@@ -0,0 +1,66 @@
+import datetime
+
+from sqlalchemy import text
+
+import consultas
+import rollups
+
+
+def _rollup(conn):
+    filas = conn.execute(text("""
+        SELECT fecha, materiaid, maestroid, estado, cnt FROM asistencias_diarias WHERE cnt > 0
+    """)).fetchall()
+    return {tuple(f[:4]): f[4] for f in filas}
+
+
+def _recuento(conn):
+    filas = conn.execute(text("""
+        SELECT fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, ''), COUNT(*)
+        FROM asistencias WHERE fecha IS NOT NULL
+        GROUP BY fecha, COALESCE(materiaid, 0), COALESCE(maestroid, 0), COALESCE(estado, '')
+    """)).fetchall()
+    return {tuple(f[:4]): f[4] for f in filas}
+
+
+def test_triggers_coinciden_con_el_recuento(conn, clase):
+    a, b, c = clase["alumnos"]
+    mid, ma = clase["materiaid"], clase["maestroid"]
+    hoy = datetime.date(2025, 3, 3)
+    insertar = text("""
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        VALUES (:a, :ma, :mid, :f, :e)
+    """)
+    conn.execute(insertar, {"a": a, "ma": ma, "mid": mid, "f": hoy, "e": "Presente"})
+    conn.execute(insertar, {"a": b, "ma": ma, "mid": mid, "f": hoy, "e": "Ausente"})
+    # fila con materia y maestro NULL: el rollup las agrupa como 0
+    conn.execute(insertar, {"a": c, "ma": None, "mid": None, "f": hoy, "e": "Retardo"})
+    conn.commit()
+    assert _rollup(conn) == _recuento(conn)
+
+    # cambio de estado, de fecha y de materia
+    conn.execute(text("UPDATE asistencias SET estado = 'Retardo' WHERE matricula = :a AND materiaid = :mid"), {"a": b, "mid": mid})
+    conn.execute(text("UPDATE asistencias SET fecha = :f WHERE matricula = :a AND materiaid = :mid"),
+                 {"a": a, "mid": mid, "f": hoy + datetime.timedelta(days=1)})
+    conn.execute(text("UPDATE asistencias SET materiaid = :mid, maestroid = :ma WHERE matricula = :a AND materiaid IS NULL"),
+                 {"a": c, "mid": mid, "ma": ma})
+    conn.commit()
+    assert _rollup(conn) == _recuento(conn)
+
+    # escritura por lotes (un INSERT ... ON CONFLICT de varias filas)
+    consultas.guardar_lista(conn, mid, ma, hoy, {a: "Ausente", b: "Presente", c: "Presente"})
+    assert _rollup(conn) == _recuento(conn)
+
+    conn.execute(text("DELETE FROM asistencias WHERE matricula = :a"), {"a": b})
+    conn.commit()
+    assert _rollup(conn) == _recuento(conn)
+
+
+def test_reconstruir_deja_el_mismo_rollup(conn, clase):
+    conn.execute(text("""
+        INSERT INTO asistencias (matricula, maestroid, materiaid, fecha, estado)
+        VALUES (:a, :ma, :mid, '2025-04-01', 'Presente')
+    """), {"a": clase["alumnos"][0], "ma": clase["maestroid"], "mid": clase["materiaid"]})
+    conn.commit()
+    antes = _rollup(conn)
+    rollups.reconstruir()
+    assert _rollup(conn) == antes == _recuento(conn)
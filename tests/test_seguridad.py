@@ -0,0 +1,53 @@
+from sqlalchemy import text
+
+import seguridad
+from conftest import nuevo_id
+
+
+def _usuario(conn, password="correcta"):
+    nombre = f"u{nuevo_id()}"
+    conn.execute(text("INSERT INTO usuarios (nombreusuario, contrasena, rol) VALUES (:u, :p, 'alumno')"),
+                 {"u": nombre, "p": seguridad.hash_password(password)})
+    conn.commit()
+    return nombre
+
+
+def test_ip_solo_cuenta_fallos(conn, monkeypatch):
+    monkeypatch.setattr(seguridad, "fallos_ip", seguridad.LimiteIntentos(3, 60))
+    nombre = _usuario(conn)
+    # todo un grupo detrás del mismo NAT entra sin bloquearse
+    for _ in range(10):
+        assert seguridad.autenticar(conn, nombre, "correcta", ip="10.0.0.1")[0] == seguridad.OK
+    for _ in range(3):
+        assert seguridad.autenticar(conn, "nadie", "x", ip="10.0.0.1")[0] == seguridad.CREDENCIALES
+    assert seguridad.autenticar(conn, nombre, "correcta", ip="10.0.0.1")[0] == seguridad.BLOQUEADO
+
+
+def test_fallos_de_otra_ip_no_bloquean_la_cuenta(conn, monkeypatch):
+    monkeypatch.setattr(seguridad, "fallos_usuario", seguridad.LimiteIntentos(2, 300))
+    nombre = _usuario(conn)
+    for _ in range(2):
+        assert seguridad.autenticar(conn, nombre, "mala", ip="203.0.113.9")[0] == seguridad.CREDENCIALES
+    assert seguridad.autenticar(conn, nombre, "correcta", ip="203.0.113.9")[0] == seguridad.BLOQUEADO
+    assert seguridad.autenticar(conn, nombre, "correcta", ip="10.0.0.2")[0] == seguridad.OK
+
+
+
+def test_fallos_repartidos_entre_ips_bloquean_la_cuenta(conn, monkeypatch):
+    monkeypatch.setattr(seguridad, "fallos_usuario", seguridad.LimiteIntentos(2, 300))
+    monkeypatch.setattr(seguridad, "fallos_cuenta", seguridad.LimiteIntentos(6, 900))
+    nombre, otro = _usuario(conn), _usuario(conn)
+    # una sola falla por IP: ningún límite por (usuario, IP) ni por IP se alcanza
+    for i in range(6):
+        assert seguridad.autenticar(conn, nombre, "mala", ip=f"198.51.100.{i}")[0] == seguridad.CREDENCIALES
+    estado, _, espera = seguridad.autenticar(conn, nombre, "correcta", ip="10.0.0.3")
+    assert estado == seguridad.BLOQUEADO and espera > 0
+    # las demás cuentas siguen entrando desde esas mismas IPs
+    assert seguridad.autenticar(conn, otro, "correcta", ip="198.51.100.0")[0] == seguridad.OK
+
+def test_ip_de_solicitud_usa_el_salto_del_proxy():
+    reenviada = "1.2.3.4, 198.51.100.7"     # el primero lo inventó el cliente
+    assert seguridad.ip_de_solicitud("10.0.0.1", reenviada, proxies=0) == "10.0.0.1"
+    assert seguridad.ip_de_solicitud("10.0.0.1", reenviada, proxies=1) == "198.51.100.7"
+    assert seguridad.ip_de_solicitud("10.0.0.1", reenviada, proxies=2) == "1.2.3.4"
+    assert seguridad.ip_de_solicitud("10.0.0.1", reenviada, proxies=3) == "10.0.0.1"
@@ -0,0 +1,130 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import struct
+import threading
+import time
+
+from sqlalchemy import text
+
+from db_conexion import get_engine
+
+# =========================
+# TOKENS QR FIRMADOS (sin lectura a la BD)
+# =========================
+# El QR lleva materiaid, maestroid, emisión, expiración, flags y un id de
+# sesión, firmado con HMAC-SHA256. Validar un escaneo es solo recalcular la
+# firma. En la BD (qr_revocados) solo se guardan los single-use consumidos y
+# las sesiones revocadas, con su expiración para poder purgarlos.
+PREFIJO = "f1."
+_FORMATO = ">IIIIB4s"    # materiaid, maestroid, emitido, expira, flags, sesion
+_LARGO_MAC = 16
+_FLAG_SINGLE_USE = 1
+
+log = logging.getLogger("tokens_firmados")
+
+# QR_SECRET debe ser el mismo en todos los procesos (workers de Streamlit,
+# checkin_api). Sin él cada proceso tendría su propia clave aleatoria y un QR
+# firmado en uno saldría INVALIDO en otro: la app solo ofrece el QR clásico.
+CONFIGURADO = bool(os.environ.get("QR_SECRET"))
+if not CONFIGURADO:
+    log.warning("QR_SECRET no está definido: los QR rotativos firmados quedan desactivados (solo tokens clásicos).")
+CLAVE = os.environ.get("QR_SECRET", "").encode("utf-8") or secrets.token_bytes(32)
+# cada cuánto se recarga la lista de sesiones revocadas
+REFRESCO_REVOCADOS = int(os.environ.get("QR_REVOCADOS_REFRESCO", "15"))
+
+
+def _b64(datos):
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode("ascii")
+
+
+def _unb64(texto):
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _mac(cuerpo):
+    return hmac.new(CLAVE, cuerpo, hashlib.sha256).digest()[:_LARGO_MAC]
+
+
+def es_firmado(token):
+    return bool(token) and token.startswith(PREFIJO)
+
+
+def nueva_sesion():
+    return secrets.token_hex(4)
+
+
+def firmar(materiaid, maestroid, vigencia_seg, single_use=False, sesion=None, ahora=None):
+    ahora = int(ahora if ahora is not None else time.time())
+    sesion = bytes.fromhex(sesion) if sesion else secrets.token_bytes(4)
+    cuerpo = struct.pack(_FORMATO, int(materiaid), int(maestroid), ahora, ahora + int(vigencia_seg),
+                         _FLAG_SINGLE_USE if single_use else 0, sesion)
+    return PREFIJO + _b64(cuerpo + _mac(cuerpo))
+
+
+def verificar(token, ahora=None):
+    # dict con el contenido del token, o None si está mal formado o la firma no cuadra
+    if not es_firmado(token):
+        return None
+    try:
+        crudo = _unb64(token[len(PREFIJO):])
+    except (ValueError, TypeError):
+        return None
+    if len(crudo) != struct.calcsize(_FORMATO) + _LARGO_MAC:
+        return None
+    cuerpo, mac = crudo[:-_LARGO_MAC], crudo[-_LARGO_MAC:]
+    if not hmac.compare_digest(mac, _mac(cuerpo)):
+        return None
+    materiaid, maestroid, emitido, expira, flags, sesion = struct.unpack(_FORMATO, cuerpo)
+    ahora = ahora if ahora is not None else time.time()
+    return {
+        "materiaid": materiaid,
+        "maestroid": maestroid,
+        "emitido": emitido,
+        "expira": expira,
+        "expirado": expira <= ahora,
+        "single_use": bool(flags & _FLAG_SINGLE_USE),
+        "sesion": sesion.hex(),
+        "huella": mac.hex(),
+    }
+
+
+# =========================
+# SESIONES REVOCADAS (denylist compacta)
+# =========================
+_revocadas = set()
+_revocadas_cargadas = 0.0
+_revocadas_lock = threading.Lock()
+
+
+def _recargar_revocadas():
+    global _revocadas, _revocadas_cargadas
+    with get_engine().connect() as conn:
+        # expira se guarda en UTC sin zona: se compara contra utcnow(), no contra
+        # el reloj de la sesión de la base
+        filas = conn.execute(text("SELECT huella FROM qr_revocados WHERE huella LIKE 's:%' AND expira > :ahora"),
+                             {"ahora": datetime.datetime.utcnow()}).fetchall()
+    _revocadas = {f[0][2:] for f in filas}
+    _revocadas_cargadas = time.monotonic()
+
+
+def sesion_revocada(sesion):
+    if time.monotonic() - _revocadas_cargadas > REFRESCO_REVOCADOS:
+        with _revocadas_lock:
+            if time.monotonic() - _revocadas_cargadas > REFRESCO_REVOCADOS:
+                _recargar_revocadas()
+    return sesion in _revocadas
+
+
+def revocar_sesion(conn, sesion, materiaid, expira):
+    # expira: datetime UTC a partir del cual la fila ya no hace falta
+    conn.execute(text("""
+        INSERT INTO qr_revocados (huella, materiaid, expira) VALUES (:h, :mid, :exp)
+        ON CONFLICT (huella) DO NOTHING
+    """), {"h": "s:" + sesion, "mid": int(materiaid), "exp": expira})
+    conn.commit()
+    _revocadas.add(sesion)